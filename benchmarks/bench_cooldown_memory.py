@@ -0,0 +1,70 @@
+"""Bytes per tracked cooldown: legacy dict-of-dicts vs CooldownStore.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cooldown_memory [--users 100000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from cooldown_store import COMMANDS, CooldownStore
+
+
+def _sample(users: int, seed: int):
+    rng = random.Random(seed)
+    channels = [rng.randrange(10**17, 10**18) for _ in range(200)]
+    now = time.time()
+    for _ in range(users):
+        user_id = rng.randrange(10**17, 10**18)
+        for command in rng.sample(COMMANDS, rng.randint(1, len(COMMANDS))):
+            yield user_id, command, now + rng.uniform(0, 7 * 86400), rng.choice(channels)
+
+
+def _measure(build, rows):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    container = build(rows)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return container, after - before
+
+
+def build_legacy(rows):
+    cooldowns = {}
+    for user_id, command, expires_at, channel_id in rows:
+        cooldowns.setdefault(user_id, {})[command] = {
+            "expires_at": expires_at,
+            "channel_id": channel_id,
+            "notified": False,
+        }
+    return cooldowns
+
+
+def build_store(rows):
+    store = CooldownStore()
+    for user_id, command, expires_at, channel_id in rows:
+        store.set(user_id, command, expires_at, channel_id)
+    store.take_dirty()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Materialise the input first so its own allocations are not counted.
+    rows = list(_sample(args.users, args.seed))
+    print(f"{args.users} users, {len(rows)} tracked cooldowns")
+
+    for label, build in (("dict-of-dicts", build_legacy), ("CooldownStore", build_store)):
+        container, used = _measure(build, rows)
+        print(f"{label:>14}: {used / len(rows):8.1f} bytes/cooldown ({used / 1024 / 1024:.1f} MiB)")
+        del container
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Startup time: cooldowns-table load vs journal snapshot + log replay.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cooldown_startup [--records 1000000] [--tail 0.1]
+
+The table path mirrors ``load_cooldowns`` in bot.py: one SELECT over the
+cooldowns table, a dict per row, then ``CooldownStore.load``. The journal path
+replays a snapshot of ``--records`` entries plus a log tail of
+``--tail * records`` set/clear/notify records into ``CooldownStore.load_entries``.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from cooldown_journal import CooldownJournal
+from cooldown_store import COMMANDS, CooldownStore
+from sqlite_connections import SQLiteConnectionManager
+
+
+def _sample(records: int, seed: int):
+    rng = random.Random(seed)
+    channels = [rng.randrange(10**17, 10**18) for _ in range(200)]
+    guilds = [rng.randrange(10**17, 10**18) for _ in range(20)]
+    now = time.time()
+    seen = set()
+    while len(seen) < records:
+        key = (rng.randrange(10**17, 10**18), rng.randrange(len(COMMANDS)))
+        if key in seen:
+            continue
+        seen.add(key)
+        yield key + (now + rng.uniform(0, 7 * 86400), rng.choice(channels), rng.choice(guilds), False)
+
+
+def _build_table(path, entries):
+    connections = SQLiteConnectionManager(path)
+    conn = connections.connect()
+    with conn:
+        conn.execute(
+            """
+            CREATE TABLE cooldowns (
+                user_id INTEGER NOT NULL,
+                command TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                channel_id INTEGER,
+                notified INTEGER NOT NULL DEFAULT 0,
+                guild_id INTEGER,
+                PRIMARY KEY (user_id, command)
+            )
+            """
+        )
+        conn.executemany(
+            "INSERT INTO cooldowns (user_id, command, expires_at, channel_id, guild_id, notified) VALUES (?, ?, ?, ?, ?, ?)",
+            ((u, COMMANDS[c], e, ch, g, 1 if n else 0) for u, c, e, ch, g, n in entries),
+        )
+    connections.close_all()
+
+
+def _build_journal(path, entries, tail: int, seed: int):
+    rng = random.Random(seed)
+    journal = CooldownJournal(path)
+    journal.write_snapshot(entries)
+    store = CooldownStore()
+    store.load_entries(entries)
+    store.journal = journal
+    keys = [(u, COMMANDS[c]) for u, c, *_ in entries]
+    for _ in range(tail):
+        user_id, command = rng.choice(keys)
+        roll = rng.random()
+        if roll < 0.6:
+            store.set(user_id, command, time.time() + rng.uniform(0, 86400), 1, 2)
+        elif roll < 0.9:
+            store.mark_notified(user_id, command)
+        else:
+            store.remove(user_id, command)
+    journal.write(journal.take_pending())
+    journal.close()
+
+
+def load_from_table(path):
+    connections = SQLiteConnectionManager(path)
+    rows = connections.connect().execute(
+        """
+        SELECT CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id,
+               CAST(guild_id AS TEXT) AS guild_id, notified
+        FROM cooldowns
+        """
+    ).fetchall()
+    store = CooldownStore()
+    store.load(
+        {
+            "user_id": int(row["user_id"]),
+            "command": str(row["command"]),
+            "expires_at": float(row["expires_at"]),
+            "channel_id": int(row["channel_id"]) if row["channel_id"] is not None else None,
+            "guild_id": int(row["guild_id"]) if row["guild_id"] is not None else None,
+            "notified": bool(row["notified"]),
+        }
+        for row in rows
+    )
+    connections.close_all()
+    return store
+
+
+def load_from_journal(path):
+    store = CooldownStore()
+    store.load_entries(CooldownJournal(path).replay())
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=float, default=0.1, help="log tail size as a fraction of --records")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    entries = list(_sample(args.records, args.seed))
+    tail = int(args.records * args.tail)
+    with tempfile.TemporaryDirectory() as tmp:
+        table_path = os.path.join(tmp, "cooldowns.sqlite3")
+        journal_path = os.path.join(tmp, "cooldowns.journal")
+        _build_table(table_path, entries)
+        _build_journal(journal_path, entries, tail, args.seed)
+        print(f"{args.records} cooldowns, {tail} journal tail records")
+        print(
+            f"  table: {os.path.getsize(table_path) / 1024 / 1024:.1f} MiB, "
+            f"snapshot: {os.path.getsize(journal_path + '.snap') / 1024 / 1024:.1f} MiB, "
+            f"log: {os.path.getsize(journal_path + '.log') / 1024 / 1024:.1f} MiB"
+        )
+
+        results = {}
+        for label, load, path in (
+            ("load_cooldowns", load_from_table, table_path),
+            ("journal replay", load_from_journal, journal_path),
+        ):
+            started = time.perf_counter()
+            store = load(path)
+            results[label] = (time.perf_counter() - started, len(store))
+            del store
+
+        for label, (elapsed, count) in results.items():
+            print(f"{label:>15}: {elapsed:7.2f} s ({count} cooldowns loaded)")
+
+
+if __name__ == "__main__":
+    main()
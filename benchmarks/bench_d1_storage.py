@@ -0,0 +1,192 @@
+"""Storage-layer throughput and latency against a local fake D1 server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_d1_storage [--ops 2000] [--handlers 32] [--latency-ms 30] [--error-rate 0]
+
+Concurrent handlers push a mix of ``storage.upsert_cooldowns`` writes (what
+``save_cooldown_entries`` in bot.py runs) and ``storage.guild_cooldowns``
+reads through ``DatabaseExecutor``, the way the bot's event handlers do. The
+schema is created by ``StorageBackend.migrate``. Each mode wires the storage
+backend and executor to ``benchmarks.fake_d1`` the way bot.py does for that
+configuration:
+
+- ``direct``: ``D1Storage``, one D1 request per write
+- ``direct+group``: the same with writer group commit
+  (``DB_WRITE_BATCH_WINDOW_MS`` / ``DB_WRITE_BATCH_MAX``)
+- ``replica``: ``SQLiteStorage`` over a local SQLite replica, writes
+  forwarded by ``D1WriteThrough``
+
+Reported latency is per storage call as seen by the handler; ``requests`` is
+the number of HTTP requests the fake server answered.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_d1 import FakeD1Server
+from d1_client import CircuitBreaker, D1Client, RetryPolicy
+from d1_replica import D1ReplicaConnection, D1WriteThrough
+from db_executor import DatabaseExecutor
+from metrics import Histogram
+from sqlite_connections import SQLiteConnectionManager
+from storage import D1Storage, SQLiteStorage
+
+COMMANDS = ("mission", "report", "tower", "daily", "weekly", "challenge")
+
+
+def _workload(ops: int, write_ratio: float, seed: int):
+    rng = random.Random(seed)
+    users = [rng.randrange(10**17, 10**18) for _ in range(max(1, ops // 4))]
+    guilds = [rng.randrange(10**17, 10**18) for _ in range(10)]
+    now = time.time()
+    for _ in range(ops):
+        if rng.random() < write_ratio:
+            yield "write", {
+                "user_id": rng.choice(users),
+                "command": rng.choice(COMMANDS),
+                "expires_at": now + rng.uniform(60, 86400),
+                "channel_id": 1,
+                "guild_id": rng.choice(guilds),
+                "notified": False,
+            }
+        else:
+            yield "read", rng.choice(guilds)
+
+
+async def _drive(db, storage, operations, handlers: int):
+    latencies = {"write": Histogram(), "read": Histogram()}
+    errors = 0
+    queue = asyncio.Queue()
+    for operation in operations:
+        queue.put_nowait(operation)
+
+    async def handler():
+        nonlocal errors
+        while not queue.empty():
+            kind, arg = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                if kind == "write":
+                    await db.write(storage.upsert_cooldowns, [arg])
+                else:
+                    await db.read(storage.guild_cooldowns, arg)
+            except Exception:
+                errors += 1
+            latencies[kind].observe(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(handlers)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def _client(server, retry_attempts: int):
+    return D1Client(
+        "bench",
+        "bench",
+        "bench",
+        base_url=server.base_url,
+        retry=RetryPolicy(attempts=retry_attempts, base_delay=0.05, max_delay=0.5),
+        breaker=CircuitBreaker(failure_threshold=10**9),
+    )
+
+
+def run_mode(mode: str, args, tmp: str):
+    server = FakeD1Server(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    server.start()
+    client = _client(server, args.retry_attempts)
+    d1_storage = D1Storage(client)
+    write_through = None
+    replica = None
+    batch_window = 0.0
+    max_batch = 1
+
+    # Schema setup is not part of the measurement, so no injected errors.
+    server.error_rate = 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        d1_storage.migrate()
+    server.error_rate = args.error_rate
+
+    if mode == "replica":
+        replica = SQLiteConnectionManager(os.path.join(tmp, f"{mode}.sqlite3"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            SQLiteStorage(replica.connect).migrate()
+        write_through = D1WriteThrough(
+            client,
+            os.path.join(tmp, f"{mode}.spool.sqlite3"),
+            retry=RetryPolicy(base_delay=0.05, max_delay=0.5),
+            batch_window=args.batch_window_ms / 1000,
+        )
+
+        storage = SQLiteStorage(lambda: D1ReplicaConnection(replica.connect(), write_through))
+        readers = 2
+    else:
+        storage = d1_storage
+        readers = args.readers
+        if mode == "direct+group":
+            batch_window = args.batch_window_ms / 1000
+            max_batch = args.batch_max
+
+    db = DatabaseExecutor(storage.connect, readers=readers, max_pending=1024, batch_window=batch_window, max_batch=max_batch)
+    db.start()
+    operations = list(_workload(args.ops, args.write_ratio, args.seed))
+    elapsed, latencies, errors = asyncio.run(_drive(db, storage, operations, args.handlers))
+    db.close()
+
+    drain = 0.0
+    if write_through is not None:
+        drain_started = time.perf_counter()
+        write_through.close()
+        drain = time.perf_counter() - drain_started
+        replica.close_all()
+    requests = server.requests
+    client.close()
+    server.stop()
+    return elapsed, drain, latencies, errors, requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--handlers", type=int, default=32, help="concurrent handler coroutines")
+    parser.add_argument("--write-ratio", type=float, default=0.7)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="fake D1 round-trip time")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with HTTP 503")
+    parser.add_argument("--retry-attempts", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    parser.add_argument("--batch-max", type=int, default=64)
+    parser.add_argument("--modes", default="direct,direct+group,replica")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(
+        f"{args.ops} operations ({args.write_ratio:.0%} writes) from {args.handlers} handlers, "
+        f"fake D1 latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, error rate {args.error_rate:.1%}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(","):
+            elapsed, drain, latencies, errors, requests = run_mode(mode, args, tmp)
+            write, read = latencies["write"].snapshot(), latencies["read"].snapshot()
+            print(
+                f"{mode:>13}: {args.ops / elapsed:8.0f} ops/s  "
+                f"write p50/p99 {write['p50'] * 1000:5.0f}/{write['p99'] * 1000:5.0f} ms  "
+                f"read p50/p99 {read['p50'] * 1000:5.0f}/{read['p99'] * 1000:5.0f} ms  "
+                f"requests {requests:6d}  errors {errors}"
+                + (f"  (D1 caught up {drain:.2f} s after)" if drain else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Reminder lag at scale: expires_at to completed send, checked against an SLO.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_notification_lag [--active 50000] [--due 500] [--duration 30] [--slo-ms 2000]
+
+A ``CooldownStore`` is filled with ``--active`` cooldowns, ``--due`` of which
+expire during the next ``--duration`` seconds; the rest expire hours later.
+The default rate (about 17 expiries/s) is what 50k cooldowns on roughly
+hourly cycles produce, and well inside Discord's global request limit.
+The store, ``ExpiryScheduler``, ``NotificationOutbox`` and
+``NotificationDispatcher`` are wired the way bot.py wires them, with a fake
+channel send of ``--send-latency-ms``, and lag is recorded under the same
+``notify.*`` metric names the bot reports in ``n cd notify``. The run passes
+if p99 lag for ``--slo-command`` stays under ``--slo-ms`` (percentiles are
+bucketed, so a pass means the bucket holding p99 ends at or below the SLO).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from cooldown_store import COMMANDS, CooldownStore
+from expiry_scheduler import ExpiryScheduler
+from metrics import COUNT_BUCKETS, LAG_BUCKETS, MetricsRegistry
+from notification_dispatch import NotificationDispatcher
+from notification_outbox import NotificationOutbox
+
+
+async def run(args, path):
+    rng = random.Random(args.seed)
+    metrics = MetricsRegistry()
+    store = CooldownStore()
+    outbox = NotificationOutbox(path)
+
+    async def send(channel_id, content):
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.send_latency_ms / 1000)
+
+    def render(channel_id, items):
+        return [("\n".join(f"<@{user_id}> {cmd}" for _, user_id, cmd, _ in items), items)]
+
+    async def delivered(channel_id, items):
+        await outbox.ack(item[0] for item in items)
+        now = time.time()
+        for _, _, cmd, expires_at in items:
+            metrics.histogram("notify.lag", LAG_BUCKETS).observe(now - expires_at)
+            metrics.histogram(f"notify.lag.{cmd}", LAG_BUCKETS).observe(now - expires_at)
+        metrics.counter("notify.delivered").inc(len(items))
+
+    async def failed(channel_id, items, error):
+        await outbox.fail(item[0] for item in items)
+
+    dispatcher = NotificationDispatcher(
+        send,
+        render,
+        workers=args.workers,
+        coalesce_window=args.coalesce_ms / 1000,
+        on_delivered=delivered,
+        on_failed=failed,
+        metrics=metrics,
+    )
+
+    def dispatch(rows):
+        metrics.histogram("notify.queue_depth", COUNT_BUCKETS).observe(outbox.pending)
+        for row in rows:
+            dispatcher.submit(row["channel_id"], (row["id"], row["user_id"], row["command"], row["expires_at"]))
+
+    async def check_expired(now):
+        due = [(user_id, cmd, data) for user_id, cmd, data in store.pop_expired(now) if not data.notified]
+        await outbox.enqueue((data.channel_id, user_id, cmd, data.expires_at) for user_id, cmd, data in due)
+        for user_id, cmd, data in due:
+            if store.get(user_id, cmd) is data:
+                store.mark_notified(user_id, cmd)
+        store.purge_expired(now - 3600)
+
+    scheduler = ExpiryScheduler(store.next_expiry, check_expired)
+    store.on_expiry_scheduled = scheduler.reschedule
+
+    channels = [rng.randrange(10**17, 10**18) for _ in range(args.channels)]
+    start = time.time() + 1.0
+    for index in range(args.active):
+        if index < args.due:
+            expires_at = start + rng.uniform(0, args.duration)
+        else:
+            expires_at = start + rng.uniform(3600, 86400)
+        store.set(rng.randrange(10**17, 10**18), rng.choice(COMMANDS), expires_at, rng.choice(channels))
+
+    dispatcher.start()
+    outbox.start(dispatch)
+    scheduler.start()
+    deadline = start + args.duration + 30
+    while metrics.counter("notify.delivered").value < args.due and time.time() < deadline:
+        await asyncio.sleep(0.1)
+    scheduler.stop()
+    dispatcher.stop()
+    outbox.close()
+    return metrics.snapshot("notify.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--active", type=int, default=50000, help="cooldowns in the store")
+    parser.add_argument("--due", type=int, default=500, help="cooldowns expiring during the run")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds over which --due cooldowns expire")
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--coalesce-ms", type=float, default=250.0)
+    parser.add_argument("--send-latency-ms", type=float, default=80.0, help="fake channel.send() round trip")
+    parser.add_argument("--slo-command", default="mission", choices=COMMANDS)
+    parser.add_argument("--slo-ms", type=float, default=2000.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        snapshot = asyncio.run(run(args, os.path.join(tmp, "outbox.sqlite3")))
+    histograms, counters = snapshot["histograms"], snapshot["counters"]
+
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}"
+
+    print(
+        f"{args.due} of {args.active} cooldowns expiring over {args.duration:.0f} s in {args.channels} channels, "
+        f"{args.workers} workers, send {args.send_latency_ms:.0f} ms"
+    )
+    for name in ["notify.lag"] + [f"notify.lag.{cmd}" for cmd in COMMANDS]:
+        lag = histograms.get(name)
+        if lag:
+            print(f"  {name:<22} n={lag['count']:6d}  p50/p99/max {ms(lag['p50'])}/{ms(lag['p99'])}/{ms(lag['max'])} ms")
+    sends = {kind: counters.get(f"notify.sends.{kind}", 0) for kind in ("ok", "failed", "rate_limited")}
+    print(
+        f"  sends ok {sends['ok']}  failed {sends['failed']}  rate limited {sends['rate_limited']}  "
+        f"send p99 {ms(histograms['notify.send.latency']['p99'])} ms  "
+        f"queue depth p99 {histograms['notify.queue_depth']['p99']}"
+    )
+    target = histograms.get(f"notify.lag.{args.slo_command}") or {}
+    p99 = target.get("p99")
+    passed = p99 is not None and p99 * 1000 <= args.slo_ms and counters.get("notify.delivered", 0) >= args.due
+    print(f"  SLO p99 {args.slo_command} lag <= {args.slo_ms:.0f} ms: {'PASS' if passed else 'FAIL'}")
+
+
+if __name__ == "__main__":
+    main()
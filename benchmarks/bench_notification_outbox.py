@@ -0,0 +1,136 @@
+"""Notification outbox throughput: durable enqueue, then drain through the dispatcher.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_notification_outbox [--notifications 20000] [--channels 200] [--failure-rate 0.05]
+
+Expired reminders are written to a fresh ``NotificationOutbox`` in batches the
+size ``check_expired_cooldowns`` produces when many cooldowns share a deadline,
+then drained through ``NotificationDispatcher`` into a fake channel send that
+takes ``--send-latency-ms`` and fails ``--failure-rate`` of the time. Outcomes
+are settled the way bot.py does it: delivered rows are acked, failed ones are
+retried with the outbox backoff. ``lag`` is the time from the start of the
+drain until a notification's row is acked; dispatcher log lines are muted.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from d1_client import RetryPolicy
+from metrics import Histogram
+from notification_dispatch import NotificationDispatcher
+from notification_outbox import NotificationOutbox
+
+COMMANDS = ("mission", "report", "tower", "daily", "weekly", "challenge")
+
+
+async def run(args, path):
+    rng = random.Random(args.seed)
+    outbox = NotificationOutbox(
+        path,
+        retry=RetryPolicy(base_delay=0.05, max_delay=0.5),
+        batch_size=args.drain_batch,
+        max_attempts=100,
+        max_in_flight=args.max_in_flight,
+    )
+    outstanding = set()
+    drain_started = 0.0
+    lag = Histogram()
+    stats = {"messages": 0, "failures": 0}
+    done = asyncio.Event()
+
+    async def send(channel_id, content):
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.send_latency_ms / 1000)
+        if rng.random() < args.failure_rate:
+            stats["failures"] += 1
+            raise RuntimeError("injected failure")
+        stats["messages"] += 1
+
+    def render(channel_id, items):
+        return [("\n".join(f"<@{user_id}> {cmd}" for _, user_id, cmd in items), items)]
+
+    async def delivered(channel_id, items):
+        ids = [item[0] for item in items]
+        await outbox.ack(ids)
+        elapsed = time.perf_counter() - drain_started
+        for row_id in ids:
+            outstanding.discard(row_id)
+            lag.observe(elapsed)
+        if not outstanding:
+            done.set()
+
+    async def failed(channel_id, items, error):
+        await outbox.fail(item[0] for item in items)
+
+    dispatcher = NotificationDispatcher(
+        send,
+        render,
+        workers=args.workers,
+        coalesce_window=args.coalesce_ms / 1000,
+        channel_rate=10**9,
+        on_delivered=delivered,
+        on_failed=failed,
+    )
+
+    def dispatch(rows):
+        for row in rows:
+            dispatcher.submit(row["channel_id"], (row["id"], row["user_id"], row["command"]))
+
+    now = time.time()
+    notifications = [
+        (rng.randrange(args.channels) + 1, user_id, rng.choice(COMMANDS), now + user_id)
+        for user_id in range(args.notifications)
+    ]
+    started = time.perf_counter()
+    for index in range(0, len(notifications), args.enqueue_batch):
+        outstanding.update(await outbox.enqueue(notifications[index:index + args.enqueue_batch]))
+    enqueue_elapsed = time.perf_counter() - started
+
+    drain_started = time.perf_counter()
+    dispatcher.start()
+    outbox.start(dispatch)
+    await done.wait()
+    drain_elapsed = time.perf_counter() - drain_started
+    dispatcher.stop()
+    outbox.close()
+    return enqueue_elapsed, drain_elapsed, lag.snapshot(), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notifications", type=int, default=20000)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--enqueue-batch", type=int, default=100, help="rows per enqueue() call")
+    parser.add_argument("--drain-batch", type=int, default=100, help="rows claimed per outbox drain step")
+    parser.add_argument("--max-in-flight", type=int, default=2000, help="claimed rows awaiting an outcome")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--coalesce-ms", type=float, default=250.0)
+    parser.add_argument("--send-latency-ms", type=float, default=50.0, help="fake channel.send() round trip")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        enqueue_elapsed, drain_elapsed, lag, stats = asyncio.run(
+            run(args, os.path.join(tmp, "outbox.sqlite3"))
+        )
+    n = args.notifications
+    print(
+        f"{n} notifications over {args.channels} channels, {args.workers} workers, "
+        f"send {args.send_latency_ms:.0f} ms, failure rate {args.failure_rate:.1%}"
+    )
+    print(f"  enqueue: {n / enqueue_elapsed:10.0f} rows/s  ({args.enqueue_batch} per call)")
+    print(
+        f"  drain:   {n / drain_elapsed:10.0f} notifications/s  "
+        f"{stats['messages']} messages, {stats['failures']} failed sends retried"
+    )
+    print(f"  lag p50/p99: {lag['p50'] * 1000:.0f}/{lag['p99'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""StorageBackend contract check and per-operation benchmark.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_storage [--ops 2000] [--cooldowns 10000] [--d1-latency-ms 0]
+
+Every backend (``MemoryStorage``, ``SQLiteStorage`` on a temporary file and
+``D1Storage`` against ``benchmarks.fake_d1``) first has to pass
+:func:`check_contract`, which pins down the behaviour bot.py relies on. Each
+operation is then timed on its own over ``--ops`` calls, with writes in their
+own transaction the way ``DatabaseExecutor`` runs them, against a table
+pre-filled with ``--cooldowns`` rows.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fake_d1 import FakeD1Server
+from d1_client import D1Client
+from sqlite_connections import SQLiteConnectionManager
+from storage import D1Storage, MemoryStorage, SQLiteStorage, quiz_question_key
+
+COMMANDS = ("mission", "report", "tower", "daily", "weekly", "challenge")
+# Above 2**53, so a backend that round-trips ids through floats fails the contract.
+BIG_ID = 10**18 + 123
+
+
+def _check(condition, what):
+    if not condition:
+        raise AssertionError(f"storage contract: {what}")
+
+
+def _cooldown(user_id, command, expires_at, guild_id=1, notified=False, channel_id=BIG_ID + 1):
+    return {
+        "user_id": user_id,
+        "command": command,
+        "expires_at": expires_at,
+        "channel_id": channel_id,
+        "guild_id": guild_id,
+        "notified": notified,
+    }
+
+
+def check_contract(storage):
+    """Raise AssertionError unless ``storage`` behaves like the reference SQL backend.
+
+    Expects an empty, migrated backend.
+    """
+    conn = storage.connect()
+    now = 1_700_000_000.0
+
+    _check(storage.load_cooldowns(conn) == [], "starts empty")
+    with conn:
+        storage.upsert_cooldowns(
+            conn,
+            [
+                _cooldown(BIG_ID, "mission", now + 100, guild_id=BIG_ID + 2),
+                _cooldown(BIG_ID, "daily", now - 10, guild_id=BIG_ID + 2),
+                _cooldown(7, "mission", now - 5, guild_id=3, notified=True, channel_id=None),
+            ],
+        )
+    rows = storage.user_cooldowns(conn, BIG_ID)
+    _check([row["command"] for row in rows] == ["daily", "mission"], "user cooldowns sorted by expiry")
+    _check(rows[0] == _cooldown(BIG_ID, "daily", now - 10, guild_id=BIG_ID + 2), "cooldown rows round-trip exactly")
+    _check(storage.user_cooldowns(conn, 8) == [], "unknown user has no cooldowns")
+    _check(len(storage.guild_cooldowns(conn, BIG_ID + 2)) == 2, "guild cooldowns filter by guild")
+    expired = storage.expired_cooldowns(conn, now)
+    _check([(row["user_id"], row["command"]) for row in expired] == [(BIG_ID, "daily")], "expiry scan skips notified rows")
+    _check(storage.expired_cooldowns(conn, now + 1000, limit=1)[0]["command"] == "daily", "expiry scan is oldest first")
+
+    with conn:
+        storage.upsert_cooldowns(conn, [_cooldown(BIG_ID, "mission", now + 200, guild_id=BIG_ID + 2, notified=True)])
+    mission = [row for row in storage.user_cooldowns(conn, BIG_ID) if row["command"] == "mission"]
+    _check(len(mission) == 1 and mission[0]["notified"] and mission[0]["expires_at"] == now + 200, "upsert replaces a key")
+    _check(len(storage.load_cooldowns(conn)) == 3, "upsert does not duplicate keys")
+
+    with conn:
+        storage.delete_cooldowns(conn, [(BIG_ID, "daily"), (404, "mission")])
+    _check(len(storage.load_cooldowns(conn)) == 2, "delete removes listed keys only")
+    with conn:
+        storage.replace_cooldowns(conn, [_cooldown(9, "weekly", now)])
+    _check([row["user_id"] for row in storage.load_cooldowns(conn)] == [9], "replace drops everything else")
+
+    question = "Who is Naruto's favourite Ramen chef?"
+    key = quiz_question_key(question)
+    options = "Teuchi\nAyame\nJiraiya\nIruka"
+    _check(storage.quiz_lookup(conn, key) is None, "missing quiz entry is None")
+    _check(storage.candidate_latest(conn, key) is None, "missing candidate is None")
+    with conn:
+        storage.candidate_store(conn, key, question, options, 0, "Teuchi", "gemini", now)
+    with conn:
+        storage.candidate_store(conn, key, question, options, 0, "Teuchi", "gemini", now + 1)
+    with conn:
+        storage.candidate_store(conn, key, question, options, 1, "Ayame", "openrouter", now + 2)
+    candidates = storage.candidates_for_key(conn, key)
+    _check([c["provider"] for c in candidates] == ["openrouter", "gemini"], "candidates most recent first")
+    _check(candidates[1]["seen_count"] == 2 and candidates[1]["first_seen_at"] == now, "repeat answers bump seen_count")
+    _check(storage.candidate_latest(conn, key)["answer_text"] == "Ayame", "latest candidate")
+    _check(storage.candidate_get(conn, candidates[1]["id"])["answer_index"] == 0, "candidate by id")
+    _check(len(storage.candidates_by_key_prefix(conn, key[:6])) == 2, "candidates by key prefix")
+    groups = storage.candidate_groups(conn, 10)
+    _check(len(groups) == 1 and groups[0]["candidate_count"] == 2, "candidates grouped by question")
+    _check(groups[0]["last_seen_at"] == now + 2, "group carries latest sighting")
+
+    with conn:
+        storage.quiz_store(conn, key, question, options, 0, "Teuchi", "gemini", now + 3)
+    entry = storage.quiz_lookup(conn, key)
+    _check(entry is not None and entry["answer_index"] == 0 and entry["created_at"] == now + 3, "stored quiz entry")
+    _check(storage.candidates_for_key(conn, key) == [], "promotion clears the question's candidates")
+    with conn:
+        storage.quiz_store(conn, key, question, options, 0, "Teuchi", "manual", now + 4)
+    entry = storage.quiz_lookup(conn, key)
+    _check(entry["created_at"] == now + 3 and entry["updated_at"] == now + 4, "re-storing keeps created_at")
+    with conn:
+        storage.quiz_update(conn, key, 1, "Ayame", "manual", now + 5)
+    _check(storage.quiz_lookup(conn, key)["answer_text"] == "Ayame", "quiz update")
+
+    other_key = quiz_question_key("Which village is hidden in the leaves?")
+    with conn:
+        storage.quiz_store(conn, other_key, "Which village is hidden in the leaves?", "Konoha\nSuna", 0, "Konoha", None, now + 6)
+    _check(storage.quiz_count(conn) == 2, "quiz count")
+    _check([row["question_key"] for row in storage.quiz_list(conn, 10)] == [other_key, key], "quiz list newest first")
+    _check([row["question_key"] for row in storage.quiz_list(conn, 1, 1)] == [key], "quiz list paging")
+    _check([row["question_key"] for row in storage.quiz_search(conn, key[:8])] == [key], "quiz search by key prefix")
+    _check([row["question_key"] for row in storage.quiz_search(conn, "RAMEN chef")] == [key], "quiz search by text")
+    _check(storage.quiz_search(conn, "sharingan") == [], "quiz search miss")
+
+    with conn:
+        storage.candidate_store(conn, other_key, "Which village?", "Konoha\nSuna", 1, "Suna", "gemini", now)
+        storage.candidate_store(conn, other_key, "Which village?", "Konoha\nSuna", 0, "Konoha", "openrouter", now)
+    first = storage.candidates_for_key(conn, other_key)[0]
+    with conn:
+        storage.delete_candidate(conn, first["id"])
+    _check(len(storage.candidates_for_key(conn, other_key)) == 1, "delete one candidate")
+    with conn:
+        storage.delete_candidates_for_key(conn, other_key)
+    _check(storage.candidate_groups(conn, 10) == [], "delete a question's candidates")
+    conn.close()
+
+
+def _operations(rng, users, guilds, now):
+    def upsert(storage, conn):
+        with conn:
+            storage.upsert_cooldowns(conn, [_cooldown(rng.choice(users), rng.choice(COMMANDS), now + rng.uniform(-600, 86400), rng.choice(guilds))])
+
+    def candidate(storage, conn):
+        question = f"Question {rng.randrange(500)}?"
+        with conn:
+            storage.candidate_store(conn, quiz_question_key(question), question, "A\nB\nC\nD", rng.randrange(4), "A", "bench", time.time())
+
+    def promote(storage, conn):
+        question = f"Question {rng.randrange(500)}?"
+        with conn:
+            storage.quiz_store(conn, quiz_question_key(question), question, "A\nB\nC\nD", 0, "A", "bench", time.time())
+
+    return {
+        "upsert_cooldowns": upsert,
+        "user_cooldowns": lambda storage, conn: storage.user_cooldowns(conn, rng.choice(users)),
+        "guild_cooldowns": lambda storage, conn: storage.guild_cooldowns(conn, rng.choice(guilds)),
+        "expired_cooldowns": lambda storage, conn: storage.expired_cooldowns(conn, now, limit=100),
+        "candidate_store": candidate,
+        "candidate_latest": lambda storage, conn: storage.candidate_latest(conn, quiz_question_key(f"Question {rng.randrange(500)}?")),
+        "quiz_store": promote,
+        "quiz_lookup": lambda storage, conn: storage.quiz_lookup(conn, quiz_question_key(f"Question {rng.randrange(500)}?")),
+        "quiz_search": lambda storage, conn: storage.quiz_search(conn, f"question {rng.randrange(500)}"),
+    }
+
+
+def benchmark(storage, ops: int, cooldowns: int, seed: int):
+    rng = random.Random(seed)
+    now = time.time()
+    users = [rng.randrange(10**17, 10**18) for _ in range(max(1, cooldowns // 3))]
+    guilds = [rng.randrange(10**17, 10**18) for _ in range(50)]
+    conn = storage.connect()
+    rows = {}
+    while len(rows) < cooldowns:
+        row = _cooldown(rng.choice(users), rng.choice(COMMANDS), now + rng.uniform(-600, 86400), rng.choice(guilds))
+        rows[(row["user_id"], row["command"])] = row
+    rows = list(rows.values())
+    with conn:
+        storage.replace_cooldowns(conn, [])
+    # Chunked so no single D1 request exceeds its body size limit.
+    for start in range(0, len(rows), 500):
+        with conn:
+            storage.upsert_cooldowns(conn, rows[start:start + 500])
+
+    results = {}
+    for name, operation in _operations(rng, users, guilds, now).items():
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(ops):
+            call_started = time.perf_counter()
+            operation(storage, conn)
+            latencies.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        results[name] = (ops / elapsed, latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))])
+    conn.close()
+    return results
+
+
+@contextlib.contextmanager
+def _backends(names, tmp, d1_latency: float):
+    """Yield ``{name: factory}``; each factory returns a fresh, migrated, empty backend."""
+    servers = []
+    clients = []
+    managers = []
+    counter = iter(range(10**6))
+
+    def memory():
+        return MemoryStorage()
+
+    def sqlite():
+        manager = SQLiteConnectionManager(os.path.join(tmp, f"storage-{next(counter)}.sqlite3"))
+        managers.append(manager)
+        storage = SQLiteStorage(manager.connect)
+        with contextlib.redirect_stdout(io.StringIO()):
+            storage.migrate()
+        return storage
+
+    def d1():
+        server = FakeD1Server(latency=d1_latency)
+        server.start()
+        servers.append(server)
+        client = D1Client("bench", "bench", "bench", base_url=server.base_url)
+        clients.append(client)
+        storage = D1Storage(client)
+        with contextlib.redirect_stdout(io.StringIO()):
+            storage.migrate()
+        return storage
+
+    factories = {"memory": memory, "sqlite": sqlite, "d1": d1}
+    try:
+        yield {name: factories[name] for name in names}
+    finally:
+        for client in clients:
+            client.close()
+        for server in servers:
+            server.stop()
+        for manager in managers:
+            manager.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000, help="calls per operation and backend")
+    parser.add_argument("--cooldowns", type=int, default=10_000, help="rows in the cooldowns table while timing")
+    parser.add_argument("--d1-latency-ms", type=float, default=0.0, help="fake D1 round-trip time")
+    parser.add_argument("--backends", default="memory,sqlite,d1")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    names = args.backends.split(",")
+    with tempfile.TemporaryDirectory() as tmp, _backends(names, tmp, args.d1_latency_ms / 1000) as factories:
+        for name, factory in factories.items():
+            check_contract(factory())
+            print(f"{name}: contract ok")
+
+        print(f"\n{args.ops} calls per operation, {args.cooldowns} cooldown rows, fake D1 latency {args.d1_latency_ms:.0f} ms")
+        results = {name: benchmark(factory(), args.ops, args.cooldowns, args.seed) for name, factory in factories.items()}
+        print(f"{'operation':>18}" + "".join(f"{name + ' ops/s':>14}{'p99 ms':>9}" for name in names))
+        for operation in next(iter(results.values())):
+            print(
+                f"{operation:>18}"
+                + "".join(f"{results[name][operation][0]:14.0f}{results[name][operation][1] * 1000:9.3f}" for name in names)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Local stand-in for the Cloudflare D1 ``/query`` endpoint, backed by SQLite.
+
+Run from the repository root and point the bot at it:
+
+    python -m benchmarks.fake_d1 [--db fake_d1.sqlite3] [--port 8787] [--latency-ms 30] [--error-rate 0.01]
+
+    D1_API_BASE_URL=http://127.0.0.1:8787 CLOUDFLARE_ACCOUNT_ID=local \\
+    CLOUDFLARE_D1_DATABASE_ID=local CLOUDFLARE_API_TOKEN=local python bot.py
+
+Single ``{"sql", "params"}`` and ``{"batch": [...]}`` payloads are answered
+in D1's response shape: one ``{"results", "success", "meta"}`` entry per
+statement, with ``meta.changes`` and ``meta.last_row_id``. A batch runs in
+one transaction and is rolled back if any statement fails, which comes back
+as HTTP 400 with ``success: false``. Statements run one at a time, as they
+do on a D1 database.
+
+Every request is delayed by ``latency`` plus up to ``jitter`` seconds, and
+fails before touching the database with probability ``error_rate``
+(HTTP 503) or ``rate_limit_rate`` (HTTP 429).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from aiohttp import web
+
+
+class FakeD1Server:
+    def __init__(
+        self,
+        path: str = ":memory:",
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        api_token: str = None,
+        seed: int = None,
+    ):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.error_rate = float(error_rate)
+        self.rate_limit_rate = float(rate_limit_rate)
+        self.api_token = api_token
+        self.requests = 0
+        self.statements = 0
+        self.injected_errors = 0
+        self._random = random.Random(seed)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        """Value for ``D1_API_BASE_URL`` / ``D1Client(base_url=...)``."""
+        return f"http://{self.host}:{self.port}"
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_post("/accounts/{account_id}/d1/database/{database_id}/query", self._handle)
+        return app
+
+    def _run_statement(self, statement):
+        sql = statement.get("sql") or ""
+        params = statement.get("params") or []
+        started = time.perf_counter()
+        changes_before = self._conn.total_changes
+        cursor = self._conn.execute(sql, params)
+        rows = [dict(row) for row in cursor.fetchall()] if cursor.description else []
+        changes = self._conn.total_changes - changes_before
+        self.statements += 1
+        return {
+            "results": rows,
+            "success": True,
+            "meta": {
+                "changes": changes,
+                "last_row_id": cursor.lastrowid or 0,
+                "changed_db": changes > 0,
+                "rows_read": len(rows),
+                "rows_written": changes,
+                "duration": (time.perf_counter() - started) * 1000,
+            },
+        }
+
+    def execute(self, payload):
+        """Apply one ``/query`` payload and return the ``result`` list."""
+        if "batch" not in payload:
+            return [self._run_statement(payload)]
+        self._conn.execute("BEGIN")
+        try:
+            results = [self._run_statement(statement) for statement in payload["batch"]]
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return results
+
+    async def _handle(self, request):
+        self.requests += 1
+        if self.api_token and request.headers.get("Authorization") != f"Bearer {self.api_token}":
+            return self._error(401, 10000, "Authentication error")
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = self._random.random()
+        if roll < self.error_rate:
+            self.injected_errors += 1
+            return self._error(503, 7500, "Injected D1 failure")
+        if roll < self.error_rate + self.rate_limit_rate:
+            self.injected_errors += 1
+            return self._error(429, 971, "Injected rate limit")
+        try:
+            payload = json.loads(await request.text())
+            result = self.execute(payload)
+        except (ValueError, TypeError, sqlite3.Error) as e:
+            return self._error(400, 7500, f"{type(e).__name__}: {e}")
+        return web.json_response({"result": result, "success": True, "errors": [], "messages": []})
+
+    @staticmethod
+    def _error(status, code, message):
+        return web.json_response(
+            {"result": [], "success": False, "errors": [{"code": code, "message": message}], "messages": []},
+            status=status,
+        )
+
+    async def _start_site(self):
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        """Serve on a background thread and return :attr:`base_url`."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-d1", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_site(), self._loop).result()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+        self._conn.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="fake_d1.sqlite3", help="SQLite file behind the fake database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--token", default=None, help="require this bearer token")
+    args = parser.parse_args()
+
+    server = FakeD1Server(
+        args.db,
+        host=args.host,
+        port=args.port,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        api_token=args.token,
+    )
+    print(f"Fake D1 serving {args.db} at {server.base_url}", flush=True)
+    web.run_app(server._app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,18 @@
 from keep_alive import keep_alive
+from db_executor import DatabaseExecutor
+from sqlite_connections import SQLiteConnectionManager
+from cooldown_store import CooldownRecord, CooldownStore
+from cooldown_journal import CooldownJournal
+from expiry_scheduler import ExpiryScheduler
+from notification_dispatch import NotificationDispatcher
+from notification_outbox import NotificationOutbox
+from user_cache import UserNameCache
+from smart_tracks import PendingTrackRegistry
+from d1_client import CircuitBreaker, D1Client, D1TransientError, RetryPolicy
+from d1_replica import D1ReplicaConnection, D1WriteThrough, resync_replica
+from metrics import COUNT_BUCKETS, LAG_BUCKETS, MetricsRegistry
+from storage import D1Storage, MemoryStorage, SQLiteStorage, quiz_question_key
+from storage import normalize_quiz_text as _normalize_quiz_text
 import asyncio
 import datetime
 import hashlib
@@ -7,9 +21,8 @@ import math
 import os
 import random
 import re
-import sqlite3
 import time
-from typing import Dict, Optional
+from typing import Optional
 from urllib import error as urllib_error
 from urllib import request as urllib_request
 
@@ -30,6 +43,8 @@ ENABLE_GPT = os.getenv("ENABLE_GPT", "false").lower() == "true"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
 SMART_TRACK_WAIT_SECONDS = float(os.getenv("SMART_TRACK_WAIT_SECONDS", "3.5"))
+# Pending smart tracks expire on their own this long after they are armed (the waiter normally clears them sooner).
+SMART_TRACK_TTL_SECONDS = SMART_TRACK_WAIT_SECONDS + 30
 QUIZ_ALLOW_LOCAL_FALLBACK = os.getenv("QUIZ_ALLOW_LOCAL_FALLBACK", "false").lower() == "true"
 QUIZ_DEBUG = os.getenv("QUIZ_DEBUG", "false").lower() == "true"
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
@@ -55,6 +70,9 @@ try:
 except ValueError:
     print("⚠️ Invalid NARUTO_BOTTO_USER_ID value; falling back to name matching.")
 
+# Naruto Botto account IDs learned from name matches, so later messages are gated by ID.
+NARUTO_BOTTO_IDS_PATH = os.getenv("NARUTO_BOTTO_IDS_PATH", "naruto_botto_ids.json").strip()
+
 gemini_client = None
 if GEMINI_API_KEY:
     try:
@@ -74,146 +92,183 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True
 
+class CompanionBot(commands.Bot):
+    notification_delivery_startup = None
+
+    async def setup_hook(self):
+        # Runs once per process before the first gateway connection. on_ready
+        # fires again on every reconnect, so one-time bootstrap belongs here.
+        await load_cooldowns()
+        if not _DATABASE_READY and not retry_database_setup.is_running():
+            retry_database_setup.start()
+        if not flush_dirty_cooldowns.is_running():
+            flush_dirty_cooldowns.start()
+        if not cleanup_stale_challenges.is_running():
+            cleanup_stale_challenges.start()
+        await sync_command_tree()
+        self.notification_delivery_startup = asyncio.get_running_loop().create_task(
+            start_notification_delivery(), name="notification delivery startup"
+        )
+        self.notification_delivery_startup.add_done_callback(_report_task_failure)
+
+    async def close(self):
+        expiry_scheduler.stop()
+        notification_dispatcher.stop()
+        notification_outbox.stop()
+        # Persist buffered cooldown updates before the connection goes away.
+        await flush_cooldowns()
+        await super().close()
+
+
 # MODIFIED LINE BELOW: Added list for prefix and case_insensitive=True
-bot = commands.Bot(command_prefix=["n ", "N "], case_insensitive=True, intents=intents, help_command=None)
+COMMAND_PREFIXES = ("n ", "N ")
+
+bot = CompanionBot(
+    command_prefix=list(COMMAND_PREFIXES),
+    case_insensitive=True,
+    intents=intents,
+    help_command=None,
+    # Sent with every gateway identify, so reconnects keep it without a presence update.
+    activity=discord.Activity(type=discord.ActivityType.watching, name="Naruto Botto cooldowns | n help"),
+)
 
 DB_PATH = "cooldowns.sqlite3"
 LEGACY_JSON_PATH = "cooldowns.json"
 CF_ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID", "").strip()
 CF_D1_DATABASE_ID = os.getenv("CLOUDFLARE_D1_DATABASE_ID", "").strip()
 CF_API_TOKEN = os.getenv("CLOUDFLARE_API_TOKEN", "").strip()
-USE_CLOUDFLARE_D1 = bool(CF_ACCOUNT_ID and CF_D1_DATABASE_ID and CF_API_TOKEN)
-_LOCAL_SQLITE_CONNECT = sqlite3.connect
-
-
-class _QueryResultCursor:
-    def __init__(self, rows=None, rowcount=-1, lastrowid=None):
-        self._rows = list(rows or [])
-        self.rowcount = rowcount
-        self.lastrowid = lastrowid
-
-    def fetchone(self):
-        return self._rows[0] if self._rows else None
-
-    def fetchall(self):
-        return list(self._rows)
-
-
-def _d1_api_request(payload):
-    url = f"https://api.cloudflare.com/client/v4/accounts/{CF_ACCOUNT_ID}/d1/database/{CF_D1_DATABASE_ID}/query"
-    request = urllib_request.Request(
-        url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {CF_API_TOKEN}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
+# "memory" keeps everything in process (nothing persisted); otherwise D1 when configured, else SQLite.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "").strip().lower()
+USE_CLOUDFLARE_D1 = bool(CF_ACCOUNT_ID and CF_D1_DATABASE_ID and CF_API_TOKEN) and STORAGE_BACKEND != "memory"
+DB_READER_THREADS = int(os.getenv("DB_READER_THREADS") or "2")
+DB_MAX_PENDING_QUERIES = int(os.getenv("DB_MAX_PENDING_QUERIES") or "256")
+# Group commit: writes queued within the window share one transaction (one HTTP batch on D1).
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX") or "64")
+DB_WRITE_BATCH_WINDOW_MS = float(os.getenv("DB_WRITE_BATCH_WINDOW_MS") or ("5" if USE_CLOUDFLARE_D1 else "0"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE") or str(64 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB") or str(16 * 1024))
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS") or "256")
+COOLDOWN_FLUSH_INTERVAL_SECONDS = float(os.getenv("COOLDOWN_FLUSH_INTERVAL_SECONDS") or "2")
+# How often schema setup is retried when storage was unreachable at startup.
+DB_SETUP_RETRY_SECONDS = float(os.getenv("DB_SETUP_RETRY_SECONDS") or "30")
+# Longest the expiry scheduler sleeps; notified cooldowns older than an hour are dropped at least this often.
+COOLDOWN_PURGE_INTERVAL_SECONDS = float(os.getenv("COOLDOWN_PURGE_INTERVAL_SECONDS") or "600")
+# Ready notifications: sent by a small worker pool; reminders for one channel expiring
+# within the coalesce window go out as a single message.
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS") or "4")
+NOTIFY_COALESCE_MS = float(os.getenv("NOTIFY_COALESCE_MS") or "250")
+NOTIFY_CHANNEL_RATE = int(os.getenv("NOTIFY_CHANNEL_RATE") or "5")
+NOTIFY_CHANNEL_PERIOD_SECONDS = float(os.getenv("NOTIFY_CHANNEL_PERIOD_SECONDS") or "5")
+# Hash of the last synced slash-command tree; the tree is only re-synced when it changes.
+COMMAND_TREE_HASH_PATH = os.getenv("COMMAND_TREE_HASH_PATH", "command_tree.hash").strip()
+# Durable outbox: expired reminders are queued here before they are marked notified, and
+# rows are deleted only once sent (at-least-once delivery).
+NOTIFY_OUTBOX_PATH = os.getenv("NOTIFY_OUTBOX_PATH", "notification_outbox.sqlite3").strip()
+NOTIFY_OUTBOX_BATCH = int(os.getenv("NOTIFY_OUTBOX_BATCH") or "100")
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS") or "10")
+# Reminders that expired while the bot was offline: "summary" (one message per channel),
+# "notify" (regular reminders) or "drop"; any older than the max age are skipped.
+NOTIFY_CATCHUP_POLICY = (os.getenv("NOTIFY_CATCHUP_POLICY") or "summary").strip().lower()
+NOTIFY_CATCHUP_MAX_AGE_SECONDS = float(os.getenv("NOTIFY_CATCHUP_MAX_AGE_SECONDS") or "3600")
+NOTIFY_CATCHUP_SUMMARY_LINES = int(os.getenv("NOTIFY_CATCHUP_SUMMARY_LINES") or "20")
+# Display names for users the gateway cache does not hold (fetched over REST at most once per TTL).
+USER_NAME_CACHE_SIZE = int(os.getenv("USER_NAME_CACHE_SIZE") or "1024")
+USER_NAME_CACHE_TTL_SECONDS = float(os.getenv("USER_NAME_CACHE_TTL_SECONDS") or "3600")
+COOLDOWN_FLUSH_MAX_DIRTY = int(os.getenv("COOLDOWN_FLUSH_MAX_DIRTY") or "500")
+# Journal mode: persist cooldowns as an append-only log plus snapshots instead of the cooldowns table.
+COOLDOWN_JOURNAL_PATH = os.getenv("COOLDOWN_JOURNAL_PATH", "").strip()
+COOLDOWN_JOURNAL_COMPACT_EVERY = int(os.getenv("COOLDOWN_JOURNAL_COMPACT_EVERY") or "100000")
+D1_API_BASE_URL = os.getenv("D1_API_BASE_URL", "https://api.cloudflare.com/client/v4").strip()
+D1_MAX_CONNECTIONS = int(os.getenv("D1_MAX_CONNECTIONS") or "8")
+D1_REQUEST_TIMEOUT_SECONDS = float(os.getenv("D1_REQUEST_TIMEOUT_SECONDS") or "10")
+D1_RETRY_ATTEMPTS = int(os.getenv("D1_RETRY_ATTEMPTS") or "3")
+D1_BREAKER_FAILURES = int(os.getenv("D1_BREAKER_FAILURES") or "5")
+D1_BREAKER_RESET_SECONDS = float(os.getenv("D1_BREAKER_RESET_SECONDS") or "30")
+# Local spool for D1 writes that could not be sent yet (replica write-through, or D1 outages).
+D1_SPOOL_PATH = os.getenv("D1_SPOOL_PATH", "d1_spool.sqlite3").strip()
+# Local SQLite mirror serving reads in D1 mode; set to an empty string to read from D1 directly.
+D1_REPLICA_PATH = os.getenv("D1_REPLICA_PATH", "d1_replica.sqlite3").strip()
+USE_D1_REPLICA = USE_CLOUDFLARE_D1 and bool(D1_REPLICA_PATH)
+REPLICATED_TABLES = ("cooldowns", "quiz_cache", "quiz_review_candidates")
+
+
+metrics = MetricsRegistry()
+
+# One pooled keep-alive client shared by every D1 caller (executor threads,
+# startup migrations and coroutines alike).
+d1_client = (
+    D1Client(
+        CF_ACCOUNT_ID,
+        CF_D1_DATABASE_ID,
+        CF_API_TOKEN,
+        max_connections=D1_MAX_CONNECTIONS,
+        timeout=D1_REQUEST_TIMEOUT_SECONDS,
+        base_url=D1_API_BASE_URL,
+        retry=RetryPolicy(attempts=D1_RETRY_ATTEMPTS),
+        breaker=CircuitBreaker(failure_threshold=D1_BREAKER_FAILURES, reset_timeout=D1_BREAKER_RESET_SECONDS),
+        metrics=metrics,
     )
-    with urllib_request.urlopen(request, timeout=30) as response:
-        body = response.read().decode("utf-8")
-
-    data = json.loads(body)
-    if not data.get("success", False):
-        errors = data.get("errors") or data.get("messages") or []
-        raise RuntimeError(f"Cloudflare D1 query failed: {errors or body}")
-    return data.get("result") or []
-
-
-def _normalize_d1_params(params):
-    return ["" if value is None else str(value) for value in list(params or [])]
-
-
-class _D1Connection:
-    def __init__(self):
-        self.row_factory = None
-        self._pending_writes = []
-        self._in_context = False
-
-    def __enter__(self):
-        self._in_context = True
-        return self
-
-    def __exit__(self, exc_type, exc, tb):
-        try:
-            if exc_type is None and self._pending_writes:
-                payload = {
-                    "batch": [
-                        {"sql": sql, "params": params}
-                        for sql, params in self._pending_writes
-                    ]
-                }
-                _d1_api_request(payload)
-        finally:
-            self._pending_writes = []
-            self._in_context = False
-        return False
-
-    def _is_read_query(self, sql: str) -> bool:
-        statement = (sql or "").strip().lower()
-        if not statement:
-            return True
-        return statement.startswith(("select", "pragma", "with", "explain"))
-
-    def execute(self, sql, params=()):
-        if self._is_read_query(sql):
-            results = _d1_api_request({"sql": sql, "params": _normalize_d1_params(params)})
-            first = results[0] if results else {}
-            rows = first.get("results") or []
-            return _QueryResultCursor(rows=rows)
-
-        if self._in_context:
-            self._pending_writes.append((sql, _normalize_d1_params(params)))
-            return _QueryResultCursor(rows=[])
-
-        results = _d1_api_request({"sql": sql, "params": _normalize_d1_params(params)})
-        first = results[0] if results else {}
-        return _QueryResultCursor(
-            rows=first.get("results") or [],
-            rowcount=int((first.get("meta") or {}).get("changes") or 0),
-            lastrowid=(first.get("meta") or {}).get("last_row_id"),
-        )
-
-    def executemany(self, sql, seq_of_params):
-        if self._in_context:
-            for params in seq_of_params:
-                self._pending_writes.append((sql, _normalize_d1_params(params)))
-            return _QueryResultCursor(rows=[])
-
-        payload = {"batch": [{"sql": sql, "params": _normalize_d1_params(params)} for params in seq_of_params]}
-        results = _d1_api_request(payload)
-        last = results[-1] if results else {}
-        return _QueryResultCursor(
-            rows=(last.get("results") or []),
-            rowcount=int(sum(int((item.get("meta") or {}).get("changes") or 0) for item in results)),
-            lastrowid=(last.get("meta") or {}).get("last_row_id"),
-        )
-
-    def commit(self):
-        if self._pending_writes:
-            payload = {
-                "batch": [
-                    {"sql": sql, "params": params}
-                    for sql, params in self._pending_writes
-                ]
-            }
-            _d1_api_request(payload)
-            self._pending_writes = []
-
-    def rollback(self):
-        self._pending_writes = []
-
-    def close(self):
-        self._pending_writes = []
-
-
-def _connect_database(*args, **kwargs):
-    if USE_CLOUDFLARE_D1:
-        return _D1Connection()
-    return _LOCAL_SQLITE_CONNECT(*args, **kwargs)
-
-
-sqlite3.connect = _connect_database
+    if USE_CLOUDFLARE_D1
+    else None
+)
+d1_write_through = (
+    D1WriteThrough(d1_client, D1_SPOOL_PATH, batch_window=DB_WRITE_BATCH_WINDOW_MS / 1000)
+    if USE_CLOUDFLARE_D1
+    else None
+)
+
+
+# Direct D1 storage; failed transient writes fall back to the spool.
+d1_storage = D1Storage(d1_client, d1_write_through.send) if USE_CLOUDFLARE_D1 else None
+
+
+sqlite_connections = SQLiteConnectionManager(
+    DB_PATH,
+    mmap_size=SQLITE_MMAP_SIZE,
+    cache_size_kb=SQLITE_CACHE_SIZE_KB,
+    cached_statements=SQLITE_CACHED_STATEMENTS,
+)
+
+
+replica_connections = (
+    SQLiteConnectionManager(
+        D1_REPLICA_PATH,
+        mmap_size=SQLITE_MMAP_SIZE,
+        cache_size_kb=SQLITE_CACHE_SIZE_KB,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+    )
+    if USE_D1_REPLICA
+    else None
+)
+
+
+def _connect_replica():
+    return D1ReplicaConnection(replica_connections.connect(), d1_write_through)
+
+
+# The configured StorageBackend: in-memory, the local SQLite replica with D1
+# write-through, plain D1, or local SQLite.
+if STORAGE_BACKEND == "memory":
+    storage = MemoryStorage()
+elif USE_D1_REPLICA:
+    storage = SQLiteStorage(_connect_replica)
+elif USE_CLOUDFLARE_D1:
+    storage = d1_storage
+else:
+    storage = SQLiteStorage(sqlite_connections.connect)
+
+
+# Storage calls from async handlers go through this executor so a slow disk or
+# D1 round trip never blocks the gateway event loop. Handlers pass it
+# ``storage`` methods: ``await db.read(storage.user_cooldowns, user_id)``.
+db = DatabaseExecutor(
+    storage.connect,
+    # D1 reader threads mostly wait on the network; give each pooled connection one.
+    readers=max(DB_READER_THREADS, D1_MAX_CONNECTIONS) if USE_CLOUDFLARE_D1 and not USE_D1_REPLICA else DB_READER_THREADS,
+    max_pending=DB_MAX_PENDING_QUERIES,
+    batch_window=DB_WRITE_BATCH_WINDOW_MS / 1000,
+    max_batch=DB_WRITE_BATCH_MAX,
+)
 
 cooldown_times = {
     "mission": 60,
@@ -251,179 +306,260 @@ cooldown_colors = {
     "challenge": discord.Color.orange()
 }
 
-cooldowns = {}
-pending_smart_tracks = {}
+_cooldown_flush_lock = asyncio.Lock()
+_early_cooldown_flush = None
+_journal_compaction = None
+_missed_notification_catch_up = None
+# (monotonic time, ok sends) at the last `n cd notify`, so it reports the rate since then.
+_notify_sends_checkpoint = None
+
+
+def _report_task_failure(task):
+    """Done-callback for background tasks: log the exception instead of losing it."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Background task {task.get_name()!r} failed: {task.exception()!r}")
+
+
+def _request_early_cooldown_flush():
+    global _early_cooldown_flush
+    if _early_cooldown_flush is None or _early_cooldown_flush.done():
+        _early_cooldown_flush = asyncio.get_running_loop().create_task(flush_cooldowns())
+
+
+cooldown_store = CooldownStore(
+    flush_threshold=COOLDOWN_FLUSH_MAX_DIRTY,
+    on_flush_needed=_request_early_cooldown_flush,
+)
+cooldown_journal = (
+    CooldownJournal(COOLDOWN_JOURNAL_PATH, compact_every=COOLDOWN_JOURNAL_COMPACT_EVERY)
+    if COOLDOWN_JOURNAL_PATH
+    else None
+)
+cooldown_store.journal = cooldown_journal
+# Sleeps until the next cooldown expires instead of polling; every set wakes it
+# if the new expiry is sooner.
+expiry_scheduler = ExpiryScheduler(
+    cooldown_store.next_expiry,
+    lambda now: check_expired_cooldowns(now),
+    max_sleep=COOLDOWN_PURGE_INTERVAL_SECONDS,
+)
+cooldown_store.on_expiry_scheduled = expiry_scheduler.reschedule
+
+
+def _render_ready_notifications(channel_id, items):
+    """Build the ready message(s) for ``(outbox_id, user_id, cmd, expires_at)`` items due in one channel."""
+    if len(items) == 1:
+        _, user_id, cmd, _ = items[0]
+        emoji = cooldown_emojis.get(cmd, "✅")
+        mention = f"<@{user_id}>"
+        messages = [
+            f"{emoji} **{cmd.upper()} READY!** Dattebayo! Time to get back out there, {mention}!",
+            f"{emoji} Your **{cmd}** cooldown is complete! The ninja way never stops, {mention}!",
+            f"{emoji} **{cmd.upper()}** is ready to go! Show them what you're made of, {mention}!",
+            f"{emoji} Cooldown finished for **{cmd}**! Let's do this, {mention}!",
+        ]
+        return [(random.choice(messages), items)]
+
+    # Each chunk carries the items it mentions, so the dispatcher settles them per message.
+    chunks = [("⏰ **Cooldowns ready!** Dattebayo!", [])]
+    for item in items:
+        _, user_id, cmd, _ = item
+        line = f"{cooldown_emojis.get(cmd, '✅')} **{cmd.upper()}** — <@{user_id}>"
+        content, covered = chunks[-1]
+        if len(content) + 1 + len(line) > 2000:
+            chunks.append((line, [item]))
+        else:
+            chunks[-1] = (content + "\n" + line, covered + [item])
+    return chunks
+
+
+class NotificationChannelMissing(Exception):
+    """The reminder's channel is not in the cache (deleted, or the bot lost access)."""
+
+    # Settled like Discord's 404: retrying cannot succeed, so the rows are dropped.
+    status = 404
+
+
+async def _send_ready_notification(channel_id, content):
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        raise NotificationChannelMissing(f"channel {channel_id} not found")
+    await channel.send(content)
+
+
+notification_outbox = NotificationOutbox(
+    NOTIFY_OUTBOX_PATH,
+    batch_size=NOTIFY_OUTBOX_BATCH,
+    max_attempts=NOTIFY_MAX_ATTEMPTS,
+)
+
+
+async def _notifications_delivered(channel_id, items):
+    await notification_outbox.ack(item[0] for item in items)
+    # Lag runs from the cooldown's expiry to the completed channel send.
+    now = time.time()
+    lag = metrics.histogram("notify.lag", LAG_BUCKETS)
+    for _, _, cmd, expires_at in items:
+        lag.observe(now - expires_at)
+        metrics.histogram(f"notify.lag.{cmd}", LAG_BUCKETS).observe(now - expires_at)
+    metrics.counter("notify.delivered").inc(len(items))
+
+
+async def _notifications_failed(channel_id, items, error):
+    metrics.counter("notify.failed").inc(len(items))
+    if getattr(error, "status", None) in (403, 404):
+        # Missing access or a deleted channel: retrying cannot succeed.
+        await notification_outbox.ack(item[0] for item in items)
+        metrics.counter("notify.dropped").inc(len(items))
+    else:
+        metrics.counter("notify.dropped").inc(await notification_outbox.fail(item[0] for item in items))
+
+
+def _dispatch_outbox_rows(rows):
+    metrics.histogram("notify.queue_depth", COUNT_BUCKETS).observe(notification_outbox.pending)
+    for row in rows:
+        notification_dispatcher.submit(
+            row["channel_id"], (row["id"], row["user_id"], row["command"], row["expires_at"])
+        )
+
+
+notification_dispatcher = NotificationDispatcher(
+    _send_ready_notification,
+    _render_ready_notifications,
+    workers=NOTIFY_WORKERS,
+    coalesce_window=NOTIFY_COALESCE_MS / 1000,
+    channel_rate=NOTIFY_CHANNEL_RATE,
+    channel_period=NOTIFY_CHANNEL_PERIOD_SECONDS,
+    on_delivered=_notifications_delivered,
+    on_failed=_notifications_failed,
+    metrics=metrics,
+)
+
+pending_smart_tracks = PendingTrackRegistry()
 challenge_confirmation_states = {}
 CHALLENGE_PENDING_TTL_SECONDS = 120
 RESYNC_WHEN_ACTIVE = {"mission", "report", "tower", "daily", "weekly", "challenge"}
 
 
+def _challenge_state_expired(state, now: float) -> bool:
+    return now - float(state.get("timestamp", 0)) > CHALLENGE_PENDING_TTL_SECONDS
+
+
+def _drop_challenge_state(user_id):
+    challenge_confirmation_states.pop(user_id, None)
+    pending_smart_tracks.remove(user_id, "challenge")
+
+
 def _cleanup_stale_challenge_state():
     now = time.time()
-    stale_users = []
+    stale_users = [
+        user_id for user_id, state in challenge_confirmation_states.items() if _challenge_state_expired(state, now)
+    ]
+    for user_id in stale_users:
+        _drop_challenge_state(user_id)
 
-    for user_id, state in list(challenge_confirmation_states.items()):
-        if now - float(state.get("timestamp", 0)) > CHALLENGE_PENDING_TTL_SECONDS:
-            stale_users.append(user_id)
 
-    for user_id in stale_users:
-        challenge_confirmation_states.pop(user_id, None)
-        if user_id in pending_smart_tracks and "challenge" in pending_smart_tracks[user_id]:
-            pending_smart_tracks[user_id].pop("challenge", None)
-            if not pending_smart_tracks[user_id]:
-                pending_smart_tracks.pop(user_id, None)
-
-
-def _start_challenge_cooldown(user_id: int, channel_id: int, source: str = "accepted"):
-    cooldowns.setdefault(user_id, {})["challenge"] = {
-        "expires_at": time.time() + cooldown_times["challenge"],
-        "channel_id": channel_id,
-        "notified": False,
-    }
-    save_cooldowns()
+# Runs on a timer rather than per message; replies check their own state's age.
+@tasks.loop(seconds=30)
+async def cleanup_stale_challenges():
+    _cleanup_stale_challenge_state()
+
+
+def _start_challenge_cooldown(user_id: int, channel_id: int, guild_id: Optional[int] = None, source: str = "accepted"):
+    cooldown_store.set(user_id, "challenge", time.time() + cooldown_times["challenge"], channel_id, guild_id)
     quiz_log(f"Challenge cooldown synced from {source} for user_id={user_id} channel_id={channel_id}")
 
+_DATABASE_READY = False
+
+
 def init_database():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS cooldowns (
-                user_id INTEGER NOT NULL,
-                command TEXT NOT NULL,
-                expires_at REAL NOT NULL,
-                channel_id INTEGER,
-                notified INTEGER NOT NULL DEFAULT 0,
-                PRIMARY KEY (user_id, command)
-            )
-            """
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_cooldowns_expires_at ON cooldowns(expires_at)"
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS quiz_cache (
-                question_key TEXT PRIMARY KEY,
-                question_text TEXT NOT NULL,
-                options_text TEXT NOT NULL,
-                answer_index INTEGER NOT NULL,
-                answer_text TEXT NOT NULL,
-                provider TEXT,
-                created_at REAL NOT NULL,
-                updated_at REAL NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS quiz_review_candidates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                question_key TEXT NOT NULL,
-                question_text TEXT NOT NULL,
-                options_text TEXT NOT NULL,
-                answer_index INTEGER NOT NULL,
-                answer_text TEXT NOT NULL,
-                provider TEXT,
-                seen_count INTEGER NOT NULL DEFAULT 1,
-                first_seen_at REAL NOT NULL,
-                last_seen_at REAL NOT NULL,
-                UNIQUE(question_key, provider, answer_index)
-            )
-            """
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_quiz_review_candidates_last_seen ON quiz_review_candidates(last_seen_at)"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_quiz_review_candidates_question_key ON quiz_review_candidates(question_key)"
-        )
-    _dedupe_cooldowns_table()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_cooldowns_user_command ON cooldowns(user_id, command)"
-        )
-    _migrate_quiz_cache_keys_to_question_only()
-
-def _dedupe_cooldowns_table():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT rowid, CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id, notified
-            FROM cooldowns
-            ORDER BY user_id ASC, command ASC, expires_at DESC, rowid DESC
-            """
-        ).fetchall()
-
-        best_rows = {}
-        duplicate_rowids = []
-
-        for row in rows:
-            key = (int(row["user_id"]), str(row["command"]))
-            if key not in best_rows:
-                best_rows[key] = row
-            else:
-                duplicate_rowids.append(int(row["rowid"]))
+    """Apply pending schema migrations. Runs once per process at startup.
 
-        if duplicate_rowids:
-            conn.executemany(
-                "DELETE FROM cooldowns WHERE rowid = ?",
-                [(rowid,) for rowid in duplicate_rowids],
-            )
-            print(f"🧹 Deduped {len(duplicate_rowids)} cooldown row(s) in persistent storage", flush=True)
-
-def _migrate_quiz_cache_keys_to_question_only():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at
-            FROM quiz_cache
-            ORDER BY updated_at DESC, created_at DESC
-            """
-        ).fetchall()
-
-        if not rows:
-            return
+    With the D1 read replica enabled, D1 is migrated first, then the local
+    replica, which is then resynced from D1. If D1 is unreachable at that
+    point the bot starts from the replica it already has and the spooled
+    writes catch D1 up once it is back.
 
-        migrated = {}
-        for row in rows:
-            new_key = hashlib.sha256(_normalize_quiz_text(row["question_text"]).encode("utf-8")).hexdigest()
-            if new_key in migrated:
-                continue
-            migrated[new_key] = row
+    Without the replica a failure is logged and the database stays not ready;
+    ``retry_database_setup`` calls this again until it succeeds. Returns
+    whether the database is ready.
+    """
+    global _DATABASE_READY
+    if _DATABASE_READY:
+        return True
 
-        if len(migrated) == len(rows) and all(row["question_key"] == hashlib.sha256(_normalize_quiz_text(row["question_text"]).encode("utf-8")).hexdigest() for row in rows):
-            return
+    if USE_D1_REPLICA:
+        replica_storage = SQLiteStorage(replica_connections.connect)
+        try:
+            # Writes spooled during an earlier outage must land before D1 is read back.
+            d1_write_through.flush()
+            d1_storage.migrate()
+        except D1TransientError as e:
+            print(f"⚠️ Cloudflare D1 unreachable ({e}); starting from the local replica as-is", flush=True)
+            replica_storage.migrate(label="replica ")
+            d1_write_through.start()
+        else:
+            replica_storage.migrate(label="replica ")
+            copied = resync_replica(d1_storage.connect(), replica_connections.connect(), REPLICATED_TABLES)
+            print(f"🔁 Resynced local D1 replica ({copied} row(s))", flush=True)
+    else:
+        try:
+            if USE_CLOUDFLARE_D1:
+                d1_write_through.flush()
+            storage.migrate()
+        except Exception as e:
+            print(f"❌ Database setup failed, retrying in {DB_SETUP_RETRY_SECONDS:g}s: {e}", flush=True)
+            return False
+    _DATABASE_READY = True
+    return True
+
+
+@tasks.loop(seconds=DB_SETUP_RETRY_SECONDS)
+async def retry_database_setup():
+    """Retry a failed startup ``init_database()``, then load the cooldowns it blocked."""
+    if await asyncio.get_running_loop().run_in_executor(None, init_database):
+        retry_database_setup.stop()
+        if not cooldown_store.loaded:
+            await load_cooldowns()
+
+def _load_naruto_botto_ids():
+    ids = {NARUTO_BOTTO_USER_ID} if NARUTO_BOTTO_USER_ID else set()
+    try:
+        with open(NARUTO_BOTTO_IDS_PATH, encoding="utf-8") as f:
+            ids.update(int(value) for value in json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠️ Could not read {NARUTO_BOTTO_IDS_PATH}: {e}")
+    return ids
+
+
+_naruto_botto_ids = _load_naruto_botto_ids()
+# Bot accounts whose names did not match this session; not persisted, so renames are seen after a restart.
+_other_bot_ids = set()
+
+
+def _remember_naruto_botto_id(author_id: int):
+    _naruto_botto_ids.add(author_id)
+    print(f"🆔 Learned Naruto Botto user ID {author_id}")
+    try:
+        tmp_path = NARUTO_BOTTO_IDS_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(_naruto_botto_ids), f)
+        os.replace(tmp_path, NARUTO_BOTTO_IDS_PATH)
+    except OSError as e:
+        print(f"⚠️ Could not save {NARUTO_BOTTO_IDS_PATH}: {e}")
 
-        conn.execute("DELETE FROM quiz_cache")
-        for new_key, row in migrated.items():
-            conn.execute(
-                """
-                INSERT INTO quiz_cache (
-                    question_key, question_text, options_text, answer_index, answer_text,
-                    provider, created_at, updated_at
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    new_key,
-                    row["question_text"],
-                    row["options_text"],
-                    row["answer_index"],
-                    row["answer_text"],
-                    row["provider"],
-                    row["created_at"],
-                    row["updated_at"],
-                ),
-            )
 
 def is_naruto_botto_author(author) -> bool:
     if not author:
         return False
 
-    if NARUTO_BOTTO_USER_ID and getattr(author, "id", None) == NARUTO_BOTTO_USER_ID:
+    author_id = getattr(author, "id", None)
+    if author_id in _naruto_botto_ids:
         return True
+    if author_id in _other_bot_ids:
+        return False
 
     author_name = " ".join(
         str(value)
@@ -436,16 +572,14 @@ def is_naruto_botto_author(author) -> bool:
         ]
         if value
     ).lower()
-    return "naruto botto" in author_name
-
-def cooldown_row_to_dict(row):
-    return {
-        "user_id": int(row["user_id"]),
-        "command": str(row["command"]),
-        "expires_at": float(row["expires_at"]),
-        "channel_id": int(row["channel_id"]) if row["channel_id"] is not None else None,
-        "notified": bool(row["notified"]),
-    }
+    matched = "naruto botto" in author_name
+    # Only bot accounts are learned; a human nicknamed "Naruto Botto" stays on name matching.
+    if author_id is not None and getattr(author, "bot", False):
+        if matched:
+            _remember_naruto_botto_id(author_id)
+        else:
+            _other_bot_ids.add(author_id)
+    return matched
 
 def should_show_progress_bar(cmd):
     return cmd in ["daily", "weekly"]
@@ -547,33 +681,26 @@ def get_progress_bar(current, total, length=10):
     bar = "█" * filled + "░" * empty
     return f"{bar} {percentage}%"
 
-def get_cooldown_data(user_id: int, cmd: str) -> Optional[Dict]:
-    if user_id in cooldowns and cmd in cooldowns[user_id]:
-        return cooldowns[user_id][cmd]
-    return None
+def get_cooldown_data(user_id: int, cmd: str) -> Optional[CooldownRecord]:
+    return cooldown_store.get(user_id, cmd)
 
 def get_remaining_time(user_id: int, cmd: str) -> float:
     data = get_cooldown_data(user_id, cmd)
     if data:
-        remaining = data["expires_at"] - time.time()
+        remaining = data.expires_at - time.time()
         return remaining if remaining > 0 else 0
     return 0
 
 
-def _get_cooldowns_from_db(user_id: int):
-    init_database()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id, notified
-            FROM cooldowns
-            WHERE user_id = ?
-            ORDER BY expires_at ASC
-            """,
-            (int(user_id),),
-        ).fetchall()
-    return [cooldown_row_to_dict(row) for row in rows]
+async def get_user_cooldowns(user_id: int):
+    """Serve a user's cooldowns from memory, reading through to storage only when stale.
+
+    In journal mode the cooldowns table is not kept current, so there is no
+    read-through: memory (the journal replay) is the only source.
+    """
+    if cooldown_journal is None and cooldown_store.is_stale(user_id):
+        cooldown_store.refresh_user(user_id, await db.read(storage.user_cooldowns, user_id))
+    return cooldown_store.user_cooldowns(user_id)
 
 
 async def _resolve_member_reference(ctx, member_ref=None):
@@ -625,33 +752,124 @@ async def _resolve_member_reference(ctx, member_ref=None):
 
     return ctx.author
 
-def save_cooldowns():
+user_names = UserNameCache(
+    lambda user_id: bot.fetch_user(user_id),
+    max_size=USER_NAME_CACHE_SIZE,
+    ttl=USER_NAME_CACHE_TTL_SECONDS,
+)
+
+
+def _cached_display_name(user_id: int, guild=None):
+    """Display name from the gateway cache or ``user_names``, without any REST call."""
+    member = guild.get_member(user_id) if guild else None
+    if member is None:
+        member = bot.get_user(user_id)
+    if member is not None:
+        return member.display_name
+    return user_names.get(user_id)
+
+
+async def _display_names(user_ids, guild=None):
+    """Map user IDs to display names, fetching only the ones no cache holds."""
+    names = {user_id: _cached_display_name(user_id, guild) for user_id in user_ids}
+    missing = [user_id for user_id, name in names.items() if name is None]
+    if missing:
+        for user_id, name in zip(missing, await asyncio.gather(*(user_names.resolve(u) for u in missing))):
+            names[user_id] = name or f"User {user_id}"
+    return names
+
+
+def _cooldown_storage_row(user_id: int, cmd: str, data: CooldownRecord):
+    return {
+        "user_id": int(user_id),
+        "command": cmd,
+        "expires_at": data.expires_at,
+        "channel_id": data.channel_id,
+        "guild_id": data.guild_id,
+        "notified": data.notified,
+    }
+
+
+async def save_cooldowns():
+    rows = [_cooldown_storage_row(user_id, cmd, data) for user_id, cmd, data in cooldown_store.items()]
     try:
-        init_database()
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.execute("DELETE FROM cooldowns")
-            rows = []
-            for user_id, cmds in cooldowns.items():
-                for cmd, data in cmds.items():
-                    rows.append(
-                        (
-                            int(user_id),
-                            cmd,
-                            float(data["expires_at"]),
-                            int(data["channel_id"]) if data.get("channel_id") is not None else None,
-                            1 if data.get("notified", False) else 0,
-                        )
-                    )
-            conn.executemany(
-                """
-                INSERT OR REPLACE INTO cooldowns (user_id, command, expires_at, channel_id, notified)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                rows,
-            )
+        await db.write(storage.replace_cooldowns, rows)
     except Exception as e:
         print(f"❌ Error saving cooldowns: {e}")
 
+async def save_cooldown_entries(keys):
+    """Persist only the given (user_id, command) pairs.
+
+    Pairs still present in ``cooldown_store`` are upserted, missing ones are deleted,
+    so a write costs O(changed rows) instead of a full-table rewrite.
+    """
+    upserts = []
+    deletes = []
+    for user_id, cmd in set(keys):
+        data = cooldown_store.get(user_id, cmd)
+        if data is None:
+            deletes.append((user_id, cmd))
+        else:
+            upserts.append(_cooldown_storage_row(user_id, cmd, data))
+
+    if not upserts and not deletes:
+        return
+
+    def write(conn):
+        storage.upsert_cooldowns(conn, upserts)
+        storage.delete_cooldowns(conn, deletes)
+
+    await db.write(write)
+
+
+async def flush_cooldowns():
+    """Write every dirty cooldown key in one transaction.
+
+    ``cooldown_store`` marks keys dirty on every change, so repeated updates to
+    the same key coalesce into one row write. Keys are only dropped once the
+    write succeeds; a failed flush is retried on the next tick.
+    """
+    async with _cooldown_flush_lock:
+        if not cooldown_store.dirty_count:
+            return
+        keys = cooldown_store.take_dirty()
+        try:
+            if cooldown_journal is not None:
+                await _append_cooldown_journal()
+            else:
+                await save_cooldown_entries(keys)
+        except Exception as e:
+            cooldown_store.restore_dirty(keys)
+            print(f"❌ Error saving cooldowns ({len(keys)} pending): {e}")
+
+
+async def _append_cooldown_journal():
+    """Write buffered journal records and start a compaction when the log is long enough."""
+    global _journal_compaction
+    loop = asyncio.get_running_loop()
+    data = cooldown_journal.take_pending()
+    try:
+        await loop.run_in_executor(None, cooldown_journal.write, data)
+    except Exception:
+        cooldown_journal.restore_pending(data)
+        raise
+    if cooldown_journal.needs_compaction and (_journal_compaction is None or _journal_compaction.done()):
+        cooldown_journal.rotate()
+        _journal_compaction = loop.create_task(_compact_cooldown_journal())
+
+
+async def _compact_cooldown_journal():
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, cooldown_journal.compact)
+    except Exception as e:
+        # The rotated log stays on disk and is replayed, so nothing is lost.
+        print(f"❌ Error compacting cooldown journal: {e}")
+
+
+@tasks.loop(seconds=COOLDOWN_FLUSH_INTERVAL_SECONDS)
+async def flush_dirty_cooldowns():
+    await flush_cooldowns()
+
 def _load_legacy_json_cooldowns():
     legacy_data = {}
     try:
@@ -680,40 +898,73 @@ def _load_legacy_json_cooldowns():
         print(f"❌ Error loading legacy cooldowns: {e}")
     return legacy_data
 
-def load_cooldowns():
-    global cooldowns
+async def load_cooldowns():
+    await flush_cooldowns()
+    if cooldown_journal is not None:
+        await _load_cooldowns_from_journal()
+        return
+    await _load_cooldowns_from_database()
+
+
+async def _load_cooldowns_from_journal():
+    loop = asyncio.get_running_loop()
+    try:
+        if _journal_compaction is not None:
+            await _journal_compaction
+        if cooldown_journal.exists():
+            entries = await loop.run_in_executor(None, cooldown_journal.replay)
+            cooldown_store.load_entries(entries)
+            print(f"📜 Replayed {len(cooldown_store)} cooldown record(s) from the journal")
+            return
+
+        # First start in journal mode: seed the snapshot from the cooldowns table.
+        await _load_cooldowns_from_database()
+        if cooldown_store.loaded:
+            await loop.run_in_executor(None, cooldown_journal.write_snapshot, list(cooldown_store.entries()))
+            print(f"📜 Seeded the cooldown journal with {len(cooldown_store)} record(s)")
+    except Exception as e:
+        print(f"❌ Error replaying cooldown journal: {e}")
+
+
+async def _load_cooldowns_from_database():
     try:
-        init_database()
         loaded_count = 0
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(
-                """
-                SELECT CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id, notified
-                FROM cooldowns
-                """
-            ).fetchall()
+        rows = await db.read(storage.load_cooldowns)
 
         if rows:
-            cooldowns = {}
-            for row in rows:
-                user_id = int(row["user_id"])
-                cooldowns.setdefault(user_id, {})[row["command"]] = cooldown_row_to_dict(row)
-                loaded_count += 1
-            print(f"📂 Loaded {loaded_count} cooldown record(s) from SQLite")
+            cooldown_store.load(rows)
+            loaded_count = len(cooldown_store)
+            print(f"📂 Loaded {loaded_count} cooldown record(s) from storage")
             return
 
         legacy_data = _load_legacy_json_cooldowns()
-        cooldowns = legacy_data
-        if cooldowns:
-            save_cooldowns()
-            loaded_count = sum(len(cmds) for cmds in cooldowns.values())
-            print(f"📂 Loaded {loaded_count} cooldown record(s) and migrated them to SQLite")
+        cooldown_store.load(
+            {"user_id": user_id, "command": cmd, **data}
+            for user_id, cmds in legacy_data.items()
+            for cmd, data in cmds.items()
+        )
+        if cooldown_store:
+            await save_cooldowns()
+            loaded_count = len(cooldown_store)
+            print(f"📂 Loaded {loaded_count} cooldown record(s) and migrated them to storage")
         else:
             print("📂 No existing cooldown storage found, starting fresh")
     except Exception as e:
+        # Leave the store unloaded so per-user reads fall back to storage.
         print(f"❌ Error loading cooldowns: {e}")
-        cooldowns = {}
+
+def _backfill_cooldown_guilds():
+    """Attach a guild to rows stored before cooldowns were guild-partitioned."""
+    backfilled = 0
+    for user_id, cmd, data in cooldown_store.items():
+        if data.guild_id is not None or data.channel_id is None:
+            continue
+        channel = bot.get_channel(data.channel_id)
+        guild = getattr(channel, "guild", None)
+        if guild is not None and cooldown_store.set_guild(user_id, cmd, guild.id):
+            backfilled += 1
+    if backfilled:
+        print(f"🏷️ Backfilled the server for {backfilled} cooldown record(s)")
 
 def parse_time_string(text):
     total_seconds = 0
@@ -730,77 +981,194 @@ def parse_time_string(text):
             total_seconds += amount * 86400
     return total_seconds
 
-@tasks.loop(seconds=30)
-async def check_expired_cooldowns():
-    now = time.time()
-    expired_notifications = []
-    
-    for user_id, cmds in list(cooldowns.items()):
-        for cmd, data in list(cmds.items()):
-            if data["expires_at"] <= now:
-                if not data.get("notified", False):
-                    expired_notifications.append((user_id, cmd, data.get("channel_id")))
-                    data["notified"] = True
-    
-    for user_id, cmd, channel_id in expired_notifications:
+async def check_expired_cooldowns(now: float):
+    """Notify cooldowns that are due; run by ``expiry_scheduler`` at each deadline."""
+    # Only cooldowns that expired since the last run come off the expiry heap.
+    due = [(user_id, cmd, data) for user_id, cmd, data in cooldown_store.pop_expired(now) if not data.notified]
+    # Queue durably before marking notified, so a crash in between resends rather than loses.
+    try:
+        await notification_outbox.enqueue(
+            (data.channel_id, user_id, cmd, data.expires_at) for user_id, cmd, data in due if data.channel_id
+        )
+    except Exception:
+        # Back on the heap, so the next run retries them.
+        cooldown_store.restore_expired(due)
+        raise
+    metrics.counter("notify.expired").inc(len(due))
+    for user_id, cmd, data in due:
+        # Skip cooldowns restarted while the enqueue was awaited.
+        if cooldown_store.get(user_id, cmd) is data:
+            cooldown_store.mark_notified(user_id, cmd)
+
+    cooldown_store.purge_expired(now - 3600)
+
+async def _take_missed_notifications(now: float):
+    """Pop reminders that expired while offline, grouped by channel as outbox items.
+
+    Everything popped is marked notified, so the expiry scheduler does not send
+    it again; reminders older than ``NOTIFY_CATCHUP_MAX_AGE_SECONDS`` are left
+    out. Kept reminders go into the outbox first: straight away under the
+    ``notify`` policy, and for ``summary`` hidden for the outbox lease so they
+    only go out one by one if the summary is never sent. If that enqueue fails,
+    everything popped goes back on the expiry heap for the scheduler to send.
+    """
+    expired = [(user_id, cmd, data) for user_id, cmd, data in cooldown_store.pop_expired(now) if not data.notified]
+    due = [
+        (data.channel_id, user_id, cmd, data.expires_at)
+        for user_id, cmd, data in expired
+        if data.channel_id and now - data.expires_at <= NOTIFY_CATCHUP_MAX_AGE_SECONDS
+    ]
+    too_old = sum(1 for _, _, data in expired if data.channel_id) - len(due)
+
+    missed = {}
+    if due and NOTIFY_CATCHUP_POLICY != "drop":
+        available_at = now + notification_outbox.lease if NOTIFY_CATCHUP_POLICY == "summary" else now
         try:
-            user = await bot.fetch_user(user_id)
-            emoji = cooldown_emojis.get(cmd, "✅")
-            
-            messages = [
-                f"{emoji} **{cmd.upper()} READY!** Dattebayo! Time to get back out there, {user.mention}!",
-                f"{emoji} Your **{cmd}** cooldown is complete! The ninja way never stops, {user.mention}!",
-                f"{emoji} **{cmd.upper()}** is ready to go! Show them what you're made of, {user.mention}!",
-                f"{emoji} Cooldown finished for **{cmd}**! Let's do this, {user.mention}!",
-            ]
-            
-            message = random.choice(messages)
-            
-            if channel_id:
-                try:
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        await channel.send(message)
-                except:
-                    pass
-                
-        except Exception as e:
-            print(f"Error notifying user {user_id} for {cmd}: {e}")
-    
-    to_remove = []
-    for user_id, cmds in list(cooldowns.items()):
-        for cmd in list(cmds.keys()):
-            if cmds[cmd]["expires_at"] <= now - 3600:
-                cmds.pop(cmd)
-        if not cmds:
-            to_remove.append(user_id)
-    
-    for uid in to_remove:
-        cooldowns.pop(uid, None)
-    
-    if expired_notifications or to_remove:
-        save_cooldowns()
+            ids = await notification_outbox.enqueue(due, available_at=available_at)
+        except Exception:
+            cooldown_store.restore_expired(expired)
+            raise
+        for outbox_id, (channel_id, user_id, cmd, expires_at) in zip(ids, due):
+            missed.setdefault(channel_id, []).append((outbox_id, user_id, cmd, expires_at))
+    elif due:
+        print(f"🧹 Dropped {len(due)} missed notification(s) (NOTIFY_CATCHUP_POLICY=drop)")
+        metrics.counter("notify.catchup.dropped").inc(len(due))
+    for user_id, cmd, data in expired:
+        if cooldown_store.get(user_id, cmd) is data:
+            cooldown_store.mark_notified(user_id, cmd)
+    if too_old:
+        metrics.counter("notify.catchup.skipped").inc(too_old)
+        print(f"🧹 Skipped {too_old} missed notification(s) older than {format_time(NOTIFY_CATCHUP_MAX_AGE_SECONDS)}")
+    return missed
+
+
+def _render_missed_summary(items):
+    header = "⏰ **While I was away, these cooldowns became ready:**"
+    lines = [
+        f"{cooldown_emojis.get(cmd, '✅')} **{cmd.upper()}** — <@{user_id}> (ready <t:{int(expires_at)}:R>)"
+        for _, user_id, cmd, expires_at in sorted(items, key=lambda item: item[3])
+    ]
+    message = header
+    for index, line in enumerate(lines):
+        if index == NOTIFY_CATCHUP_SUMMARY_LINES or len(message) + len(line) + 30 > 2000:
+            return message + f"\n…and {len(lines) - index} more."
+        message += "\n" + line
+    return message
+
+
+async def catch_up_missed_notifications(missed):
+    """Send one summary per channel for reminders taken by ``_take_missed_notifications``.
+
+    Only the ``summary`` policy sends here; ``notify`` leaves the backlog to the
+    outbox drain. Summarised rows are deleted from the outbox, and a failed
+    summary leaves its rows to be sent as regular reminders once the lease ends.
+    """
+    total = sum(len(items) for items in missed.values())
+    if not total or NOTIFY_CATCHUP_POLICY != "summary":
+        if total:
+            print(f"📨 Queued {total} missed notification(s) across {len(missed)} channel(s)")
+        return
+
+    # At most NOTIFY_WORKERS sends in flight.
+    semaphore = asyncio.Semaphore(NOTIFY_WORKERS)
+
+    async def send_summary(channel_id, items):
+        async with semaphore:
+            try:
+                await _send_ready_notification(channel_id, _render_missed_summary(items))
+            except Exception as e:
+                print(f"❌ Error sending missed-notification summary to channel {channel_id}: {e}")
+                return 0
+            await notification_outbox.ack(item[0] for item in items)
+            metrics.counter("notify.catchup.summarised").inc(len(items))
+            return len(items)
+
+    sent = await asyncio.gather(*(send_summary(channel_id, items) for channel_id, items in missed.items()))
+    print(f"📨 Summarised {sum(sent)} of {total} missed notification(s) in {len(missed)} channel(s)")
+
+def _command_tree_hash():
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{bot.application_id}:{digest}"
+
+
+async def sync_command_tree():
+    """Sync slash commands only if the tree differs from the last successful sync."""
+    tree_hash = _command_tree_hash()
+    try:
+        with open(COMMAND_TREE_HASH_PATH, encoding="utf-8") as f:
+            if f.read().strip() == tree_hash:
+                print("✅ Slash commands unchanged since the last sync")
+                return
+    except OSError:
+        pass
 
-@bot.event
-async def on_ready():
-    print(f"🎌 {bot.user} is now online!")
-    print(f"📊 Connected to {len(bot.guilds)} server(s)")
-    load_cooldowns()
-    if not check_expired_cooldowns.is_running():
-        check_expired_cooldowns.start()
-    
     try:
         synced = await bot.tree.sync()
         print(f"✅ Synced {len(synced)} slash command(s)")
     except Exception as e:
         print(f"❌ Failed to sync slash commands: {e}")
-    
-    await bot.change_presence(
-        activity=discord.Activity(
-            type=discord.ActivityType.watching,
-            name="Naruto Botto cooldowns | n help"
+        return
+
+    try:
+        tmp_path = COMMAND_TREE_HASH_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(tree_hash)
+        os.replace(tmp_path, COMMAND_TREE_HASH_PATH)
+    except OSError as e:
+        print(f"⚠️ Could not record the slash command tree hash: {e}")
+
+
+async def start_notification_delivery():
+    """Start reminder delivery once, after the first READY fills the channel cache.
+
+    Each step is guarded on its own: a failure is logged and the rest still
+    run, and the expiry scheduler always starts, so reminders keep firing.
+    """
+    global _missed_notification_catch_up
+    await bot.wait_until_ready()
+    try:
+        _backfill_cooldown_guilds()
+    except Exception as e:
+        print(f"❌ Error backfilling cooldown guild IDs: {e}")
+    try:
+        notification_dispatcher.start()
+    except Exception as e:
+        print(f"❌ Error starting the notification dispatcher: {e}")
+    try:
+        notification_outbox.start(_dispatch_outbox_rows)
+    except Exception as e:
+        print(f"❌ Error starting the notification outbox drain: {e}")
+    try:
+        # Take the backlog before the scheduler's first run so it is not sent one by one.
+        missed = await _take_missed_notifications(time.time())
+    except Exception as e:
+        print(f"❌ Error taking missed notifications: {e}")
+    else:
+        _missed_notification_catch_up = asyncio.get_running_loop().create_task(
+            catch_up_missed_notifications(missed), name="missed notification catch-up"
         )
-    )
+        _missed_notification_catch_up.add_done_callback(_report_task_failure)
+    expiry_scheduler.start()
+
+
+@bot.event
+async def on_ready():
+    # Fires on every (re)connect; one-time startup lives in CompanionBot.setup_hook.
+    print(f"🎌 {bot.user} is now online!")
+    print(f"📊 Connected to {len(bot.guilds)} server(s)")
+
+@bot.event
+async def on_disconnect():
+    # Gateway dropped; persist buffered updates before discord.py reconnects.
+    await flush_cooldowns()
+
+@bot.event
+async def on_guild_remove(guild):
+    # Reminders can no longer be delivered there; drop only that guild's partition.
+    removed = cooldown_store.clear_guild(guild.id)
+    if removed:
+        print(f"🧹 Dropped {removed} cooldown(s) for departed server {guild.id}")
 
 def _component_text(comp):
     """Best-effort text extraction from a component (version-proof across discord.py)."""
@@ -885,10 +1253,12 @@ def _quiz_describe_attachments(attachments) -> str:
 
 @bot.event
 async def on_message(message):
-    if message.author == bot.user:
+    author = message.author
+    # Human chatter only matters as a command or a reply to a pending challenge prompt.
+    if not author.bot and author.id not in challenge_confirmation_states and not message.content.startswith(COMMAND_PREFIXES):
+        return
+    if author == bot.user:
         return
-
-    _cleanup_stale_challenge_state()
 
     if QUIZ_DEBUG and (message.author.bot or message.embeds):
         author_bits = [
@@ -930,25 +1300,27 @@ async def on_message(message):
 
     if not message.author.bot:
         challenge_state = challenge_confirmation_states.get(message.author.id)
+        if challenge_state and _challenge_state_expired(challenge_state, time.time()):
+            _drop_challenge_state(message.author.id)
+            challenge_state = None
         if challenge_state and message.channel.id == challenge_state.get("channel_id"):
             content = (message.content or "").strip().lower()
             if content in {"y", "yes"}:
                 challenge_confirmation_states.pop(message.author.id, None)
-                if message.author.id in pending_smart_tracks and "challenge" in pending_smart_tracks[message.author.id]:
-                    pending_smart_tracks[message.author.id].pop("challenge", None)
-                    if not pending_smart_tracks[message.author.id]:
-                        pending_smart_tracks.pop(message.author.id, None)
-                _start_challenge_cooldown(message.author.id, message.channel.id, source="user_accept")
+                pending_smart_tracks.remove(message.author.id, "challenge")
+                _start_challenge_cooldown(
+                    message.author.id,
+                    message.channel.id,
+                    message.guild.id if message.guild else None,
+                    source="user_accept",
+                )
                 try:
                     await message.channel.send("🥊 Challenge accepted! Challenge cooldown synced for 30m.")
                 except Exception:
                     pass
             elif content in {"n", "no", "exit"}:
                 challenge_confirmation_states.pop(message.author.id, None)
-                if message.author.id in pending_smart_tracks and "challenge" in pending_smart_tracks[message.author.id]:
-                    pending_smart_tracks[message.author.id].pop("challenge", None)
-                    if not pending_smart_tracks[message.author.id]:
-                        pending_smart_tracks.pop(message.author.id, None)
+                pending_smart_tracks.remove(message.author.id, "challenge")
                 try:
                     await message.channel.send("❌ Challenge canceled. No cooldown started.")
                 except Exception:
@@ -979,91 +1351,84 @@ async def on_message(message):
                         detected_cmd_from_message = name
                         break
                 
-                for user_id, user_commands in list(pending_smart_tracks.items()):
-                    cmd_to_process = None
+                # Only waiters in this channel can own the reply.
+                waiter = pending_smart_tracks.match(message.channel.id, detected_cmd_from_message)
+                if waiter:
+                    user_id, cmd_to_process, track_info = waiter
+                    channel_id = track_info["channel_id"]
+                    track_event = track_info.get("event")
                     
-                    if detected_cmd_from_message and detected_cmd_from_message in user_commands:
-                        cmd_to_process = detected_cmd_from_message
-                    elif len(user_commands) == 1:
-                        cmd_to_process = list(user_commands.keys())[0]
+                    print(f"📝 Processing {cmd_to_process} for user {user_id}")
+                    print(f"⏰ Existing cooldown found: {time_secs}s for {cmd_to_process}")
                     
-                    if cmd_to_process and message.channel.id == user_commands[cmd_to_process]["channel_id"]:
-                        track_info = user_commands[cmd_to_process]
-                        channel_id = track_info["channel_id"]
-                        track_event = track_info.get("event")
-                        
-                        print(f"📝 Processing {cmd_to_process} for user {user_id}")
-                        print(f"⏰ Existing cooldown found: {time_secs}s for {cmd_to_process}")
-                        
-                        if track_event and not track_event.is_set():
-                            track_event.set()
+                    if track_event and not track_event.is_set():
+                        track_event.set()
 
-                        del pending_smart_tracks[user_id][cmd_to_process]
-                        if not pending_smart_tracks[user_id]:
-                            del pending_smart_tracks[user_id]
-                        
-                        detected_cmd = None
-                        for name in cooldown_times.keys():
-                            if name in full_text.lower():
-                                detected_cmd = name
-                                break
-                        if not detected_cmd:
-                            detected_cmd = cmd_to_process
-                        
-                        cooldowns.setdefault(user_id, {})[detected_cmd] = {
-                            "expires_at": time.time() + time_secs,
-                            "channel_id": channel_id,
-                            "notified": False
-                        }
-                        save_cooldowns()
+                    pending_smart_tracks.remove(user_id, cmd_to_process, track_info)
+                    
+                    detected_cmd = None
+                    for name in cooldown_times.keys():
+                        if name in full_text.lower():
+                            detected_cmd = name
+                            break
+                    if not detected_cmd:
+                        detected_cmd = cmd_to_process
+                    
+                    cooldown_store.set(
+                        user_id,
+                        detected_cmd,
+                        time.time() + time_secs,
+                        channel_id,
+                        message.guild.id if message.guild else None,
+                    )
+                    
+                    emoji = cooldown_emojis.get(detected_cmd, "⏰")
+                    time_str = format_time(time_secs)
+                    
+                    if should_show_progress_bar(detected_cmd):
+                        embed = discord.Embed(
+                            title=f"{emoji} {detected_cmd.upper()} Cooldown Detected!",
+                            description=f"Naruto Botto already had this on cooldown—synced instantly!",
+                            color=cooldown_colors.get(detected_cmd, discord.Color.blue())
+                        )
                         
-                        emoji = cooldown_emojis.get(detected_cmd, "⏰")
-                        time_str = format_time(time_secs)
+                        total_time = cooldown_times.get(detected_cmd, time_secs)
+                        elapsed = max(0, total_time - time_secs)
+                        progress = get_progress_bar(elapsed, total_time)
                         
-                        if should_show_progress_bar(detected_cmd):
-                            embed = discord.Embed(
-                                title=f"{emoji} {detected_cmd.upper()} Cooldown Detected!",
-                                description=f"Naruto Botto already had this on cooldown—synced instantly!",
-                                color=cooldown_colors.get(detected_cmd, discord.Color.blue())
-                            )
-                            
-                            total_time = cooldown_times.get(detected_cmd, time_secs)
-                            elapsed = max(0, total_time - time_secs)
-                            progress = get_progress_bar(elapsed, total_time)
-                            
-                            embed.add_field(name="⏰ Time Remaining", value=f"**{time_str}**", inline=True)
-                            embed.add_field(name="📊 Progress", value=progress, inline=False)
-                            embed.add_field(name="✅ Status", value="Reminder armed. I'll ping you exactly on time!", inline=False)
-                            embed.set_footer(text=f"Synced live from Naruto Botto ⚡")
-                            
-                            try:
-                                channel = bot.get_channel(channel_id)
-                                if channel:
-                                    await channel.send(embed=embed)
-                            except Exception as e:
-                                print(f"Error sending existing cooldown: {e}")
-                        else:
-                            fun_msg = random.choice(entertaining_messages.get(detected_cmd, ["Tracked!"]))
-                            message_text = (
-                                f"{emoji} **{detected_cmd.upper()} synced!** {time_str} left on cooldown.\n"
-                                f"🔔 Reminder is set—I'll ping you when it's game time.\n{fun_msg}"
-                            )
-                            
-                            try:
-                                channel = bot.get_channel(channel_id)
-                                if channel:
-                                    await channel.send(message_text)
-                            except Exception as e:
-                                print(f"Error sending existing cooldown: {e}")
+                        embed.add_field(name="⏰ Time Remaining", value=f"**{time_str}**", inline=True)
+                        embed.add_field(name="📊 Progress", value=progress, inline=False)
+                        embed.add_field(name="✅ Status", value="Reminder armed. I'll ping you exactly on time!", inline=False)
+                        embed.set_footer(text=f"Synced live from Naruto Botto ⚡")
                         
-                        emoji_react = cooldown_emojis.get(detected_cmd, "⏰")
                         try:
-                            await message.add_reaction(emoji_react)
-                        except:
-                            pass
+                            channel = bot.get_channel(channel_id)
+                            if channel:
+                                await channel.send(embed=embed)
+                        except Exception as e:
+                            print(f"Error sending existing cooldown: {e}")
+                    else:
+                        fun_msg = random.choice(entertaining_messages.get(detected_cmd, ["Tracked!"]))
+                        message_text = (
+                            f"{emoji} **{detected_cmd.upper()} synced!** {time_str} left on cooldown.\n"
+                            f"🔔 Reminder is set—I'll ping you when it's game time.\n{fun_msg}"
+                        )
                         
-                        return
-        
+                        try:
+                            channel = bot.get_channel(channel_id)
+                            if channel:
+                                await channel.send(message_text)
+                        except Exception as e:
+                            print(f"Error sending existing cooldown: {e}")
+                    
+                    emoji_react = cooldown_emojis.get(detected_cmd, "⏰")
+                    try:
+                        await message.add_reaction(emoji_react)
+                    except:
+                        pass
+                    
+                    return
+    
         if "cooldown" in full_text.lower() and message.mentions:
             time_secs = parse_time_string(full_text)
             if time_secs > 0:
@@ -1076,13 +1441,14 @@ async def on_message(message):
                 if not detected:
                     detected = "mission"
                 
-                if user.id not in pending_smart_tracks or detected not in pending_smart_tracks.get(user.id, {}):
-                    cooldowns.setdefault(user.id, {})[detected] = {
-                        "expires_at": time.time() + time_secs,
-                        "channel_id": message.channel.id,
-                        "notified": False
-                    }
-                    save_cooldowns()
+                if not pending_smart_tracks.has(user.id, detected):
+                    cooldown_store.set(
+                        user.id,
+                        detected,
+                        time.time() + time_secs,
+                        message.channel.id,
+                        message.guild.id if message.guild else None,
+                    )
                     
                     emoji = cooldown_emojis.get(detected, "⏰")
                     try:
@@ -1163,17 +1529,17 @@ async def track_cooldown_smart(ctx, cmd):
                 await ctx.send(message)
             return
 
-        if user_id not in pending_smart_tracks:
-            pending_smart_tracks[user_id] = {}
-
         track_event = asyncio.Event()
-        pending_smart_tracks[user_id][cmd] = {
-            "channel_id": ctx.channel.id,
-            "timestamp": time.time(),
-            "event": track_event,
-            "resync_only": True,
-            "previous_remaining": remaining,
-        }
+        track = pending_smart_tracks.add(
+            user_id,
+            cmd,
+            ctx.channel.id,
+            SMART_TRACK_TTL_SECONDS,
+            timestamp=time.time(),
+            event=track_event,
+            resync_only=True,
+            previous_remaining=remaining,
+        )
         print(f"🔄 Resync check armed for {cmd} while already on cooldown (user: {user_id})")
         try:
             await ctx.message.add_reaction("👀")
@@ -1184,16 +1550,10 @@ async def track_cooldown_smart(ctx, cmd):
         except asyncio.TimeoutError:
             pass
 
-        if user_id in pending_smart_tracks and cmd in pending_smart_tracks[user_id]:
-            del pending_smart_tracks[user_id][cmd]
-            if not pending_smart_tracks[user_id]:
-                del pending_smart_tracks[user_id]
+        if pending_smart_tracks.remove(user_id, cmd, track) is not None:
             print(f"ℹ️ No fresh Naruto Botto timer detected for {cmd}; keeping existing cooldown")
         return
     
-    if user_id not in pending_smart_tracks:
-        pending_smart_tracks[user_id] = {}
-
     if cmd == "challenge":
         challenge_confirmation_states[user_id] = {
             "channel_id": ctx.channel.id,
@@ -1201,11 +1561,9 @@ async def track_cooldown_smart(ctx, cmd):
         }
 
     track_event = asyncio.Event()
-    pending_smart_tracks[user_id][cmd] = {
-        "channel_id": ctx.channel.id,
-        "timestamp": time.time(),
-        "event": track_event
-    }
+    # A challenge track outlives the wait while its confirmation prompt is pending.
+    ttl = SMART_TRACK_TTL_SECONDS + (CHALLENGE_PENDING_TTL_SECONDS if cmd == "challenge" else 0)
+    track = pending_smart_tracks.add(user_id, cmd, ctx.channel.id, ttl, timestamp=time.time(), event=track_event)
 
     print(f"⏳ Waiting for Naruto Botto response for {cmd} (user: {user_id})")
 
@@ -1219,7 +1577,7 @@ async def track_cooldown_smart(ctx, cmd):
     except asyncio.TimeoutError:
         pass
     
-    if user_id in pending_smart_tracks and cmd in pending_smart_tracks[user_id]:
+    if pending_smart_tracks.get(user_id, cmd) is track:
         if cmd == "challenge":
             challenge_confirmation_states[user_id] = {
                 "channel_id": ctx.channel.id,
@@ -1234,16 +1592,15 @@ async def track_cooldown_smart(ctx, cmd):
 
         print(f"⏰ No Naruto Botto response detected, starting fresh timer for {cmd}")
         
-        del pending_smart_tracks[user_id][cmd]
-        if not pending_smart_tracks[user_id]:
-            del pending_smart_tracks[user_id]
+        pending_smart_tracks.remove(user_id, cmd, track)
         
-        cooldowns.setdefault(user_id, {})[cmd] = {
-            "expires_at": time.time() + cooldown_times[cmd],
-            "channel_id": ctx.channel.id,
-            "notified": False
-        }
-        save_cooldowns()
+        cooldown_store.set(
+            user_id,
+            cmd,
+            time.time() + cooldown_times[cmd],
+            ctx.channel.id,
+            ctx.guild.id if ctx.guild else None,
+        )
         
         duration = format_time(cooldown_times[cmd])
         
@@ -1267,9 +1624,8 @@ async def track_cooldown_smart(ctx, cmd):
 
 @bot.command(name="dashboard", aliases=["db", "status"])
 async def dashboard(ctx, *, member_ref: str = None):
-    load_cooldowns()
     member = await _resolve_member_reference(ctx, member_ref)
-    user_rows = list(cooldowns.get(member.id, {}).values())
+    user_rows = await get_user_cooldowns(member.id)
     if not user_rows:
         embed = discord.Embed(
             title=f"🎌 {member.display_name}'s Dashboard",
@@ -1297,9 +1653,8 @@ async def dashboard(ctx, *, member_ref: str = None):
     active_lines = []
     expired_lines = []
 
-    for row in user_rows:
-        cmd = row.get("command", "unknown")
-        remaining = float(row["expires_at"]) - now
+    for cmd, row in user_rows.items():
+        remaining = row.expires_at - now
         emoji = cooldown_emojis.get(cmd, "⏰")
         label = f"{emoji} **{cmd.upper()}**"
 
@@ -1343,7 +1698,7 @@ async def cooldown_group(ctx):
         )
         embed.add_field(
             name="Available Commands",
-            value="```\nn cd list              - Show all server cooldowns\nn cd user @member      - Check user's cooldowns\nn cd clear @member     - Clear all user cooldowns\nn cd db                - Inspect the SQLite database```",
+            value="```\nn cd list              - Show all server cooldowns\nn cd user @member      - Check user's cooldowns\nn cd clear @member     - Clear all user cooldowns\nn cd db                - Inspect the SQLite database\nn cd d1                - Cloudflare D1 latency and errors\nn cd notify            - Reminder lag, sends and queue depth```",
             inline=False
         )
         await ctx.send(embed=embed)
@@ -1351,7 +1706,11 @@ async def cooldown_group(ctx):
 @cooldown_group.command(name="list", aliases=["all", "show"])
 @commands.has_permissions(manage_guild=True)
 async def list_cooldowns(ctx):
-    if not cooldowns:
+    server_cooldowns = {}
+    for user_id, cmd, data in cooldown_store.guild_items(ctx.guild.id):
+        server_cooldowns.setdefault(user_id, {})[cmd] = data
+
+    if not server_cooldowns:
         await ctx.send("📋 No active cooldowns right now! Everyone's ready to go!")
         return
     
@@ -1364,36 +1723,36 @@ async def list_cooldowns(ctx):
     now = time.time()
     total_cooldowns = 0
     
-    for user_id, cmds in cooldowns.items():
-        try:
-            user = await bot.fetch_user(user_id)
-            user_cooldowns = []
-            for cmd, data in cmds.items():
-                remaining = data["expires_at"] - now
-                if remaining > 0:
-                    emoji = cooldown_emojis.get(cmd, "⏰")
-                    time_str = format_time(remaining)
-                    user_cooldowns.append(f"{emoji} **{cmd}**: {time_str}")
-                    total_cooldowns += 1
-            
-            if user_cooldowns:
-                embed.add_field(
-                    name=f"👤 {user.display_name}",
-                    value="\n".join(user_cooldowns),
-                    inline=False
-                )
-        except:
-            pass
+    active_users = [
+        user_id for user_id, cmds in server_cooldowns.items()
+        if any(data.expires_at > now for data in cmds.values())
+    ]
+    names = await _display_names(active_users, ctx.guild)
+    for user_id, cmds in server_cooldowns.items():
+        user_cooldowns = []
+        for cmd, data in cmds.items():
+            remaining = data.expires_at - now
+            if remaining > 0:
+                emoji = cooldown_emojis.get(cmd, "⏰")
+                time_str = format_time(remaining)
+                user_cooldowns.append(f"{emoji} **{cmd}**: {time_str}")
+                total_cooldowns += 1
+        
+        if user_cooldowns:
+            embed.add_field(
+                name=f"👤 {names[user_id]}",
+                value="\n".join(user_cooldowns),
+                inline=False
+            )
     
     embed.set_footer(text=f"Total: {total_cooldowns} active cooldowns")
     await ctx.send(embed=embed)
 
 @cooldown_group.command(name="user", aliases=["check", "u"])
 async def check_user(ctx, *, member_ref: str = None):
-    load_cooldowns()
     member = await _resolve_member_reference(ctx, member_ref)
     
-    user_cooldowns = cooldowns.get(member.id, {})
+    user_cooldowns = await get_user_cooldowns(member.id)
     
     if not user_cooldowns:
         await ctx.send(f"✅ {member.mention} has no active cooldowns! Ready for action!")
@@ -1409,7 +1768,7 @@ async def check_user(ctx, *, member_ref: str = None):
     ready = []
     
     for cmd, data in user_cooldowns.items():
-        remaining = data["expires_at"] - now
+        remaining = data.expires_at - now
         emoji = cooldown_emojis.get(cmd, "⏰")
         
         if remaining > 0:
@@ -1428,48 +1787,44 @@ async def check_user(ctx, *, member_ref: str = None):
 @cooldown_group.command(name="clear", aliases=["reset", "remove"])
 @commands.has_permissions(manage_guild=True)
 async def clear_cooldown(ctx, member: discord.Member, activity: str = None):
-    if member.id not in cooldowns:
+    if not await get_user_cooldowns(member.id):
         await ctx.send(f"❌ {member.mention} has no active cooldowns!")
         return
     
     if activity:
         activity = aliases.get(activity.lower(), activity.lower())
-        if activity in cooldowns[member.id]:
-            cooldowns[member.id].pop(activity)
-            if not cooldowns[member.id]:
-                cooldowns.pop(member.id)
-            save_cooldowns()
+        if cooldown_store.remove(member.id, activity):
             emoji = cooldown_emojis.get(activity, "✅")
             await ctx.send(f"{emoji} Cleared **{activity}** cooldown for {member.mention}!")
         else:
             await ctx.send(f"❌ {member.mention} doesn't have an active **{activity}** cooldown!")
     else:
-        cooldowns.pop(member.id)
-        save_cooldowns()
+        cooldown_store.clear_user(member.id)
         await ctx.send(f"✅ Cleared all cooldowns for {member.mention}!")
 
 @cooldown_group.command(name="db", aliases=["inspect", "sqlite", "raw"])
 @commands.has_permissions(manage_guild=True)
 async def inspect_cooldown_db(ctx):
-    init_database()
     now = time.time()
 
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(
-                """
-                SELECT CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id, notified
-                FROM cooldowns
-                ORDER BY expires_at ASC
-                """
-            ).fetchall()
-    except Exception as e:
-        await ctx.send(f"❌ Failed to inspect SQLite database: {e}")
-        return
+    if cooldown_journal is not None:
+        # The table is not kept current in journal mode; show the store the journal persists.
+        rows = sorted(
+            (
+                {"user_id": user_id, "command": cmd, "expires_at": data.expires_at}
+                for user_id, cmd, data in cooldown_store.guild_items(ctx.guild.id)
+            ),
+            key=lambda row: row["expires_at"],
+        )
+    else:
+        try:
+            rows = await db.read(storage.guild_cooldowns, ctx.guild.id)
+        except Exception as e:
+            await ctx.send(f"❌ Failed to inspect SQLite database: {e}")
+            return
 
     if not rows:
-        await ctx.send("📭 SQLite database is empty. No cooldowns are stored right now.")
+        await ctx.send("📭 No cooldowns are stored for this server right now.")
         return
 
     active_count = sum(1 for row in rows if float(row["expires_at"]) > now)
@@ -1477,7 +1832,11 @@ async def inspect_cooldown_db(ctx):
 
     embed = discord.Embed(
         title="🗄️ Cooldown Database Snapshot",
-        description="Live view of the SQLite cooldown store.",
+        description=(
+            "Live view of this server's records in the cooldown journal."
+            if cooldown_journal is not None
+            else "Live view of this server's rows in the SQLite cooldown store."
+        ),
         color=discord.Color.teal(),
     )
     embed.add_field(name="Total Rows", value=str(len(rows)), inline=True)
@@ -1500,6 +1859,93 @@ async def inspect_cooldown_db(ctx):
     embed.set_footer(text="Use n cd list or n cd user for friendlier views")
     await ctx.send(embed=embed)
 
+
+def _format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+@cooldown_group.command(name="d1", aliases=["storage", "latency"])
+@commands.has_permissions(manage_guild=True)
+async def inspect_d1_metrics(ctx):
+    if d1_client is None:
+        await ctx.send("🗄️ Cloudflare D1 is not enabled; storage is local SQLite.")
+        return
+
+    snapshot = metrics.snapshot("d1.")
+    counters = snapshot["counters"]
+    embed = discord.Embed(
+        title="☁️ Cloudflare D1 Health",
+        description=f"Circuit breaker: `{d1_client.breaker.state}` | Spooled transactions: `{d1_write_through.pending}`",
+        color=discord.Color.teal() if d1_client.breaker.state == "closed" else discord.Color.orange(),
+    )
+    for operation in ("query", "batch"):
+        latency = snapshot["histograms"].get(f"d1.{operation}.latency")
+        if latency is None:
+            continue
+        errors = ", ".join(
+            f"{kind} {counters.get(f'd1.{operation}.errors.{kind}', 0)}"
+            for kind in ("transient", "rejected", "circuit_open")
+        )
+        embed.add_field(
+            name=f"`{operation}` ({latency['count']} requests)",
+            value=(
+                f"p50 `{_format_ms(latency['p50'])}` | p95 `{_format_ms(latency['p95'])}` | "
+                f"p99 `{_format_ms(latency['p99'])}` | max `{_format_ms(latency['max'])}`\n"
+                f"ok {counters.get(f'd1.{operation}.ok', 0)} | retries {counters.get(f'd1.{operation}.retries', 0)} | {errors}"
+            ),
+            inline=False,
+        )
+    embed.set_footer(text="Latency percentiles are bucketed and cover every request since startup")
+    await ctx.send(embed=embed)
+
+@cooldown_group.command(name="notify", aliases=["notifications", "lag"])
+@commands.has_permissions(manage_guild=True)
+async def inspect_notification_metrics(ctx):
+    global _notify_sends_checkpoint
+    snapshot = metrics.snapshot("notify.")
+    histograms, counters = snapshot["histograms"], snapshot["counters"]
+    sends = {kind: counters.get(f"notify.sends.{kind}", 0) for kind in ("ok", "failed", "rate_limited")}
+    now = time.monotonic()
+    since, ok_before = _notify_sends_checkpoint or (metrics.started, 0)
+    _notify_sends_checkpoint = (now, sends["ok"])
+    window = max(now - since, 1)
+    embed = discord.Embed(
+        title="⏰ Ready Notification Health",
+        description=(
+            f"Outbox: `{notification_outbox.pending}` | Dispatcher queue: `{notification_dispatcher.pending}` | "
+            f"Sends/s: `{(sends['ok'] - ok_before) / window:.2f}` over the last {format_time(window)}"
+        ),
+        color=discord.Color.teal(),
+    )
+    for name, label in [("notify.lag", "All reminders")] + [(f"notify.lag.{cmd}", cmd) for cmd in cooldown_emojis]:
+        lag = histograms.get(name)
+        if lag is None:
+            continue
+        embed.add_field(
+            name=f"Lag: {label} ({lag['count']})",
+            value=(
+                f"p50 `{_format_ms(lag['p50'])}` | p95 `{_format_ms(lag['p95'])}` | "
+                f"p99 `{_format_ms(lag['p99'])}` | max `{_format_ms(lag['max'])}`"
+            ),
+            inline=False,
+        )
+    send_latency = histograms.get("notify.send.latency") or {}
+    embed.add_field(
+        name="Sends",
+        value=(
+            f"ok {sends['ok']} | failed {sends['failed']} | rate limited {sends['rate_limited']} | "
+            f"p99 `{_format_ms(send_latency.get('p99'))}`\n"
+            f"delivered {counters.get('notify.delivered', 0)} | dropped {counters.get('notify.dropped', 0)} | "
+            f"queue depth p99 `{(histograms.get('notify.queue_depth') or {}).get('p99', '-')}`"
+        ),
+        inline=False,
+    )
+    embed.set_footer(
+        text="Sends/s covers the time since the previous check (or startup). "
+        "Lag runs from a cooldown's expiry to the completed send; percentiles are bucketed"
+    )
+    await ctx.send(embed=embed)
+
 @bot.group(name="quiz", aliases=["qc", "quizcache"])
 async def quiz_group(ctx):
     if ctx.invoked_subcommand is None:
@@ -1530,7 +1976,7 @@ async def quiz_group(ctx):
 @commands.has_permissions(manage_guild=True)
 async def quiz_temp(ctx, limit: int = 5):
     limit = max(1, min(int(limit or 5), 10))
-    groups = _quiz_get_review_candidates(limit)
+    groups = await _quiz_get_review_candidates(limit)
 
     if not groups:
         await ctx.send("📭 No temporary quiz candidates right now.")
@@ -1543,7 +1989,7 @@ async def quiz_temp(ctx, limit: int = 5):
     )
 
     for idx, group in enumerate(groups, start=1):
-        candidates = _quiz_get_review_candidates_for_key(group["question_key"])
+        candidates = await _quiz_get_review_candidates_for_key(group["question_key"])
         question = _truncate_text(group["question_text"], 110)
         lines = [
             f"Key: `{group['question_key'][:10]}`",
@@ -1587,7 +2033,7 @@ async def quiz_perm_view(ctx, question_ref: str = None):
     if not question_ref or not str(question_ref).strip():
         await ctx.send("❌ Usage: `n quiz perm view <ref>`")
         return
-    entry, error = _quiz_resolve_permanent_reference(question_ref)
+    entry, error = await _quiz_resolve_permanent_reference(question_ref)
     if error == "ambiguous":
         await ctx.send(
             f"❌ Ref `{question_ref}` matches multiple permanent entries. Use a longer key prefix or more specific question text."
@@ -1624,7 +2070,7 @@ async def quiz_perm_page(ctx, page: int = 1, limit: int = 5):
 
 
 async def quiz_perm_browse(ctx, page: int = 1, limit: int = 5):
-    embed, rows, total_pages, page = _quiz_build_permanent_page_embed(page, limit)
+    embed, rows, total_pages, page = await _quiz_build_permanent_page_embed(page, limit)
     if not rows:
         await ctx.send(embed=embed)
         return
@@ -1639,7 +2085,7 @@ async def quiz_perm_browse(ctx, page: int = 1, limit: int = 5):
 @quiz_perm_group.command(name="edit", aliases=["set", "update"])
 @commands.has_permissions(manage_guild=True)
 async def quiz_perm_edit(ctx, question_ref: str, answer_index: int, *, answer_text: str = None):
-    entry, error = _quiz_resolve_permanent_reference(question_ref)
+    entry, error = await _quiz_resolve_permanent_reference(question_ref)
     if error == "ambiguous":
         await ctx.send(
             f"❌ Ref `{question_ref}` matches multiple permanent entries. Use a longer key prefix or more specific question text."
@@ -1660,7 +2106,7 @@ async def quiz_perm_edit(ctx, question_ref: str, answer_index: int, *, answer_te
         await ctx.send("❌ Please provide an `answer_text`, or use a valid `answer_index` that matches the stored options.")
         return
 
-    _quiz_update_permanent_entry(entry["question_key"], int(answer_index), str(answer_text).strip(), provider="manual")
+    await _quiz_update_permanent_entry(entry["question_key"], int(answer_index), str(answer_text).strip(), provider="manual")
     quiz_log(
         f"Manually edited permanent quiz entry question_key={entry['question_key'][:10]} answer={int(answer_index)}"
     )
@@ -1671,7 +2117,7 @@ async def quiz_perm_edit(ctx, question_ref: str, answer_index: int, *, answer_te
 @quiz_group.command(name="confirm", aliases=["save"])
 @commands.has_permissions(manage_guild=True)
 async def quiz_confirm(ctx, *, candidate_refs: str):
-    candidates, error = _quiz_resolve_review_candidates(candidate_refs, ctx=ctx)
+    candidates, error = await _quiz_resolve_review_candidates(candidate_refs, ctx=ctx)
     if error == "empty":
         await ctx.send("❌ Provide at least one temporary quiz ref.")
         return
@@ -1682,7 +2128,7 @@ async def quiz_confirm(ctx, *, candidate_refs: str):
     saved = []
     for candidate in candidates:
         options = candidate["options_text"].split("\n")
-        _quiz_store_permanent(
+        await _quiz_store_permanent(
             candidate["question_key"],
             candidate["question_text"],
             options,
@@ -1690,7 +2136,7 @@ async def quiz_confirm(ctx, *, candidate_refs: str):
             candidate["answer_text"],
             candidate["provider"] or "manual",
         )
-        _quiz_delete_review_candidates_for_key(candidate["question_key"])
+        await _quiz_delete_review_candidates_for_key(candidate["question_key"])
         quiz_log(
             f"Manually confirmed quiz candidate id={candidate['id']} question_key={candidate['question_key'][:10]} answer={candidate['answer_index']}"
         )
@@ -1717,7 +2163,7 @@ async def quiz_delete(ctx, *, candidate_refs: str):
         await ctx.send("❌ Provide at least one temporary quiz ref before the scope option.")
         return
 
-    candidates, error = _quiz_resolve_review_candidates(" ".join(tokens), ctx=ctx)
+    candidates, error = await _quiz_resolve_review_candidates(" ".join(tokens), ctx=ctx)
     if not candidates:
         await ctx.send(f"❌ No temporary quiz candidate found for `{', '.join(tokens)}`.")
         return
@@ -1726,8 +2172,8 @@ async def quiz_delete(ctx, *, candidate_refs: str):
     if scope_value in {"question", "all", "purge", "queue"}:
         total_removed = 0
         for candidate in candidates:
-            removed = len(_quiz_get_review_candidates_for_key(candidate["question_key"]))
-            _quiz_delete_review_candidates_for_key(candidate["question_key"])
+            removed = len(await _quiz_get_review_candidates_for_key(candidate["question_key"]))
+            await _quiz_delete_review_candidates_for_key(candidate["question_key"])
             total_removed += removed
             deleted.append(f"`{candidate['question_key'][:10]}`({removed})")
             quiz_log(
@@ -1736,7 +2182,7 @@ async def quiz_delete(ctx, *, candidate_refs: str):
         message = f"🗑️ Removed {total_removed} temp candidate(s) across {len(candidates)} question(s): {', '.join(deleted)}."
     else:
         for candidate in candidates:
-            _quiz_delete_review_candidate(candidate["id"])
+            await _quiz_delete_review_candidate(candidate["id"])
             deleted.append(f"`{candidate['id']}`")
             quiz_log(
                 f"Manually deleted quiz temp candidate id={candidate['id']} question_key={candidate['question_key'][:10]}"
@@ -1810,9 +2256,6 @@ async def ping_slash(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed)
 
-def _normalize_quiz_text(text: str) -> str:
-    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9]+", " ", text.lower())).strip()
-
 def quiz_log(message: str):
     if QUIZ_DEBUG:
         print(f"[QUIZ] {message}", flush=True)
@@ -1825,158 +2268,46 @@ def _quiz_options_text(options):
     return "\n".join(options)
 
 def _quiz_question_key(question_text: str, options) -> str:
-    normalized = _normalize_quiz_text(question_text)
-    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
-
-def _quiz_lookup_permanent(question_key: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute(
-            """
-            SELECT question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at
-            FROM quiz_cache
-            WHERE question_key = ?
-            """,
-            (question_key,),
-        ).fetchone()
-    return row
-
-def _quiz_lookup_candidate(question_key: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute(
-            """
-            SELECT id, answer_index, answer_text, provider, seen_count
-            FROM quiz_review_candidates
-            WHERE question_key = ?
-            ORDER BY last_seen_at DESC, id DESC
-            LIMIT 1
-            """,
-            (question_key,),
-        ).fetchone()
-    return row
-
-def _quiz_store_candidate(question_key: str, question_text: str, options, answer_index: int, answer_text: str, provider: str):
-    now = time.time()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO quiz_review_candidates (
-                question_key, question_text, options_text, answer_index, answer_text,
-                provider, seen_count, first_seen_at, last_seen_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
-            ON CONFLICT(question_key, provider, answer_index) DO UPDATE SET
-                question_text=excluded.question_text,
-                options_text=excluded.options_text,
-                answer_text=excluded.answer_text,
-                seen_count=quiz_review_candidates.seen_count + 1,
-                last_seen_at=excluded.last_seen_at
-            """,
-            (
-                question_key,
-                question_text,
-                _quiz_options_text(options),
-                int(answer_index),
-                answer_text,
-                provider,
-                now,
-                now,
-            ),
-        )
+    return quiz_question_key(question_text)
 
-def _quiz_promote_candidate(question_key: str, question_text: str, options, answer_index: int, answer_text: str, provider: str):
-    now = time.time()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO quiz_cache (
-                question_key, question_text, options_text, answer_index, answer_text,
-                provider, created_at, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(question_key) DO UPDATE SET
-                question_text=excluded.question_text,
-                options_text=excluded.options_text,
-                answer_index=excluded.answer_index,
-                answer_text=excluded.answer_text,
-                provider=excluded.provider,
-                updated_at=excluded.updated_at
-            """,
-            (
-                question_key,
-                question_text,
-                _quiz_options_text(options),
-                int(answer_index),
-                answer_text,
-                provider,
-                now,
-                now,
-            ),
-        )
-        conn.execute("DELETE FROM quiz_review_candidates WHERE question_key = ?", (question_key,))
+async def _quiz_lookup_permanent(question_key: str):
+    return await db.read(storage.quiz_lookup, question_key)
+
+async def _quiz_lookup_candidate(question_key: str):
+    return await db.read(storage.candidate_latest, question_key)
+
+async def _quiz_store_candidate(question_key: str, question_text: str, options, answer_index: int, answer_text: str, provider: str):
+    await db.write(
+        storage.candidate_store,
+        question_key, question_text, _quiz_options_text(options), answer_index, answer_text, provider, time.time(),
+    )
+
+async def _quiz_promote_candidate(question_key: str, question_text: str, options, answer_index: int, answer_text: str, provider: str):
+    await _quiz_store_permanent(question_key, question_text, options, answer_index, answer_text, provider)
     quiz_log(f"Promoted quiz question to permanent cache: {question_key}")
 
-def _quiz_store_permanent(question_key: str, question_text: str, options, answer_index: int, answer_text: str, provider: str):
-    now = time.time()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO quiz_cache (
-                question_key, question_text, options_text, answer_index, answer_text,
-                provider, created_at, updated_at
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(question_key) DO UPDATE SET
-                question_text=excluded.question_text,
-                options_text=excluded.options_text,
-                answer_index=excluded.answer_index,
-                answer_text=excluded.answer_text,
-                provider=excluded.provider,
-                updated_at=excluded.updated_at
-            """,
-            (
-                question_key,
-                question_text,
-                _quiz_options_text(options),
-                int(answer_index),
-                answer_text,
-                provider,
-                now,
-                now,
-            ),
-        )
-        conn.execute("DELETE FROM quiz_review_candidates WHERE question_key = ?", (question_key,))
-
-def _quiz_list_permanent(limit_rows: int = 10, offset_rows: int = 0):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at
-            FROM quiz_cache
-            ORDER BY updated_at DESC
-            LIMIT ? OFFSET ?
-            """,
-            (int(limit_rows), int(offset_rows)),
-        ).fetchall()
-    return rows
-
-
-def _quiz_count_permanent():
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute("SELECT COUNT(*) AS total FROM quiz_cache").fetchone()
-    return int(row["total"]) if row else 0
-
-
-def _quiz_build_permanent_page_embed(page: int, limit: int):
+async def _quiz_store_permanent(question_key: str, question_text: str, options, answer_index: int, answer_text: str, provider: str):
+    await db.write(
+        storage.quiz_store,
+        question_key, question_text, _quiz_options_text(options), answer_index, answer_text, provider, time.time(),
+    )
+
+async def _quiz_list_permanent(limit_rows: int = 10, offset_rows: int = 0):
+    return await db.read(storage.quiz_list, limit_rows, offset_rows)
+
+
+async def _quiz_count_permanent():
+    return await db.read(storage.quiz_count)
+
+
+async def _quiz_build_permanent_page_embed(page: int, limit: int):
     page = max(1, int(page or 1))
     limit = max(1, min(int(limit or 5), 20))
-    total = _quiz_count_permanent()
+    total = await _quiz_count_permanent()
     total_pages = max(1, math.ceil(total / limit)) if total else 1
     page = min(page, total_pages)
     offset = (page - 1) * limit
-    rows = _quiz_list_permanent(limit, offset)
+    rows = await _quiz_list_permanent(limit, offset)
 
     embed = discord.Embed(
         title="📚 Permanent Quiz Cache",
@@ -2019,7 +2350,7 @@ class QuizPermBrowseView(discord.ui.View):
         self.limit = max(1, min(int(limit or 5), 20))
 
     async def _render(self, interaction: discord.Interaction):
-        embed, rows, total_pages, current_page = _quiz_build_permanent_page_embed(self.page, self.limit)
+        embed, rows, total_pages, current_page = await _quiz_build_permanent_page_embed(self.page, self.limit)
         self.page = current_page
         self.prev_button.disabled = self.page <= 1
         self.next_button.disabled = self.page >= total_pages
@@ -2053,7 +2384,7 @@ class QuizPermBrowseView(discord.ui.View):
 
     @discord.ui.button(label="Last", emoji="⏭️", style=discord.ButtonStyle.secondary)
     async def last_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        total = _quiz_count_permanent()
+        total = await _quiz_count_permanent()
         total_pages = max(1, math.ceil(total / self.limit)) if total else 1
         self.page = total_pages
         await self._render(interaction)
@@ -2065,83 +2396,26 @@ class QuizPermBrowseView(discord.ui.View):
                 child.disabled = True
         await interaction.response.edit_message(view=self)
 
-def _quiz_resolve_permanent_reference(question_ref: str):
+async def _quiz_resolve_permanent_reference(question_ref: str):
     ref = str(question_ref or "").strip()
     if not ref:
         return None, "empty"
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        if len(ref) >= 8:
-            rows = conn.execute(
-                """
-                SELECT question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at
-                FROM quiz_cache
-                WHERE question_key LIKE ?
-                ORDER BY updated_at DESC
-                """,
-                (f"{ref}%",),
-            ).fetchall()
-        else:
-            rows = []
-
-        if not rows:
-            rows = conn.execute(
-                """
-                SELECT question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at
-                FROM quiz_cache
-                WHERE LOWER(question_text) LIKE ?
-                ORDER BY updated_at DESC
-                """,
-                (f"%{_normalize_quiz_text(ref)}%",),
-            ).fetchall()
-
+    rows = await db.read(storage.quiz_search, ref)
     if not rows:
         return None, "not_found"
     if len(rows) > 1:
         return rows, "ambiguous"
     return rows[0], None
 
-def _quiz_update_permanent_entry(question_key: str, answer_index: int, answer_text: str, provider: str = "manual"):
-    now = time.time()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            UPDATE quiz_cache
-            SET answer_index = ?, answer_text = ?, provider = ?, updated_at = ?
-            WHERE question_key = ?
-            """,
-            (int(answer_index), answer_text, provider, now, question_key),
-        )
+async def _quiz_update_permanent_entry(question_key: str, answer_index: int, answer_text: str, provider: str = "manual"):
+    await db.write(storage.quiz_update, question_key, answer_index, answer_text, provider, time.time())
 
-def _quiz_get_review_candidates(limit_questions: int = 10):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT question_key, question_text, options_text, COUNT(*) AS candidate_count, MAX(last_seen_at) AS last_seen_at
-            FROM quiz_review_candidates
-            GROUP BY question_key, question_text, options_text
-            ORDER BY last_seen_at DESC
-            LIMIT ?
-            """,
-            (int(limit_questions),),
-        ).fetchall()
-    return rows
-
-def _quiz_get_review_candidates_for_key(question_key: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT id, question_key, question_text, options_text, answer_index, answer_text, provider, seen_count, first_seen_at, last_seen_at
-            FROM quiz_review_candidates
-            WHERE question_key = ?
-            ORDER BY last_seen_at DESC, id DESC
-            """,
-            (question_key,),
-        ).fetchall()
-    return rows
+async def _quiz_get_review_candidates(limit_questions: int = 10):
+    return await db.read(storage.candidate_groups, limit_questions)
+
+async def _quiz_get_review_candidates_for_key(question_key: str):
+    return await db.read(storage.candidates_for_key, question_key)
 
 def _quiz_temp_view_key(ctx):
     guild_id = getattr(getattr(ctx, "guild", None), "id", None)
@@ -2176,27 +2450,17 @@ def _quiz_split_candidate_refs(candidate_refs: str):
     return [token for token in re.split(r"[,\s]+", raw) if token.strip()]
 
 
-def _quiz_get_review_candidate_by_id(candidate_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute(
-            """
-            SELECT id, question_key, question_text, options_text, answer_index, answer_text, provider, seen_count, first_seen_at, last_seen_at
-            FROM quiz_review_candidates
-            WHERE id = ?
-            """,
-            (int(candidate_id),),
-        ).fetchone()
-    return row
+async def _quiz_get_review_candidate_by_id(candidate_id: int):
+    return await db.read(storage.candidate_get, candidate_id)
 
 
-def _quiz_resolve_review_candidate_reference(candidate_ref: str, ctx=None):
+async def _quiz_resolve_review_candidate_reference(candidate_ref: str, ctx=None):
     ref = str(candidate_ref or "").strip()
     if not ref:
         return None, "empty"
 
     if ref.isdigit():
-        candidate = _quiz_get_review_candidate_by_id(int(ref))
+        candidate = await _quiz_get_review_candidate_by_id(int(ref))
         if candidate:
             return candidate, None
 
@@ -2207,22 +2471,12 @@ def _quiz_resolve_review_candidate_reference(candidate_ref: str, ctx=None):
                 index = int(ref)
                 if 1 <= index <= len(groups):
                     question_key = groups[index - 1]["question_key"]
-                    candidates = _quiz_get_review_candidates_for_key(question_key)
+                    candidates = await _quiz_get_review_candidates_for_key(question_key)
                     if candidates:
                         return candidates[0], None
                     return None, "not_found"
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(
-            """
-            SELECT id, question_key, question_text, options_text, answer_index, answer_text, provider, seen_count, first_seen_at, last_seen_at
-            FROM quiz_review_candidates
-            WHERE question_key LIKE ?
-            ORDER BY last_seen_at DESC, id DESC
-            """,
-            (f"{ref}%",),
-        ).fetchall()
+    rows = await db.read(storage.candidates_by_key_prefix, ref)
 
     if not rows:
         return None, "not_found"
@@ -2234,7 +2488,7 @@ def _quiz_resolve_review_candidate_reference(candidate_ref: str, ctx=None):
     return rows[0], None
 
 
-def _quiz_resolve_review_candidates(candidate_refs: str, ctx=None):
+async def _quiz_resolve_review_candidates(candidate_refs: str, ctx=None):
     tokens = _quiz_split_candidate_refs(candidate_refs)
     if not tokens:
         return [], "empty"
@@ -2244,7 +2498,7 @@ def _quiz_resolve_review_candidates(candidate_refs: str, ctx=None):
     errors = []
 
     for token in tokens:
-        candidate, error = _quiz_resolve_review_candidate_reference(token, ctx=ctx)
+        candidate, error = await _quiz_resolve_review_candidate_reference(token, ctx=ctx)
         if error == "ambiguous":
             errors.append(f"`{token}` matches multiple questions")
             continue
@@ -2264,13 +2518,11 @@ def _quiz_resolve_review_candidates(candidate_refs: str, ctx=None):
         return resolved, "; ".join(errors)
     return resolved, None
 
-def _quiz_delete_review_candidates_for_key(question_key: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM quiz_review_candidates WHERE question_key = ?", (question_key,))
+async def _quiz_delete_review_candidates_for_key(question_key: str):
+    await db.write(storage.delete_candidates_for_key, question_key)
 
-def _quiz_delete_review_candidate(candidate_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("DELETE FROM quiz_review_candidates WHERE id = ?", (int(candidate_id),))
+async def _quiz_delete_review_candidate(candidate_id: int):
+    await db.write(storage.delete_candidate, candidate_id)
 
 def _truncate_text(text: str, limit: int = 120) -> str:
     cleaned = re.sub(r"\s+", " ", str(text)).strip()
@@ -2688,7 +2940,7 @@ async def ask_gpt(question_text, options=None):
 
     question_key = _quiz_question_key(question_text, options)
 
-    cached = _quiz_lookup_permanent(question_key)
+    cached = await _quiz_lookup_permanent(question_key)
     if cached:
         cached_answer_text = str(cached["answer_text"] or "").strip()
         if cached_answer_text:
@@ -2714,7 +2966,7 @@ async def ask_gpt(question_text, options=None):
             result = await provider_fn(question_text, options)
             if result:
                 answer_index, answer_text = result
-                _quiz_store_candidate(question_key, question_text, options, answer_index, answer_text, provider_name)
+                await _quiz_store_candidate(question_key, question_text, options, answer_index, answer_text, provider_name)
                 quiz_log(
                     f"Stored temporary quiz answer: question_key={question_key[:10]} answer={answer_index} provider={provider_name}"
                 )
@@ -2729,7 +2981,7 @@ async def ask_gpt(question_text, options=None):
         if local_answer and local_answer in options:
             answer_index = options.index(local_answer) + 1
             answer_text = local_answer
-            _quiz_store_candidate(question_key, question_text, options, answer_index, answer_text, "local")
+            await _quiz_store_candidate(question_key, question_text, options, answer_index, answer_text, "local")
             quiz_log(f"Local fallback selected: {local_answer!r}")
             return answer_index
         quiz_log("Local fallback could not find a confident answer.")
@@ -2814,5 +3066,20 @@ async def on_message_edit(before, after):
     if ENABLE_GPT and after.author.bot and (after.embeds or after.components or after.content):
         await maybe_answer_quiz(after)
 
+init_database()
+db.start()
 keep_alive()
-bot.run(DISCORD_TOKEN)
+try:
+    bot.run(DISCORD_TOKEN)
+finally:
+    db.close()
+    sqlite_connections.close_all()
+    if d1_write_through is not None:
+        d1_write_through.close()
+    if replica_connections is not None:
+        replica_connections.close_all()
+    if d1_client is not None:
+        d1_client.close()
+    if cooldown_journal is not None:
+        cooldown_journal.close()
+    notification_outbox.close()
@@ -0,0 +1,157 @@
+import os
+import struct
+
+# One fixed-size little-endian record per change:
+# op, command_id, notified, user_id, expires_at, channel_id, guild_id.
+# Channel and guild IDs of 0 mean "unknown"; Discord snowflakes are never 0.
+_RECORD = struct.Struct("<BBBQdQQ")
+_MAGIC = b"CDJ1"
+
+OP_SET = 1
+OP_CLEAR = 2
+OP_NOTIFY = 3
+
+
+def _pack(op, user_id, command_id, expires_at=0.0, channel_id=None, guild_id=None, notified=False):
+    return _RECORD.pack(
+        op, command_id, 1 if notified else 0, int(user_id), float(expires_at), channel_id or 0, guild_id or 0
+    )
+
+
+def _read_records(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return b""
+    if not data.startswith(_MAGIC):
+        raise ValueError(f"{path} is not a cooldown journal file")
+    data = data[len(_MAGIC):]
+    # A crash mid-append can leave a partial record at the end; ignore it.
+    return data[: len(data) - len(data) % _RECORD.size]
+
+
+def _apply(state, data):
+    for op, command_id, notified, user_id, expires_at, channel_id, guild_id in _RECORD.iter_unpack(data):
+        key = (user_id, command_id)
+        if op == OP_SET:
+            state[key] = (expires_at, channel_id or None, guild_id or None, bool(notified))
+        elif op == OP_CLEAR:
+            state.pop(key, None)
+        elif op == OP_NOTIFY:
+            current = state.get(key)
+            if current is not None:
+                state[key] = current[:3] + (True,)
+    return state
+
+
+class CooldownJournal:
+    """Append-only cooldown log with periodic snapshot compaction.
+
+    Every set, clear and notify becomes one fixed-size record in ``<path>.log``.
+    :meth:`compact` folds the log into ``<path>.snap`` so boot only has to
+    replay the snapshot plus a short tail. Records hold absolute state, so
+    replaying one twice is harmless; that is what makes a crash between
+    writing a snapshot and dropping the old log safe.
+
+    Records are buffered in memory and written by :meth:`write`, which, like
+    :meth:`compact`, :meth:`write_snapshot` and :meth:`replay`, does blocking
+    file I/O and is meant to run off the event loop. Only one of those should
+    run at a time.
+    """
+
+    def __init__(self, path: str, compact_every: int = 100_000):
+        self.snapshot_path = path + ".snap"
+        self.log_path = path + ".log"
+        self.rotated_path = path + ".log.old"
+        self.compact_every = max(1, int(compact_every))
+        self.log_records = 0
+        self._pending = bytearray()
+        self._log = None
+
+    def exists(self) -> bool:
+        return any(os.path.exists(p) for p in (self.snapshot_path, self.rotated_path, self.log_path))
+
+    def record_set(self, user_id: int, command_id: int, record):
+        self._pending += _pack(
+            OP_SET, user_id, command_id, record.expires_at, record.channel_id, record.guild_id, record.notified
+        )
+
+    def record_clear(self, user_id: int, command_id: int):
+        self._pending += _pack(OP_CLEAR, user_id, command_id)
+
+    def record_notify(self, user_id: int, command_id: int):
+        self._pending += _pack(OP_NOTIFY, user_id, command_id)
+
+    def take_pending(self) -> bytes:
+        """Return and clear the buffered records for a :meth:`write`."""
+        data, self._pending = bytes(self._pending), bytearray()
+        return data
+
+    def restore_pending(self, data: bytes):
+        """Put records back after a failed write so the next one retries them."""
+        self._pending[:0] = data
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.log_records >= self.compact_every
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        if self._log is None:
+            self._log = open(self.log_path, "ab")
+            if self._log.tell() == 0:
+                self._log.write(_MAGIC)
+        self._log.write(data)
+        self._log.flush()
+        self.log_records += len(data) // _RECORD.size
+
+    def replay(self):
+        """Rebuild current state as ``(user_id, command_id, expires_at, channel_id, guild_id, notified)`` tuples."""
+        state = {}
+        for path in (self.snapshot_path, self.rotated_path, self.log_path):
+            _apply(state, _read_records(path))
+        self.log_records = len(_read_records(self.log_path)) // _RECORD.size
+        return [key + value for key, value in state.items()]
+
+    def rotate(self):
+        """Close the live log and set it aside for :meth:`compact`.
+
+        If an earlier compaction left a rotated log behind, that one is
+        compacted first and the live log keeps growing until the next round.
+        """
+        if os.path.exists(self.rotated_path):
+            return
+        self.close()
+        if os.path.exists(self.log_path):
+            os.replace(self.log_path, self.rotated_path)
+        self.log_records = 0
+
+    def compact(self):
+        """Fold the rotated log into a fresh snapshot and drop it."""
+        if not os.path.exists(self.rotated_path):
+            return
+        state = _apply(_apply({}, _read_records(self.snapshot_path)), _read_records(self.rotated_path))
+        self.write_snapshot(key + value for key, value in state.items())
+        os.remove(self.rotated_path)
+
+    def write_snapshot(self, entries):
+        """Atomically replace the snapshot with ``entries`` in :meth:`replay` order."""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(
+                b"".join(
+                    _pack(OP_SET, user_id, command_id, expires_at, channel_id, guild_id, notified)
+                    for user_id, command_id, expires_at, channel_id, guild_id, notified in entries
+                )
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
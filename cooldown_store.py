@@ -0,0 +1,373 @@
+import gc
+import heapq
+
+# Command names are interned to small integer IDs; records live in one
+# ``{user_id: CooldownRecord}`` partition per command instead of a
+# dict-of-dicts per user. Append new commands at the end; never reorder.
+COMMANDS = ("mission", "report", "tower", "daily", "weekly", "challenge")
+COMMAND_IDS = {name: index for index, name in enumerate(COMMANDS)}
+
+
+class CooldownRecord:
+    __slots__ = ("expires_at", "channel_id", "guild_id", "notified")
+
+    def __init__(self, expires_at: float, channel_id=None, guild_id=None, notified: bool = False):
+        self.expires_at = float(expires_at)
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.notified = bool(notified)
+
+    def __repr__(self):
+        return (
+            f"CooldownRecord(expires_at={self.expires_at!r}, channel_id={self.channel_id!r}, "
+            f"guild_id={self.guild_id!r}, notified={self.notified!r})"
+        )
+
+
+class CooldownStore:
+    """Authoritative in-memory view of every tracked cooldown.
+
+    The store is loaded from persistent storage once at startup and then serves
+    every read from memory. Mutations mark their ``(user_id, command)`` key
+    dirty so the write-behind flush can persist only what changed. When the
+    initial load did not happen (or failed), individual users can be refreshed
+    from storage with :meth:`refresh_user` before their data is trusted.
+
+    Each record also remembers the guild it was tracked in, and the store keeps
+    a per-guild index of ``(user_id, command_id)`` keys so server-scoped views
+    and cleanups only touch that guild's cooldowns.
+
+    Expiry is served from a min-heap of ``(expires_at, user_id, command_id)``
+    entries, so :meth:`pop_expired` and :meth:`purge_expired` only touch the
+    entries that are actually due. Overwritten or removed records leave stale
+    heap entries behind; they are skipped when they surface.
+    ``on_expiry_scheduled(expires_at)`` is called whenever a record is queued,
+    so a timer sleeping until :meth:`next_expiry` can wake up for a sooner one.
+
+    When ``journal`` is set, every set, clear and notify is also appended to
+    it (see ``cooldown_journal.CooldownJournal``). Loads are not journaled.
+
+    Commands outside ``COMMANDS`` are ignored.
+    """
+
+    def __init__(self, flush_threshold: int = 0, on_flush_needed=None, on_expiry_scheduled=None):
+        self._by_command = [{} for _ in COMMANDS]
+        self._by_guild = {}
+        self._snowflakes = {}
+        self._expiry = []
+        self._retained = []
+        self._dirty = set()
+        self._fresh_users = set()
+        self.loaded = False
+        self.flush_threshold = int(flush_threshold)
+        self.on_flush_needed = on_flush_needed
+        self.on_expiry_scheduled = on_expiry_scheduled
+        self.journal = None
+
+    def __len__(self):
+        return sum(len(partition) for partition in self._by_command)
+
+    def __bool__(self):
+        return any(self._by_command)
+
+    def __contains__(self, user_id):
+        return any(user_id in partition for partition in self._by_command)
+
+    def _intern(self, snowflake):
+        # Most cooldowns share a handful of channels and guilds; keep one int each.
+        if snowflake is None:
+            return None
+        snowflake = int(snowflake)
+        return self._snowflakes.setdefault(snowflake, snowflake)
+
+    def _put(self, user_id, command_id, expires_at, channel_id, guild_id, notified):
+        partition = self._by_command[command_id]
+        self._unindex(user_id, command_id, partition.get(user_id))
+        record = CooldownRecord(expires_at, self._intern(channel_id), self._intern(guild_id), notified)
+        partition[user_id] = record
+        if record.guild_id is not None:
+            self._by_guild.setdefault(record.guild_id, set()).add((user_id, command_id))
+        heapq.heappush(self._expiry, (record.expires_at, user_id, command_id))
+        if len(self._expiry) > 2 * len(self) + 1024:
+            self._rebuild_expiry()
+        if self.on_expiry_scheduled is not None:
+            self.on_expiry_scheduled(record.expires_at)
+        return record
+
+    def _rebuild_expiry(self):
+        # Drop stale heap entries. Records pop_expired() already handed out
+        # wait in _retained instead, so they are not queued again.
+        handed_out = set(self._retained)
+        expiry = []
+        for command_id, partition in enumerate(self._by_command):
+            for user_id, record in partition.items():
+                entry = (record.expires_at, user_id, command_id)
+                if entry not in handed_out:
+                    expiry.append(entry)
+        heapq.heapify(expiry)
+        self._expiry = expiry
+
+    def _pop(self, user_id, command_id):
+        record = self._by_command[command_id].pop(user_id, None)
+        self._unindex(user_id, command_id, record)
+        return record
+
+    def _unindex(self, user_id, command_id, record):
+        if record is None or record.guild_id is None:
+            return
+        keys = self._by_guild.get(record.guild_id)
+        if keys is not None:
+            keys.discard((user_id, command_id))
+            if not keys:
+                del self._by_guild[record.guild_id]
+
+    def get(self, user_id: int, command: str):
+        command_id = COMMAND_IDS.get(command)
+        if command_id is None:
+            return None
+        return self._by_command[command_id].get(user_id)
+
+    def user_cooldowns(self, user_id: int):
+        """Return a ``{command: CooldownRecord}`` snapshot for one user."""
+        found = {}
+        for command_id, partition in enumerate(self._by_command):
+            record = partition.get(user_id)
+            if record is not None:
+                found[COMMANDS[command_id]] = record
+        return found
+
+    def users(self):
+        seen = {}
+        for partition in self._by_command:
+            for user_id in partition:
+                seen[user_id] = None
+        return list(seen)
+
+    def items(self):
+        """Yield ``(user_id, command, CooldownRecord)`` for every tracked cooldown."""
+        for command_id, partition in enumerate(self._by_command):
+            command = COMMANDS[command_id]
+            for user_id, record in list(partition.items()):
+                yield user_id, command, record
+
+    def entries(self):
+        """Yield compact ``(user_id, command_id, expires_at, channel_id, guild_id, notified)`` tuples."""
+        for command_id, partition in enumerate(self._by_command):
+            for user_id, record in list(partition.items()):
+                yield user_id, command_id, record.expires_at, record.channel_id, record.guild_id, record.notified
+
+    def guild_items(self, guild_id: int):
+        """Yield ``(user_id, command, CooldownRecord)`` for one guild's cooldowns."""
+        for user_id, command_id in list(self._by_guild.get(guild_id, ())):
+            record = self._by_command[command_id].get(user_id)
+            if record is not None:
+                yield user_id, COMMANDS[command_id], record
+
+    def guild_count(self, guild_id: int) -> int:
+        return len(self._by_guild.get(guild_id, ()))
+
+    def next_expiry(self):
+        """Earliest queued expiry time, or None. May belong to a stale entry."""
+        return self._expiry[0][0] if self._expiry else None
+
+    def pop_expired(self, now: float):
+        """Return ``(user_id, command, CooldownRecord)`` for cooldowns expired by ``now``.
+
+        Each expiry is returned once; returned keys are kept for
+        :meth:`purge_expired`.
+        """
+        expired = []
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            expires_at, user_id, command_id = entry
+            record = self._by_command[command_id].get(user_id)
+            if record is not None and record.expires_at == expires_at:
+                expired.append((user_id, COMMANDS[command_id], record))
+                heapq.heappush(self._retained, entry)
+        return expired
+
+    def restore_expired(self, expired):
+        """Queue entries returned by :meth:`pop_expired` again, e.g. after a failed enqueue.
+
+        Records replaced or removed since they were popped are skipped.
+        """
+        restored = set()
+        for user_id, command, record in expired:
+            command_id = COMMAND_IDS.get(command)
+            if command_id is not None and self._by_command[command_id].get(user_id) is record:
+                entry = (record.expires_at, user_id, command_id)
+                if entry not in restored:
+                    restored.add(entry)
+                    heapq.heappush(self._expiry, entry)
+        if restored:
+            self._retained = [entry for entry in self._retained if entry not in restored]
+            heapq.heapify(self._retained)
+
+    def purge_expired(self, cutoff: float) -> int:
+        """Remove expired cooldowns whose expiry is at or before ``cutoff``.
+
+        Only keys already returned by :meth:`pop_expired` are considered.
+        """
+        removed = 0
+        heap = self._retained
+        while heap and heap[0][0] <= cutoff:
+            expires_at, user_id, command_id = heapq.heappop(heap)
+            record = self._by_command[command_id].get(user_id)
+            if record is not None and record.expires_at == expires_at and self.remove(user_id, COMMANDS[command_id]):
+                removed += 1
+        return removed
+
+    def set(self, user_id: int, command: str, expires_at: float, channel_id=None, guild_id=None, notified: bool = False):
+        command_id = COMMAND_IDS.get(command)
+        if command_id is None:
+            return
+        record = self._put(user_id, command_id, expires_at, channel_id, guild_id, notified)
+        if self.journal is not None:
+            self.journal.record_set(user_id, command_id, record)
+        self._mark_dirty(user_id, command)
+
+    def set_guild(self, user_id: int, command: str, guild_id: int) -> bool:
+        """Attach a guild to an existing record (used to backfill older rows)."""
+        command_id = COMMAND_IDS.get(command)
+        record = self.get(user_id, command)
+        if command_id is None or record is None or record.guild_id == guild_id:
+            return False
+        record = self._put(user_id, command_id, record.expires_at, record.channel_id, guild_id, record.notified)
+        if self.journal is not None:
+            self.journal.record_set(user_id, command_id, record)
+        self._mark_dirty(user_id, command)
+        return True
+
+    def mark_notified(self, user_id: int, command: str) -> bool:
+        record = self.get(user_id, command)
+        if record is None or record.notified:
+            return False
+        record.notified = True
+        if self.journal is not None:
+            self.journal.record_notify(user_id, COMMAND_IDS[command])
+        self._mark_dirty(user_id, command)
+        return True
+
+    def remove(self, user_id: int, command: str) -> bool:
+        command_id = COMMAND_IDS.get(command)
+        if command_id is None or self._pop(user_id, command_id) is None:
+            return False
+        if self.journal is not None:
+            self.journal.record_clear(user_id, command_id)
+        self._mark_dirty(user_id, command)
+        return True
+
+    def clear_user(self, user_id: int):
+        """Drop every cooldown for a user and return the cleared command names."""
+        cleared = []
+        for command_id in range(len(COMMANDS)):
+            if self._pop(user_id, command_id) is not None:
+                cleared.append(COMMANDS[command_id])
+                if self.journal is not None:
+                    self.journal.record_clear(user_id, command_id)
+                self._mark_dirty(user_id, COMMANDS[command_id])
+        return cleared
+
+    def clear_guild(self, guild_id: int) -> int:
+        """Drop every cooldown tracked in one guild and return how many were removed."""
+        keys = self._by_guild.pop(guild_id, set())
+        for user_id, command_id in keys:
+            self._by_command[command_id].pop(user_id, None)
+            if self.journal is not None:
+                self.journal.record_clear(user_id, command_id)
+            self._mark_dirty(user_id, COMMANDS[command_id])
+        return len(keys)
+
+    def load(self, rows):
+        """Replace the store contents with persisted rows.
+
+        Keys with unflushed local changes keep their in-memory value so a load
+        racing with a write never drops the newer update.
+        """
+        self.load_entries(
+            (int(row["user_id"]), COMMAND_IDS[str(row["command"])], row["expires_at"], row["channel_id"],
+             row.get("guild_id"), row["notified"])
+            for row in rows
+            if str(row["command"]) in COMMAND_IDS
+        )
+
+    def load_entries(self, entries):
+        """Like :meth:`load`, from compact tuples as yielded by :meth:`entries`."""
+        pending = {key: self.get(*key) for key in self._dirty}
+        by_command = self._by_command = [{} for _ in COMMANDS]
+        by_guild = self._by_guild = {}
+        expiry = self._expiry = []
+        self._retained = []
+        intern = self._intern
+        # Bulk path: the partitions start empty, so skip _put's unindexing, and
+        # keep the cyclic GC from rescanning the growing store on every batch of
+        # new records (none of them can form cycles).
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for user_id, command_id, expires_at, channel_id, guild_id, notified in entries:
+                if not 0 <= command_id < len(COMMANDS):
+                    continue
+                guild_id = intern(guild_id)
+                record = by_command[command_id][user_id] = CooldownRecord(
+                    expires_at, intern(channel_id), guild_id, notified
+                )
+                expiry.append((record.expires_at, user_id, command_id))
+                if guild_id is not None:
+                    keys = by_guild.get(guild_id)
+                    if keys is None:
+                        keys = by_guild[guild_id] = set()
+                    keys.add((user_id, command_id))
+            heapq.heapify(expiry)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        for (user_id, command), record in pending.items():
+            command_id = COMMAND_IDS[command]
+            if record is None:
+                self._pop(user_id, command_id)
+            else:
+                self._put(user_id, command_id, record.expires_at, record.channel_id, record.guild_id, record.notified)
+        self.loaded = True
+        if self.on_expiry_scheduled is not None and self._expiry:
+            self.on_expiry_scheduled(self._expiry[0][0])
+
+    def is_stale(self, user_id: int) -> bool:
+        """True when this user's cooldowns have not been read from storage yet."""
+        return not self.loaded and user_id not in self._fresh_users
+
+    def refresh_user(self, user_id: int, rows):
+        """Replace one user's cooldowns with persisted rows, keeping dirty keys."""
+        dirty_commands = {command for user, command in self._dirty if user == user_id}
+        for command_id in range(len(COMMANDS)):
+            if COMMANDS[command_id] not in dirty_commands:
+                self._pop(user_id, command_id)
+        for row in rows:
+            command = str(row["command"])
+            command_id = COMMAND_IDS.get(command)
+            if command_id is None or command in dirty_commands:
+                continue
+            self._put(
+                user_id, command_id, row["expires_at"], row["channel_id"],
+                row.get("guild_id"), row["notified"],
+            )
+        self._fresh_users.add(user_id)
+
+    def _mark_dirty(self, user_id: int, command: str):
+        self._dirty.add((user_id, command))
+        if self.flush_threshold and self.on_flush_needed and len(self._dirty) >= self.flush_threshold:
+            self.on_flush_needed()
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def take_dirty(self):
+        """Return and clear the dirty keys for a flush."""
+        keys, self._dirty = list(self._dirty), set()
+        return keys
+
+    def restore_dirty(self, keys):
+        """Put keys back after a failed flush so the next one retries them."""
+        self._dirty.update(keys)
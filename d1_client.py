@@ -0,0 +1,389 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+import aiohttp
+
+from metrics import MetricsRegistry
+
+DEFAULT_BASE_URL = "https://api.cloudflare.com/client/v4"
+
+
+class D1Error(RuntimeError):
+    """Cloudflare D1 rejected a query or returned something unusable."""
+
+
+class D1TransientError(D1Error):
+    """Network failure, timeout, 429 or 5xx; the same request may succeed later.
+
+    ``not_applied`` is True when D1 certainly did not run the request (the
+    connection never opened, or it was rate limited), so even a non-idempotent
+    request can be resent safely.
+    """
+
+    def __init__(self, message, not_applied: bool = False):
+        super().__init__(message)
+        self.not_applied = not_applied
+
+
+class D1Unavailable(D1TransientError):
+    """The circuit breaker is open; the request was not sent."""
+
+    def __init__(self, message="Cloudflare D1 circuit breaker is open"):
+        super().__init__(message, not_applied=True)
+
+
+def is_read_query(sql: str) -> bool:
+    statement = (sql or "").strip().lower()
+    if not statement:
+        return True
+    return statement.startswith(("select", "pragma", "with", "explain"))
+
+
+class RetryPolicy:
+    """Bounded exponential backoff with full jitter."""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.2, max_delay: float = 2.0):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Fails fast after ``failure_threshold`` consecutive transient failures.
+
+    Once open, requests are refused for ``reset_timeout`` seconds; then a
+    single trial request is let through (half-open) and its outcome closes or
+    re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_in_flight:
+                return False
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class D1Client:
+    """Async Cloudflare D1 ``/query`` client over a pooled keep-alive session.
+
+    The aiohttp session lives on a private event loop in a daemon thread, so
+    every caller shares the same warm TCP/TLS connections: coroutines on any
+    loop ``await`` :meth:`query` / :meth:`batch`, while blocking callers such as
+    storage executor threads and startup migrations use :meth:`request_blocking`.
+    At most ``max_connections`` requests are on the wire at once; each request
+    gets its own ``timeout`` deadline unless the caller passes one.
+
+    Transient failures are retried with ``retry`` when the request is
+    idempotent (read-only unless the caller says otherwise) or certainly not
+    applied. ``breaker`` turns a run of transient failures into fast
+    :class:`D1Unavailable` errors. Latency and error counts per operation
+    (``query`` / ``batch``) go to ``metrics`` under ``d1.<operation>.*``.
+    """
+
+    def __init__(
+        self,
+        account_id: str,
+        database_id: str,
+        api_token: str,
+        max_connections: int = 8,
+        timeout: float = 10.0,
+        base_url: str = DEFAULT_BASE_URL,
+        retry: RetryPolicy = None,
+        breaker: CircuitBreaker = None,
+        metrics: MetricsRegistry = None,
+    ):
+        self.url = f"{base_url.rstrip('/')}/accounts/{account_id}/d1/database/{database_id}/query"
+        self.max_connections = max(1, int(max_connections))
+        self.timeout = float(timeout)
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or MetricsRegistry()
+        self._headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json",
+        }
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="d1-client", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self._headers)
+        return self._session
+
+    async def _post_once(self, payload, timeout):
+        session = await self._get_session()
+        deadline = aiohttp.ClientTimeout(total=self.timeout if timeout is None else timeout)
+        try:
+            async with session.post(self.url, data=json.dumps(payload), timeout=deadline) as response:
+                body = await response.text()
+                status = response.status
+        except asyncio.TimeoutError:
+            raise D1TransientError("Cloudflare D1 request timed out") from None
+        except aiohttp.ClientConnectorError as e:
+            raise D1TransientError(f"Cloudflare D1 connection failed: {e}", not_applied=True) from None
+        except aiohttp.ClientError as e:
+            raise D1TransientError(f"Cloudflare D1 request failed: {e}") from None
+
+        if status == 429:
+            raise D1TransientError("Cloudflare D1 rate limited the request (HTTP 429)", not_applied=True)
+        if status >= 500:
+            raise D1TransientError(f"Cloudflare D1 returned HTTP {status}: {body[:200]}")
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise D1Error(f"Cloudflare D1 returned HTTP {status}: {body[:200]}") from None
+        if not data.get("success", False):
+            errors = data.get("errors") or data.get("messages") or []
+            raise D1Error(f"Cloudflare D1 query failed: {errors or body}")
+        return data.get("result") or []
+
+    async def _post(self, payload, timeout, idempotent):
+        operation = "batch" if "batch" in payload else "query"
+        prefix = f"d1.{operation}"
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.metrics.counter(f"{prefix}.errors.circuit_open").inc()
+                raise D1Unavailable()
+            started = time.monotonic()
+            try:
+                result = await self._post_once(payload, timeout)
+            except D1TransientError as e:
+                self.metrics.histogram(f"{prefix}.latency").observe(time.monotonic() - started)
+                self.metrics.counter(f"{prefix}.errors.transient").inc()
+                self.breaker.record_failure()
+                if attempt + 1 >= self.retry.attempts or not (idempotent or e.not_applied):
+                    raise
+                self.metrics.counter(f"{prefix}.retries").inc()
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            except D1Error:
+                # D1 answered, so it is healthy; the statement itself was rejected.
+                self.metrics.histogram(f"{prefix}.latency").observe(time.monotonic() - started)
+                self.metrics.counter(f"{prefix}.errors.rejected").inc()
+                self.breaker.record_success()
+                raise
+            self.metrics.histogram(f"{prefix}.latency").observe(time.monotonic() - started)
+            self.metrics.counter(f"{prefix}.ok").inc()
+            self.breaker.record_success()
+            return result
+
+    def _submit(self, payload, timeout, idempotent):
+        if idempotent is None:
+            statements = payload.get("batch") or [payload]
+            idempotent = all(is_read_query(statement.get("sql")) for statement in statements)
+        return asyncio.run_coroutine_threadsafe(self._post(payload, timeout, idempotent), self._ensure_loop())
+
+    async def request(self, payload, timeout: float = None, idempotent: bool = None):
+        """POST a raw ``{"sql", "params"}`` or ``{"batch": [...]}`` payload and return ``result``.
+
+        ``idempotent`` defaults to True only for read-only payloads; pass True
+        for writes that are safe to apply twice so they are retried as well.
+        """
+        return await asyncio.wrap_future(self._submit(payload, timeout, idempotent))
+
+    def request_blocking(self, payload, timeout: float = None, idempotent: bool = None):
+        """Like :meth:`request`, for threads that are not running an event loop."""
+        return self._submit(payload, timeout, idempotent).result()
+
+    async def query(self, sql: str, params=(), timeout: float = None):
+        results = await self.request({"sql": sql, "params": normalize_params(params)}, timeout)
+        return results[0] if results else {}
+
+    async def batch(self, statements, timeout: float = None, idempotent: bool = None):
+        """Run ``(sql, params)`` pairs as one D1 batch and return one result per statement."""
+        payload = {"batch": [{"sql": sql, "params": normalize_params(params)} for sql, params in statements]}
+        return await self.request(payload, timeout, idempotent)
+
+    def close(self, timeout: float = 5.0):
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is None:
+            return
+        if self._session is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(timeout)
+            except Exception:
+                pass
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+
+
+class QueryResultCursor:
+    def __init__(self, rows=None, rowcount=-1, lastrowid=None):
+        self._rows = list(rows or [])
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def _set_results(self, results):
+        """Fill in from the D1 results of the statement(s) this cursor ran."""
+        last = results[-1] if results else {}
+        self._rows = list(last.get("results") or [])
+        self.rowcount = int(sum(int((item.get("meta") or {}).get("changes") or 0) for item in results))
+        self.lastrowid = (last.get("meta") or {}).get("last_row_id")
+
+
+class D1Connection:
+    """sqlite3-style connection over a :class:`D1Client`.
+
+    Reads go straight to D1. Writes made inside ``with conn:`` are buffered
+    and sent as one D1 batch when the block exits; ``send_writes`` receives
+    that list of ``(sql, params)`` pairs and defaults to a direct batch
+    request. Writes outside a ``with`` block are sent immediately.
+
+    A buffered write returns its cursor straight away with ``rowcount`` -1;
+    the cursor is filled in from its own statements' results once the batch
+    is sent, provided ``send_writes`` returns D1's per-statement results
+    (a ``send_writes`` that only spools returns None and the cursor stays
+    empty). Read ``rowcount``, ``lastrowid`` or rows after the block exits.
+    """
+
+    def __init__(self, client: D1Client, send_writes=None):
+        self.row_factory = None
+        self._client = client
+        self._send_writes = send_writes or self._send_batch
+        self._pending_writes = []
+        self._pending_cursors = []
+        self._in_context = False
+
+    def __enter__(self):
+        self._in_context = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self._pending_writes:
+                self._flush_pending()
+        finally:
+            self._pending_writes = []
+            self._pending_cursors = []
+            self._in_context = False
+        return False
+
+    def _send_batch(self, statements):
+        return self._client.request_blocking({"batch": [{"sql": sql, "params": params} for sql, params in statements]})
+
+    def _flush_pending(self):
+        results = self._send_writes(self._pending_writes)
+        if results is not None and len(results) == len(self._pending_writes):
+            for cursor, start, end in self._pending_cursors:
+                cursor._set_results(results[start:end])
+
+    def _defer(self, statements):
+        cursor = QueryResultCursor(rows=[])
+        start = len(self._pending_writes)
+        self._pending_writes.extend(statements)
+        self._pending_cursors.append((cursor, start, len(self._pending_writes)))
+        return cursor
+
+    def execute(self, sql, params=()):
+        if is_read_query(sql):
+            results = self._client.request_blocking({"sql": sql, "params": normalize_params(params)})
+            first = results[0] if results else {}
+            rows = first.get("results") or []
+            return QueryResultCursor(rows=rows)
+
+        if self._in_context:
+            return self._defer([(sql, normalize_params(params))])
+
+        results = self._client.request_blocking({"sql": sql, "params": normalize_params(params)})
+        cursor = QueryResultCursor()
+        cursor._set_results(results[:1])
+        return cursor
+
+    def executemany(self, sql, seq_of_params):
+        if self._in_context:
+            return self._defer([(sql, normalize_params(params)) for params in seq_of_params])
+
+        payload = {"batch": [{"sql": sql, "params": normalize_params(params)} for params in seq_of_params]}
+        cursor = QueryResultCursor()
+        cursor._set_results(self._client.request_blocking(payload))
+        return cursor
+
+    def commit(self):
+        if self._pending_writes:
+            self._flush_pending()
+            self._pending_writes = []
+            self._pending_cursors = []
+
+    def rollback(self):
+        self._pending_writes = []
+        self._pending_cursors = []
+
+    def close(self):
+        self._pending_writes = []
+        self._pending_cursors = []
+
+
+def normalize_params(params):
+    # Positional params go to D1 as strings (SQLite affinity turns them back
+    # into numbers for INTEGER/REAL columns) and None as JSON null, so D1
+    # stores NULL exactly where a local SQLite write would.
+    return [None if value is None else str(value) for value in list(params or [])]
@@ -0,0 +1,354 @@
+import json
+import threading
+import time
+import uuid
+
+from d1_client import D1TransientError, RetryPolicy, is_read_query, normalize_params
+from sqlite_connections import SQLiteConnectionManager
+
+# D1 table of applied transaction tokens (see D1WriteThrough).
+_TOKEN_TABLE = "d1_write_tokens"
+
+
+class D1WriteThrough:
+    """Durable, ordered queue of writes waiting to be applied to D1.
+
+    :meth:`submit` spools one transaction into a local SQLite file; a
+    background thread replays the spool against D1 oldest first. Transactions
+    spooled within ``batch_window`` seconds of each other are sent as one D1
+    ``batch`` of at most ``max_statements`` statements (a larger transaction
+    goes alone). If a combined batch fails they are resent one at a time, so
+    D1 never sees writes out of order.
+
+    While D1 is unreachable (or the client's circuit breaker is open) the
+    spool just grows and the thread backs off with ``retry``; anything still
+    spooled at shutdown is sent on the next start. A transaction that D1
+    rejects outright can never succeed, so it is logged and dropped rather
+    than blocking everything behind it.
+
+    A timed-out request may still have been applied, so every transaction
+    carries a random token that is inserted into D1's ``d1_write_tokens``
+    table in the same batch. Resending a transaction that already applied
+    fails on the token's primary key and rolls back, so non-idempotent
+    statements never run twice. Tokens are pruned after ``token_ttl`` seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        spool_path: str,
+        retry: RetryPolicy = None,
+        batch_window: float = 0.005,
+        max_statements: int = 500,
+        token_ttl: float = 7 * 86400.0,
+    ):
+        self._client = client
+        self._spool = SQLiteConnectionManager(spool_path)
+        self.retry = retry or RetryPolicy(base_delay=1.0, max_delay=60.0)
+        self.batch_window = max(0.0, float(batch_window))
+        self.max_statements = max(1, int(max_statements))
+        self.token_ttl = float(token_ttl)
+        self._tokens_ready = False
+        self._tokens_pruned_at = 0.0
+        self._backlog = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = self._spool.connect()
+        with self._lock:
+            if self._backlog is None:
+                with conn:
+                    conn.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS d1_spool (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            statements TEXT NOT NULL,
+                            queued_at REAL NOT NULL,
+                            token TEXT
+                        )
+                        """
+                    )
+                    columns = {row["name"] for row in conn.execute("PRAGMA table_info(d1_spool)").fetchall()}
+                    if "token" not in columns:
+                        conn.execute("ALTER TABLE d1_spool ADD COLUMN token TEXT")
+                self._backlog = conn.execute("SELECT COUNT(*) FROM d1_spool").fetchone()[0]
+        return conn
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="d1-write-through", daemon=True)
+                self._thread.start()
+
+    def submit(self, statements, token: str = None):
+        """Spool ``(sql, params)`` pairs for D1, after any transactions already queued."""
+        statements = [(sql, normalize_params(params)) for sql, params in statements]
+        if not statements:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO d1_spool (statements, queued_at, token) VALUES (?, ?, ?)",
+                (json.dumps(statements), time.time(), token or uuid.uuid4().hex),
+            )
+        with self._lock:
+            self._backlog += 1
+        self.start()
+        self._wakeup.set()
+
+    def send(self, statements):
+        """Apply one transaction on D1 now, or spool it if D1 is unavailable.
+
+        Returns D1's per-statement results, or None when the transaction was
+        spooled. Once anything is spooled, later transactions queue behind it
+        to keep their order. A failed attempt is spooled under the same token,
+        so the resend is skipped if that attempt did apply.
+        """
+        statements = [(sql, normalize_params(params)) for sql, params in statements]
+        if not statements:
+            return []
+        if self.pending:
+            self.submit(statements)
+            return None
+        token = uuid.uuid4().hex
+        try:
+            results = self._send([(token, statements)])
+        except D1TransientError as e:
+            self.submit(statements, token)
+            print(f"⚠️ Cloudflare D1 unavailable, spooled {len(statements)} write(s) locally: {e}", flush=True)
+            return None
+        self._prune_tokens()
+        return results
+
+    @property
+    def pending(self) -> int:
+        """Spooled transactions not yet applied to D1."""
+        if self._backlog is None:
+            self._connect()
+        return self._backlog
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            # Give concurrent writers a moment to spool so they share a batch.
+            if self.batch_window and not self._stop.is_set():
+                time.sleep(self.batch_window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                failures = 0
+            except Exception as e:
+                delay = self.retry.delay(failures)
+                failures += 1
+                print(f"❌ D1 write-through failed ({self.pending} transaction(s) spooled), retrying in {delay:.1f}s: {e}", flush=True)
+                self._wakeup.set()
+                self._stop.wait(delay)
+
+    def flush(self):
+        """Send spooled transactions oldest first until the spool is empty.
+
+        Raises on the first transient failure; unsent transactions stay spooled.
+        """
+        conn = self._connect()
+        while True:
+            rows = conn.execute(
+                "SELECT id, statements, token FROM d1_spool ORDER BY id LIMIT ?", (self.max_statements,)
+            ).fetchall()
+            if not rows:
+                self._prune_tokens()
+                return
+            group = []
+            count = 0
+            for row in rows:
+                statements = json.loads(row["statements"])
+                if group and count + len(statements) > self.max_statements:
+                    break
+                group.append((row["id"], row["token"], statements))
+                count += len(statements)
+            self._send_group(conn, group)
+
+    def _send_group(self, conn, group):
+        if len(group) > 1:
+            try:
+                self._send([(token, statements) for _, token, statements in group])
+            except D1TransientError:
+                raise
+            except Exception as e:
+                print(f"⚠️ D1 write-through batch of {len(group)} transaction(s) failed, resending one by one: {e}", flush=True)
+            else:
+                self._forget(conn, group[-1][0], len(group))
+                return
+        for spool_id, token, statements in group:
+            try:
+                self._send([(token, statements)])
+            except D1TransientError:
+                raise
+            except Exception as e:
+                if _TOKEN_TABLE in str(e):
+                    print("ℹ️ A spooled D1 transaction was already applied; skipping the resend", flush=True)
+                else:
+                    print(f"❌ D1 rejected a spooled transaction ({len(statements)} statement(s)); dropping it: {e}", flush=True)
+            self._forget(conn, spool_id, 1)
+
+    def _send(self, transactions):
+        """Send ``(token, statements)`` transactions as one batch; returns the last one's results."""
+        self._ensure_token_table()
+        now = time.time()
+        batch = []
+        for token, statements in transactions:
+            # Transactions spooled before tokens existed have none and go as is.
+            if token is not None:
+                batch.append({"sql": f"INSERT INTO {_TOKEN_TABLE} (token, applied_at) VALUES (?, ?)", "params": [token, str(now)]})
+            batch.extend({"sql": sql, "params": params} for sql, params in statements)
+        results = self._client.request_blocking({"batch": batch})
+        return results[len(results) - len(transactions[-1][1]):]
+
+    def _ensure_token_table(self):
+        if not self._tokens_ready:
+            self._client.request_blocking(
+                {
+                    "sql": f"CREATE TABLE IF NOT EXISTS {_TOKEN_TABLE} (token TEXT PRIMARY KEY, applied_at REAL NOT NULL)",
+                    "params": [],
+                },
+                idempotent=True,
+            )
+            self._tokens_ready = True
+
+    def _prune_tokens(self):
+        # At most hourly; a failure here only delays the next prune.
+        now = time.time()
+        if not self._tokens_ready or now - self._tokens_pruned_at < 3600:
+            return
+        self._tokens_pruned_at = now
+        try:
+            self._client.request_blocking(
+                {"sql": f"DELETE FROM {_TOKEN_TABLE} WHERE applied_at < ?", "params": [str(now - self.token_ttl)]},
+                idempotent=True,
+            )
+        except Exception as e:
+            print(f"⚠️ Could not prune D1 write tokens: {e}", flush=True)
+
+    def _forget(self, conn, last_id, count):
+        with conn:
+            conn.execute("DELETE FROM d1_spool WHERE id <= ?", (last_id,))
+        with self._lock:
+            self._backlog -= count
+
+    def close(self, timeout: float = 30.0):
+        """Stop the thread after one last flush attempt; leftovers stay spooled."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._wakeup.set()
+            thread.join(timeout)
+            if not thread.is_alive() and self.pending:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️ {self.pending} D1 transaction(s) left in the local spool: {e}", flush=True)
+        self._spool.close_all()
+
+
+class D1ReplicaConnection:
+    """Connection that reads from a local SQLite replica and writes through to D1.
+
+    Statements run against the local connection first so readers see them
+    immediately. Writes made inside ``with conn:`` are forwarded as one batch
+    once the local transaction commits; writes outside a ``with`` block are
+    committed locally and forwarded one by one.
+
+    Forwarded statements are replayed on D1 verbatim, where AUTOINCREMENT ids
+    can differ from the replica's (a rejected spooled transaction leaves a
+    gap on one side only), so writes must address rows by natural key.
+    """
+
+    def __init__(self, local, write_through):
+        self._local = local
+        self._write_through = write_through
+        self._pending = []
+        self._in_context = False
+
+    def __enter__(self):
+        self._local.__enter__()
+        self._in_context = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._local.__exit__(exc_type, exc, tb)
+            if exc_type is None and self._pending:
+                self._write_through.submit(self._pending)
+        finally:
+            self._pending = []
+            self._in_context = False
+        return False
+
+    def _forward(self, statements):
+        if self._in_context:
+            self._pending.extend(statements)
+        else:
+            self._local.commit()
+            self._write_through.submit(statements)
+
+    def execute(self, sql, params=()):
+        cursor = self._local.execute(sql, params)
+        if not is_read_query(sql):
+            self._forward([(sql, params)])
+        return cursor
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        cursor = self._local.executemany(sql, seq_of_params)
+        self._forward([(sql, params) for params in seq_of_params])
+        return cursor
+
+    def commit(self):
+        self._local.commit()
+        if self._pending:
+            self._write_through.submit(self._pending)
+            self._pending = []
+
+    def rollback(self):
+        self._local.rollback()
+        self._pending = []
+
+    def close(self):
+        self._pending = []
+        self._local.close()
+
+
+def resync_replica(remote, local, tables, page_size: int = 1000):
+    """Replace each table in ``local`` with the rows currently in ``remote``.
+
+    Rows are paged by rowid so large tables never come back in one response.
+    Returns the number of rows copied.
+    """
+    copied = 0
+    with local:
+        for table in tables:
+            local.execute(f"DELETE FROM {table}")
+            last_rowid = 0
+            while True:
+                rows = remote.execute(
+                    f"SELECT rowid AS _replica_rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, page_size),
+                ).fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    values = {key: row[key] for key in row.keys() if key != "_replica_rowid"}
+                    columns = ", ".join(values)
+                    placeholders = ", ".join("?" for _ in values)
+                    local.execute(
+                        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+                        tuple(values.values()),
+                    )
+                copied += len(rows)
+                last_rowid = int(rows[-1]["_replica_rowid"])
+    return copied
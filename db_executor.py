@@ -0,0 +1,204 @@
+import asyncio
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class DatabaseExecutor:
+    """Runs blocking database calls on worker threads behind an async API.
+
+    Writes go through a single writer thread so they are applied in submission
+    order, reads are spread over a small reader pool. Each thread owns its own
+    connection from ``connect`` and callables receive it as their first argument.
+    At most ``max_pending`` calls may be queued or running; further callers wait.
+
+    The writer group-commits: it takes up to ``max_batch`` queued writes, waiting
+    at most ``batch_window`` seconds for more to arrive, and runs them in one
+    transaction. For D1 that is one HTTP batch for many callers. If the shared
+    transaction fails, each write is retried in its own transaction so an error
+    only reaches the caller that caused it.
+    """
+
+    def __init__(
+        self,
+        connect,
+        readers: int = 2,
+        max_pending: int = 256,
+        batch_window: float = 0.0,
+        max_batch: int = 1,
+    ):
+        self._connect = connect
+        self._reader_count = max(1, int(readers))
+        self._max_pending = max(1, int(max_pending))
+        self._batch_window = max(0.0, float(batch_window))
+        self._max_batch = max(1, int(max_batch))
+        self._write_queue = queue.Queue(maxsize=self._max_pending)
+        self._read_queue = queue.Queue(maxsize=self._max_pending)
+        self._threads = []
+        self._slots = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            writer = threading.Thread(target=self._writer, name="db-writer", daemon=True)
+            self._threads.append(writer)
+            for index in range(self._reader_count):
+                self._threads.append(
+                    threading.Thread(target=self._reader, name=f"db-reader-{index}", daemon=True)
+                )
+            for thread in self._threads:
+                thread.start()
+
+    def close(self, timeout: float = 10.0):
+        """Stop the workers after the already-queued calls have finished."""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            threads, self._threads = self._threads, []
+        self._write_queue.put(_STOP)
+        for _ in range(len(threads) - 1):
+            self._read_queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    @property
+    def pending(self) -> int:
+        return self._write_queue.qsize() + self._read_queue.qsize()
+
+    def _reader(self):
+        conn = None
+        while True:
+            job = self._read_queue.get()
+            if job is _STOP:
+                break
+            fn, args, kwargs, loop, future = job
+            try:
+                if conn is None:
+                    conn = self._connect()
+                result = fn(conn, *args, **kwargs)
+            except BaseException as e:
+                loop.call_soon_threadsafe(_set_future_exception, future, e)
+            else:
+                loop.call_soon_threadsafe(_set_future_result, future, result)
+        _close_quietly(conn)
+
+    def _next_write_batch(self):
+        """Block for one write, then gather more; returns ``(jobs, stop_requested)``."""
+        job = self._write_queue.get()
+        if job is _STOP:
+            return [], True
+        batch = [job]
+        deadline = time.monotonic() + self._batch_window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._write_queue.get(timeout=remaining) if remaining > 0 else self._write_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _writer(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_write_batch()
+            if not batch:
+                continue
+            try:
+                if conn is None:
+                    conn = self._connect()
+            except BaseException as e:
+                for _, _, _, loop, future in batch:
+                    loop.call_soon_threadsafe(_set_future_exception, future, e)
+                continue
+            self._commit_batch(conn, batch)
+        _close_quietly(conn)
+
+    def _commit_batch(self, conn, batch):
+        if len(batch) > 1:
+            try:
+                with conn:
+                    results = [fn(conn, *args, **kwargs) for fn, args, kwargs, _, _ in batch]
+            except BaseException:
+                pass
+            else:
+                for (_, _, _, loop, future), result in zip(batch, results):
+                    loop.call_soon_threadsafe(_set_future_result, future, result)
+                return
+        for fn, args, kwargs, loop, future in batch:
+            try:
+                with conn:
+                    result = fn(conn, *args, **kwargs)
+            except BaseException as e:
+                loop.call_soon_threadsafe(_set_future_exception, future, e)
+            else:
+                loop.call_soon_threadsafe(_set_future_result, future, result)
+
+    async def _submit(self, jobs, fn, args, kwargs):
+        if not self._started:
+            self.start()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            jobs.put_nowait((fn, args, kwargs, loop, future))
+            return await future
+
+    async def read(self, fn, *args, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` on a reader thread."""
+        return await self._submit(self._read_queue, fn, args, kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` on the writer thread inside a transaction.
+
+        The transaction may be shared with other queued writes; it commits or
+        rolls back as a whole, and ``fn`` may be re-run alone after a rollback.
+        Over D1 a write's cursor is only filled in when the transaction is sent,
+        so return the cursor and read ``rowcount``/``lastrowid`` from it after
+        the await, not inside ``fn``.
+        """
+        return await self._submit(self._write_queue, fn, args, kwargs)
+
+    async def fetchone(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql, params=()):
+        cursor = await self.write(lambda conn: conn.execute(sql, params))
+        return cursor.rowcount
+
+    async def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        cursor = await self.write(lambda conn: conn.executemany(sql, seq_of_params))
+        return cursor.rowcount
+
+
+def _close_quietly(conn):
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _set_future_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_future_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
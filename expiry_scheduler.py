@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+
+class ExpiryScheduler:
+    """Awaits ``on_due(now)`` at each deadline instead of polling on a fixed tick.
+
+    The task sleeps until ``next_deadline()`` (a wall-clock timestamp, or None
+    when nothing is queued). :meth:`reschedule` wakes it early when a sooner
+    deadline is queued, and the task goes back to sleep until it unless it is
+    already due; a cancelled or moved deadline needs no call, because
+    ``on_due`` simply finds nothing due at the old time. Sleeps never exceed
+    ``max_sleep`` seconds, so housekeeping done in ``on_due`` still runs while
+    nothing expires and wall-clock jumps are caught up. After ``on_due`` raises,
+    the task waits ``retry_delay`` seconds before trying again.
+    """
+
+    def __init__(self, next_deadline, on_due, max_sleep: float = 600.0, retry_delay: float = 5.0, clock=time.time):
+        self._next_deadline = next_deadline
+        self._on_due = on_due
+        self.max_sleep = float(max_sleep)
+        self.retry_delay = float(retry_delay)
+        self._clock = clock
+        self._deadline = None
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def deadline(self):
+        """The deadline the task is currently sleeping until, or None."""
+        return self._deadline
+
+    def start(self):
+        """Start the task on the running loop; calling it again is a no-op."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reschedule(self, deadline: float):
+        """Wake the task if ``deadline`` is sooner than the one it sleeps until."""
+        if self._wakeup is not None and (self._deadline is None or deadline < self._deadline):
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            deadline = self._next_deadline()
+            self._deadline = deadline
+            delay = self.max_sleep if deadline is None else min(self.max_sleep, deadline - self._clock())
+            woken = False
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                    woken = True
+                except asyncio.TimeoutError:
+                    pass
+            self._deadline = None
+            if woken:
+                # Rescheduled: only run if the new deadline is already due.
+                deadline = self._next_deadline()
+                if deadline is None or self._clock() < deadline:
+                    continue
+            try:
+                await self._on_due(self._clock())
+            except Exception as e:
+                print(f"❌ Error running scheduled expiry: {e}")
+                # Failed entries may be due again at once; don't spin on them.
+                await asyncio.sleep(min(self.retry_delay, self.max_sleep))
@@ -0,0 +1,106 @@
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds, roughly 1-2-5 steps from 1 ms to 30 s.
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0,
+)
+# Seconds late, for events that can trail their deadline by minutes (or hours after an outage).
+LAG_BUCKETS = (
+    0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0,
+)
+# Item counts, e.g. queue depths.
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles resolve to a bucket's upper bound (capped at the max seen)."""
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float):
+        """Upper bound of the bucket holding the ``q`` quantile (0..1), or None if empty."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for index, bucket_count in enumerate(self._counts):
+                seen += bucket_count
+                if seen >= rank and bucket_count:
+                    return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+            return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max if self.count else None,
+        }
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """Named histograms and counters, created on first use. Safe across threads."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def uptime(self) -> float:
+        """Seconds since the registry was created, for turning counters into rates."""
+        return time.monotonic() - self.started
+
+    def histogram(self, name: str, buckets=DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(buckets)
+            return histogram
+
+    def counter(self, name: str) -> Counter:
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = Counter()
+            return counter
+
+    def snapshot(self, prefix: str = ""):
+        """Return ``{"histograms": {...}, "counters": {...}}`` for names starting with ``prefix``."""
+        with self._lock:
+            histograms = {name: h for name, h in self._histograms.items() if name.startswith(prefix)}
+            counters = {name: c.value for name, c in self._counters.items() if name.startswith(prefix)}
+        return {
+            "histograms": {name: h.snapshot() for name, h in sorted(histograms.items())},
+            "counters": dict(sorted(counters.items())),
+        }
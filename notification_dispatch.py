@@ -0,0 +1,179 @@
+import asyncio
+import collections
+import inspect
+import time
+
+
+class NotificationDispatcher:
+    """Per-channel notification queues drained by a bounded worker pool.
+
+    :meth:`submit` queues an item for a channel. The channel is handed to a
+    worker ``coalesce_window`` seconds after its first pending item, so items
+    arriving in the meantime go out together: ``render(channel_id, items)``
+    turns up to ``max_batch`` items into a list of ``(content, items)``
+    messages, each naming the items it covers, and ``send(channel_id,
+    content)`` delivers each one. At most ``workers`` sends run at once and a
+    channel is only ever handled by one worker.
+
+    Each channel is kept under ``channel_rate`` messages per
+    ``channel_period`` seconds (Discord's per-channel send bucket); a channel
+    over budget is parked, not slept on, so it does not hold a worker. If a
+    send fails with a rate limit (an exception carrying ``retry_after``, or
+    HTTP 429) the items of that message and the ones after it are put back
+    and the channel waits that long. Other failures are logged and that
+    message's items dropped. ``on_delivered(channel_id, items)`` and
+    ``on_failed(channel_id, items, error)`` report each message's outcome, so
+    a durable queue feeding :meth:`submit` can settle it; either may be a
+    coroutine function, and the worker awaits it.
+
+    With a ``metrics`` registry, each send's duration goes to the
+    ``<prefix>.send.latency`` histogram and its outcome to the
+    ``<prefix>.sends.{ok,failed,rate_limited}`` counters.
+    """
+
+    def __init__(
+        self,
+        send,
+        render,
+        workers: int = 4,
+        coalesce_window: float = 0.25,
+        channel_rate: int = 5,
+        channel_period: float = 5.0,
+        max_batch: int = 25,
+        on_delivered=None,
+        on_failed=None,
+        metrics=None,
+        metrics_prefix: str = "notify",
+    ):
+        self._send = send
+        self._render = render
+        self.workers = max(1, int(workers))
+        self.coalesce_window = max(0.0, float(coalesce_window))
+        self.channel_rate = max(1, int(channel_rate))
+        self.channel_period = float(channel_period)
+        self.max_batch = max(1, int(max_batch))
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self.metrics = metrics
+        self.metrics_prefix = metrics_prefix
+        self._pending = {}
+        self._scheduled = set()
+        self._sent = {}
+        self._ready = None
+        self._tasks = []
+
+    @property
+    def pending(self) -> int:
+        """Items queued but not yet handed to ``send``."""
+        return sum(len(items) for items in self._pending.values())
+
+    def start(self):
+        """Start the workers on the running loop; calling it again is a no-op."""
+        if self._tasks:
+            return
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, channel_id, item):
+        self._pending.setdefault(channel_id, []).append(item)
+        if channel_id not in self._scheduled:
+            self._scheduled.add(channel_id)
+            self._schedule(channel_id, self.coalesce_window)
+
+    def _schedule(self, channel_id, delay):
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, channel_id)
+        else:
+            self._ready.put_nowait(channel_id)
+
+    def _rate_delay(self, channel_id, now):
+        sent = self._sent.get(channel_id)
+        if sent is None or len(sent) < self.channel_rate:
+            return 0.0
+        return max(0.0, sent[0] + self.channel_period - now)
+
+    def _record_send(self, channel_id, now):
+        sent = self._sent.get(channel_id)
+        if sent is None:
+            sent = self._sent[channel_id] = collections.deque(maxlen=self.channel_rate)
+        sent.append(now)
+
+    async def _worker(self):
+        while True:
+            channel_id = await self._ready.get()
+            delay = self._rate_delay(channel_id, time.monotonic())
+            if delay > 0:
+                self._schedule(channel_id, delay)
+                continue
+            items = self._pending.pop(channel_id, [])
+            if len(items) > self.max_batch:
+                self._pending[channel_id] = items[self.max_batch:]
+                items = items[: self.max_batch]
+            retry = await self._deliver(channel_id, items) if items else None
+            if retry is not None:
+                retry_after, unsent = retry
+                self._pending[channel_id] = unsent + self._pending.get(channel_id, [])
+                self._schedule(channel_id, retry_after)
+            elif self._pending.get(channel_id):
+                self._schedule(channel_id, self.coalesce_window)
+            else:
+                self._scheduled.discard(channel_id)
+                sent = self._sent.get(channel_id)
+                if sent and sent[-1] + self.channel_period < time.monotonic():
+                    del self._sent[channel_id]
+
+    async def _deliver(self, channel_id, items):
+        """Send one batch, settling each message as it goes.
+
+        Returns ``(retry_after, unsent_items)`` when rate limited, else None.
+        """
+        try:
+            messages = list(self._render(channel_id, items))
+        except Exception as e:
+            print(f"❌ Error rendering {len(items)} notification(s) for channel {channel_id}: {e}")
+            await self._settle(self.on_failed, channel_id, items, e)
+            return None
+        for index, (content, covered) in enumerate(messages):
+            started = time.monotonic()
+            self._record_send(channel_id, started)
+            try:
+                await self._send(channel_id, content)
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is None and getattr(e, "status", None) == 429:
+                    retry_after = self.channel_period
+                self._observe(started, "rate_limited" if retry_after is not None else "failed")
+                if retry_after is not None:
+                    print(f"⏳ Rate limited sending to channel {channel_id}; retrying in {float(retry_after):.1f}s")
+                    return float(retry_after), [item for _, rest in messages[index:] for item in rest]
+                print(f"❌ Error sending {len(covered)} notification(s) to channel {channel_id}: {e}")
+                await self._settle(self.on_failed, channel_id, covered, e)
+                continue
+            self._observe(started, "ok")
+            await self._settle(self.on_delivered, channel_id, covered)
+        return None
+
+    def _observe(self, started, outcome):
+        if self.metrics is not None:
+            self.metrics.histogram(f"{self.metrics_prefix}.send.latency").observe(time.monotonic() - started)
+            self.metrics.counter(f"{self.metrics_prefix}.sends.{outcome}").inc()
+
+    @staticmethod
+    async def _settle(callback, *args):
+        if callback is None:
+            return
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"❌ Error recording notification outcome: {e}")
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from d1_client import RetryPolicy
+from db_executor import DatabaseExecutor
+from sqlite_connections import SQLiteConnectionManager
+
+
+class NotificationOutbox:
+    """Durable queue of ready notifications waiting to be delivered.
+
+    Expired cooldowns are written here with :meth:`enqueue` before they are
+    marked notified, so a crash at any point leaves the reminder either still
+    due in the cooldown store or queued here: delivery is at-least-once. The
+    drain task started with :meth:`start` claims due rows oldest first in
+    batches of ``batch_size`` and passes them to ``deliver(rows)``; the caller
+    reports each outcome with :meth:`ack` (row deleted) or :meth:`fail`
+    (retried after ``retry`` backoff, dropped after ``max_attempts``). At most
+    ``max_in_flight`` claimed rows await an outcome at any time.
+
+    A claimed row is hidden for ``lease`` seconds, and the drain task renews
+    the lease of every row still awaiting an outcome every ``lease / 2``
+    seconds, however long the consumer holds it (a rate-limited channel can
+    keep rows queued for minutes). Leases therefore only lapse when the
+    process dies, and everything still queued at startup is due immediately.
+
+    SQLite calls run on the outbox's own ``DatabaseExecutor`` threads, so the
+    queue methods are coroutines and never block the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retry: RetryPolicy = None,
+        batch_size: int = 100,
+        lease: float = 60.0,
+        max_attempts: int = 10,
+        max_in_flight: int = 2000,
+        clock=time.time,
+    ):
+        self._db = SQLiteConnectionManager(path)
+        self._executor = DatabaseExecutor(self._connect, readers=1)
+        self.retry = retry or RetryPolicy(base_delay=2.0, max_delay=300.0)
+        self.batch_size = max(1, int(batch_size))
+        self.lease = float(lease)
+        self.max_attempts = max(1, int(max_attempts))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._in_flight = set()
+        self._renewed_at = 0.0
+        self._clock = clock
+        self._backlog = None
+        self._schema_lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+
+    def _connect(self):
+        conn = self._db.connect()
+        with self._schema_lock:
+            if self._backlog is None:
+                with conn:
+                    conn.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS notification_outbox (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            channel_id INTEGER NOT NULL,
+                            user_id INTEGER NOT NULL,
+                            command TEXT NOT NULL,
+                            expires_at REAL NOT NULL,
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            available_at REAL NOT NULL,
+                            UNIQUE (user_id, command, expires_at)
+                        )
+                        """
+                    )
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_notification_outbox_available_at "
+                        "ON notification_outbox (available_at)"
+                    )
+                    # Leases held by a previous process are void.
+                    conn.execute("UPDATE notification_outbox SET available_at = 0")
+                self._backlog = conn.execute("SELECT COUNT(*) FROM notification_outbox").fetchone()[0]
+        return conn
+
+    @property
+    def pending(self) -> int:
+        """Notifications queued or in flight (0 until the outbox is first used)."""
+        return self._backlog or 0
+
+    async def enqueue(self, notifications, available_at: float = None):
+        """Queue ``(channel_id, user_id, command, expires_at)`` tuples; returns their row ids.
+
+        Rows become claimable at ``available_at`` (default: now). A notification
+        already queued keeps its existing row.
+        """
+        notifications = [(int(c), int(u), cmd, float(e)) for c, u, cmd, e in notifications]
+        if not notifications:
+            return []
+        available_at = self._clock() if available_at is None else available_at
+        ids, added = await self._executor.write(_insert, notifications, available_at)
+        self._backlog += added
+        self.wake()
+        return ids
+
+    async def claim(self, limit: int = None):
+        """Lease and return up to ``limit`` due rows, oldest first."""
+        now = self._clock()
+        rows = await self._executor.write(_claim, now, now + self.lease, limit or self.batch_size)
+        self._in_flight.update(row["id"] for row in rows)
+        return rows
+
+    async def ack(self, ids):
+        """Delete delivered (or deliberately abandoned) notifications."""
+        ids = [int(i) for i in ids]
+        if ids:
+            deleted = await self._executor.write(_delete, ids)
+            self._backlog -= deleted
+            self._in_flight.difference_update(ids)
+            self.wake()
+
+    async def fail(self, ids):
+        """Schedule a retry with backoff; rows out of attempts are dropped and counted."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        self._in_flight.difference_update(ids)
+        # One jitter draw per call: rows that failed together retry together.
+        dropped = await self._executor.write(
+            _retry_or_drop,
+            ids,
+            self.max_attempts,
+            self._clock(),
+            random.random(),
+            self.retry.base_delay,
+            self.retry.max_delay,
+        )
+        self._backlog -= dropped
+        if dropped:
+            print(f"❌ Dropped {dropped} notification(s) after {self.max_attempts} failed attempt(s)")
+        self.wake()
+        return dropped
+
+    async def next_available(self):
+        return await self._executor.read(_next_available)
+
+    async def renew(self):
+        """Push the lease of every claimed row still awaiting an outcome to now + ``lease``."""
+        now = self._clock()
+        self._renewed_at = now
+        if self._in_flight:
+            await self._executor.write(_extend, list(self._in_flight), now + self.lease)
+
+    def start(self, deliver):
+        """Start the drain task on the running loop; calling it again is a no-op."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run(deliver))
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self, deliver):
+        while True:
+            self._wakeup.clear()
+            try:
+                if self._clock() - self._renewed_at >= self.lease / 2:
+                    await self.renew()
+                room = min(self.batch_size, self.max_in_flight - len(self._in_flight))
+                rows = await self.claim(room) if room > 0 else []
+                if rows:
+                    deliver(rows)
+                    if len(rows) == room:
+                        continue
+                # Full: ack() and fail() wake the task as room frees up.
+                next_at = None if room <= 0 else await self.next_available()
+            except Exception as e:
+                print(f"❌ Error draining the notification outbox: {e}")
+                next_at = self._clock() + self.retry.max_delay
+            # Wake at least every half lease to renew the in-flight rows.
+            renew_in = self._renewed_at + self.lease / 2 - self._clock()
+            delay = renew_in if next_at is None else min(renew_in, next_at - self._clock())
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def close(self):
+        self.stop()
+        self._executor.close()
+        self._db.close_all()
+
+
+# Blocking halves of the queue methods; each runs on an executor thread with
+# that thread's connection, writes inside the executor's transaction.
+
+def _insert(conn, notifications, available_at):
+    changes = conn.total_changes
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO notification_outbox (channel_id, user_id, command, expires_at, available_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [(c, u, cmd, e, available_at) for c, u, cmd, e in notifications],
+    )
+    added = conn.total_changes - changes
+    ids = [
+        conn.execute(
+            "SELECT id FROM notification_outbox WHERE user_id = ? AND command = ? AND expires_at = ?",
+            (u, cmd, e),
+        ).fetchone()[0]
+        for _, u, cmd, e in notifications
+    ]
+    return ids, added
+
+
+def _claim(conn, now, lease_until, limit):
+    rows = conn.execute(
+        """
+        SELECT id, channel_id, user_id, command, expires_at, attempts
+        FROM notification_outbox
+        WHERE available_at <= ?
+        ORDER BY id
+        LIMIT ?
+        """,
+        (now, limit),
+    ).fetchall()
+    if rows:
+        conn.execute(
+            "UPDATE notification_outbox SET available_at = ? WHERE id IN (SELECT value FROM json_each(?))",
+            (lease_until, json.dumps([row["id"] for row in rows])),
+        )
+    return rows
+
+
+def _delete(conn, ids):
+    return conn.execute(
+        "DELETE FROM notification_outbox WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(ids),),
+    ).rowcount
+
+
+def _retry_or_drop(conn, ids, max_attempts, now, jitter, base_delay, max_delay):
+    ids = json.dumps(ids)
+    dropped = conn.execute(
+        "DELETE FROM notification_outbox WHERE id IN (SELECT value FROM json_each(?)) AND attempts + 1 >= ?",
+        (ids, max_attempts),
+    ).rowcount
+    # RetryPolicy.delay(attempts) in SQL: full jitter over min(max, base * 2**attempts).
+    conn.execute(
+        """
+        UPDATE notification_outbox
+        SET attempts = attempts + 1,
+            available_at = ? + ? * MIN(?, ? * (1 << MIN(attempts + 1, 40)))
+        WHERE id IN (SELECT value FROM json_each(?))
+        """,
+        (now, jitter, max_delay, base_delay, ids),
+    )
+    return dropped
+
+
+def _extend(conn, ids, lease_until):
+    conn.execute(
+        "UPDATE notification_outbox SET available_at = MAX(available_at, ?) WHERE id IN (SELECT value FROM json_each(?))",
+        (lease_until, json.dumps(ids)),
+    )
+
+
+def _next_available(conn):
+    return conn.execute("SELECT MIN(available_at) FROM notification_outbox").fetchone()[0]
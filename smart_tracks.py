@@ -0,0 +1,104 @@
+import heapq
+import itertools
+import time
+
+
+class PendingTrackRegistry:
+    """Smart-track waits (``n m``, ``n d``...) waiting for Naruto Botto's reply.
+
+    A track is a dict with at least ``channel_id``, keyed by
+    ``(user_id, command)``; a user has at most one track per command. Tracks
+    are also indexed by channel and by ``(channel_id, command)``, so a reply in
+    a channel finds its waiter without looking at other channels.
+
+    Each track expires ``ttl`` seconds after it is added. Expiry is lazy: an
+    expiry heap is drained on every access, so stale tracks go away without a
+    periodic scan, and removed or replaced tracks leave heap entries that are
+    skipped.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._by_user = {}
+        self._by_channel = {}
+        self._by_channel_command = {}
+        self._expiry = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        self._expire()
+        return sum(len(commands) for commands in self._by_user.values())
+
+    def __bool__(self):
+        self._expire()
+        return bool(self._by_user)
+
+    def _expire(self):
+        now = self._clock()
+        heap = self._expiry
+        while heap and heap[0][0] <= now:
+            _, _, user_id, command, track = heapq.heappop(heap)
+            if self._by_user.get(user_id, {}).get(command) is track:
+                self._unlink(user_id, command, track)
+
+    def _unlink(self, user_id, command, track):
+        commands = self._by_user[user_id]
+        del commands[command]
+        if not commands:
+            del self._by_user[user_id]
+        channel_id = track["channel_id"]
+        waiters = self._by_channel[channel_id]
+        del waiters[(user_id, command)]
+        if not waiters:
+            del self._by_channel[channel_id]
+        users = self._by_channel_command[(channel_id, command)]
+        del users[user_id]
+        if not users:
+            del self._by_channel_command[(channel_id, command)]
+
+    def add(self, user_id: int, command: str, channel_id: int, ttl: float, **fields):
+        """Register (or replace) the user's track for ``command`` and return it."""
+        self._expire()
+        previous = self._by_user.get(user_id, {}).get(command)
+        if previous is not None:
+            self._unlink(user_id, command, previous)
+        track = {"channel_id": channel_id, **fields}
+        self._by_user.setdefault(user_id, {})[command] = track
+        self._by_channel.setdefault(channel_id, {})[(user_id, command)] = track
+        self._by_channel_command.setdefault((channel_id, command), {})[user_id] = track
+        heapq.heappush(self._expiry, (self._clock() + ttl, next(self._sequence), user_id, command, track))
+        return track
+
+    def get(self, user_id: int, command: str):
+        self._expire()
+        return self._by_user.get(user_id, {}).get(command)
+
+    def has(self, user_id: int, command: str) -> bool:
+        return self.get(user_id, command) is not None
+
+    def remove(self, user_id: int, command: str, track=None):
+        """Drop the user's track for ``command`` (only if it is ``track``, when given)."""
+        self._expire()
+        current = self._by_user.get(user_id, {}).get(command)
+        if current is None or (track is not None and current is not track):
+            return None
+        self._unlink(user_id, command, current)
+        return current
+
+    def match(self, channel_id: int, command: str = None):
+        """Oldest waiter in ``channel_id`` a Naruto Botto reply belongs to.
+
+        A waiter for ``command`` (the command named in the reply) wins;
+        otherwise the oldest waiter whose user has only one track pending.
+        Returns ``(user_id, command, track)`` or None.
+        """
+        self._expire()
+        if command is not None:
+            users = self._by_channel_command.get((channel_id, command))
+            if users:
+                user_id, track = next(iter(users.items()))
+                return user_id, command, track
+        for (user_id, waiting_command), track in self._by_channel.get(channel_id, {}).items():
+            if len(self._by_user[user_id]) == 1:
+                return user_id, waiting_command, track
+        return None
@@ -0,0 +1,913 @@
+import abc
+import hashlib
+import heapq
+import itertools
+import re
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple, TypedDict
+
+from d1_client import D1Client, D1Connection
+
+
+class CooldownRow(TypedDict):
+    user_id: int
+    command: str
+    expires_at: float
+    channel_id: Optional[int]
+    guild_id: Optional[int]
+    notified: bool
+
+
+class QuizEntry(TypedDict):
+    question_key: str
+    question_text: str
+    options_text: str
+    answer_index: int
+    answer_text: str
+    provider: Optional[str]
+    created_at: float
+    updated_at: float
+
+
+class QuizCandidate(TypedDict):
+    id: int
+    question_key: str
+    question_text: str
+    options_text: str
+    answer_index: int
+    answer_text: str
+    provider: Optional[str]
+    seen_count: int
+    first_seen_at: float
+    last_seen_at: float
+
+
+class QuizCandidateGroup(TypedDict):
+    question_key: str
+    question_text: str
+    options_text: str
+    candidate_count: int
+    last_seen_at: float
+
+
+def normalize_quiz_text(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9]+", " ", text.lower())).strip()
+
+
+def quiz_question_key(question_text: str) -> str:
+    return hashlib.sha256(normalize_quiz_text(question_text).encode("utf-8")).hexdigest()
+
+
+def _create_base_schema(connect):
+    with connect() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cooldowns (
+                user_id INTEGER NOT NULL,
+                command TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                channel_id INTEGER,
+                notified INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, command)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cooldowns_expires_at ON cooldowns(expires_at)"
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_cache (
+                question_key TEXT PRIMARY KEY,
+                question_text TEXT NOT NULL,
+                options_text TEXT NOT NULL,
+                answer_index INTEGER NOT NULL,
+                answer_text TEXT NOT NULL,
+                provider TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quiz_review_candidates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question_key TEXT NOT NULL,
+                question_text TEXT NOT NULL,
+                options_text TEXT NOT NULL,
+                answer_index INTEGER NOT NULL,
+                answer_text TEXT NOT NULL,
+                provider TEXT,
+                seen_count INTEGER NOT NULL DEFAULT 1,
+                first_seen_at REAL NOT NULL,
+                last_seen_at REAL NOT NULL,
+                UNIQUE(question_key, provider, answer_index)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quiz_review_candidates_last_seen ON quiz_review_candidates(last_seen_at)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_quiz_review_candidates_question_key ON quiz_review_candidates(question_key)"
+        )
+
+def _add_cooldowns_unique_index(connect):
+    _dedupe_cooldowns_table(connect)
+    with connect() as conn:
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_cooldowns_user_command ON cooldowns(user_id, command)"
+        )
+
+def _dedupe_cooldowns_table(connect):
+    with connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT rowid, CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id, notified
+            FROM cooldowns
+            ORDER BY user_id ASC, command ASC, expires_at DESC, rowid DESC
+            """
+        ).fetchall()
+
+        best_rows = {}
+        duplicate_rowids = []
+
+        for row in rows:
+            key = (int(row["user_id"]), str(row["command"]))
+            if key not in best_rows:
+                best_rows[key] = row
+            else:
+                duplicate_rowids.append(int(row["rowid"]))
+
+        if duplicate_rowids:
+            conn.executemany(
+                "DELETE FROM cooldowns WHERE rowid = ?",
+                [(rowid,) for rowid in duplicate_rowids],
+            )
+            print(f"🧹 Deduped {len(duplicate_rowids)} cooldown row(s) in persistent storage", flush=True)
+
+def _migrate_quiz_cache_keys_to_question_only(connect):
+    with connect() as conn:
+        rows = conn.execute(
+            """
+            SELECT question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at
+            FROM quiz_cache
+            ORDER BY updated_at DESC, created_at DESC
+            """
+        ).fetchall()
+
+        if not rows:
+            return
+
+        migrated = {}
+        for row in rows:
+            new_key = quiz_question_key(row["question_text"])
+            if new_key in migrated:
+                continue
+            migrated[new_key] = row
+
+        if len(migrated) == len(rows) and all(row["question_key"] == quiz_question_key(row["question_text"]) for row in rows):
+            return
+
+        conn.execute("DELETE FROM quiz_cache")
+        for new_key, row in migrated.items():
+            conn.execute(
+                """
+                INSERT INTO quiz_cache (
+                    question_key, question_text, options_text, answer_index, answer_text,
+                    provider, created_at, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    new_key,
+                    row["question_text"],
+                    row["options_text"],
+                    row["answer_index"],
+                    row["answer_text"],
+                    row["provider"],
+                    row["created_at"],
+                    row["updated_at"],
+                ),
+            )
+
+def _add_cooldowns_guild_partition(connect):
+    with connect() as conn:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(cooldowns)").fetchall()}
+        if "guild_id" not in columns:
+            conn.execute("ALTER TABLE cooldowns ADD COLUMN guild_id INTEGER")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cooldowns_guild_expires_at ON cooldowns(guild_id, expires_at)"
+        )
+
+def _normalize_missing_values(connect):
+    # D1 params used to be sent as strings, so NULLs written through D1 were
+    # stored as "". Candidates key on provider, and NULLs never conflict in a
+    # UNIQUE index, so a missing provider is stored as "" everywhere instead.
+    with connect() as conn:
+        conn.execute("UPDATE cooldowns SET channel_id = NULL WHERE channel_id = ''")
+        conn.execute("UPDATE cooldowns SET guild_id = NULL WHERE guild_id = ''")
+        conn.execute("UPDATE OR IGNORE quiz_review_candidates SET provider = '' WHERE provider IS NULL")
+        # Whatever is left duplicates a candidate that already has provider "".
+        conn.execute("DELETE FROM quiz_review_candidates WHERE provider IS NULL")
+
+# Ordered (version, description, migration). Append new entries; never renumber.
+SCHEMA_MIGRATIONS = [
+    (1, "create cooldown and quiz cache tables", _create_base_schema),
+    (2, "dedupe cooldowns and add unique (user_id, command) index", _add_cooldowns_unique_index),
+    (3, "re-key quiz_cache by normalized question text", _migrate_quiz_cache_keys_to_question_only),
+    (4, "add cooldowns.guild_id with (guild_id, expires_at) index", _add_cooldowns_guild_partition),
+    (5, "store missing cooldown ids as NULL and missing candidate providers as ''", _normalize_missing_values),
+]
+
+
+def _applied_schema_versions(connect):
+    with connect() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at REAL NOT NULL
+            )
+            """
+        )
+    with connect() as conn:
+        rows = conn.execute("SELECT version FROM schema_version").fetchall()
+    return {int(row["version"]) for row in rows}
+
+
+def apply_schema_migrations(connect, label=""):
+    """Run every migration in ``SCHEMA_MIGRATIONS`` not yet recorded in ``schema_version``."""
+    applied = _applied_schema_versions(connect)
+    for version, description, migration in SCHEMA_MIGRATIONS:
+        if version in applied:
+            continue
+        migration(connect)
+        with connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, time.time()),
+            )
+        print(f"🗄️ Applied {label}schema migration {version}: {description}", flush=True)
+
+
+_COOLDOWN_COLUMNS = """
+    CAST(user_id AS TEXT) AS user_id, command, expires_at, CAST(channel_id AS TEXT) AS channel_id,
+    CAST(guild_id AS TEXT) AS guild_id, notified
+"""
+_QUIZ_COLUMNS = "question_key, question_text, options_text, answer_index, answer_text, provider, created_at, updated_at"
+_CANDIDATE_COLUMNS = (
+    "id, question_key, question_text, options_text, answer_index, answer_text, provider, seen_count, "
+    "first_seen_at, last_seen_at"
+)
+
+
+def _optional_id(value):
+    # Writes spooled before migration 5 may still replay "" for NULL on D1.
+    return int(value) if value not in (None, "") else None
+
+
+def _cooldown_row(row) -> CooldownRow:
+    return {
+        "user_id": int(row["user_id"]),
+        "command": str(row["command"]),
+        "expires_at": float(row["expires_at"]),
+        "channel_id": _optional_id(row["channel_id"]),
+        "guild_id": _optional_id(row["guild_id"]),
+        "notified": bool(int(row["notified"])),
+    }
+
+
+def _cooldown_params(row: CooldownRow):
+    return (
+        int(row["user_id"]),
+        row["command"],
+        row["expires_at"],
+        row["channel_id"],
+        row["guild_id"],
+        1 if row["notified"] else 0,
+    )
+
+
+class StorageBackend(abc.ABC):
+    """Persistence for cooldowns, the quiz cache and quiz review candidates.
+
+    Methods are blocking and take the connection from :meth:`connect` as their
+    first argument, so they plug straight into ``DatabaseExecutor``:
+    ``await db.read(storage.user_cooldowns, user_id)``. Writes passed to
+    ``db.write`` share the executor's group-commit transaction. Rows come back
+    as plain dicts shaped like the ``TypedDict``s above, whatever the backend.
+    Every method except :meth:`migrate` is abstract, so a backend missing one
+    fails when it is created.
+    """
+
+    @abc.abstractmethod
+    def connect(self):
+        raise NotImplementedError
+
+    def migrate(self, label: str = ""):
+        """Bring the backend's schema up to date."""
+
+    # Cooldowns
+
+    @abc.abstractmethod
+    def load_cooldowns(self, conn) -> List[CooldownRow]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def user_cooldowns(self, conn, user_id: int) -> List[CooldownRow]:
+        """One user's cooldowns, soonest expiry first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def guild_cooldowns(self, conn, guild_id: int) -> List[CooldownRow]:
+        """One server's cooldowns, soonest expiry first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def expired_cooldowns(self, conn, now: float, limit: int = 1000) -> List[CooldownRow]:
+        """Up to ``limit`` cooldowns that expired by ``now`` without a notification, oldest first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upsert_cooldowns(self, conn, rows: Iterable[CooldownRow]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_cooldowns(self, conn, keys: Iterable[Tuple[int, str]]):
+        """Delete ``(user_id, command)`` pairs; missing pairs are ignored."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def replace_cooldowns(self, conn, rows: Iterable[CooldownRow]):
+        """Replace every stored cooldown with ``rows``."""
+        raise NotImplementedError
+
+    # Quiz cache
+
+    @abc.abstractmethod
+    def quiz_lookup(self, conn, question_key: str) -> Optional[QuizEntry]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def quiz_store(
+        self, conn, question_key: str, question_text: str, options_text: str,
+        answer_index: int, answer_text: str, provider: Optional[str], now: float,
+    ):
+        """Save a permanent answer and drop the question's review candidates (promotion)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def quiz_update(self, conn, question_key: str, answer_index: int, answer_text: str, provider: Optional[str], now: float):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def quiz_list(self, conn, limit: int, offset: int = 0) -> List[QuizEntry]:
+        """A page of permanent answers, most recently updated first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def quiz_count(self, conn) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def quiz_search(self, conn, ref: str) -> List[QuizEntry]:
+        """Entries whose key starts with ``ref`` (8+ characters), else whose text contains it."""
+        raise NotImplementedError
+
+    # Review candidates
+
+    @abc.abstractmethod
+    def candidate_store(
+        self, conn, question_key: str, question_text: str, options_text: str,
+        answer_index: int, answer_text: str, provider: Optional[str], now: float,
+    ):
+        """Record a provider's answer; seeing the same answer again bumps ``seen_count``."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def candidate_latest(self, conn, question_key: str) -> Optional[QuizCandidate]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def candidate_get(self, conn, candidate_id: int) -> Optional[QuizCandidate]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def candidates_for_key(self, conn, question_key: str) -> List[QuizCandidate]:
+        """A question's candidates, most recently seen first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def candidates_by_key_prefix(self, conn, prefix: str) -> List[QuizCandidate]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def candidate_groups(self, conn, limit: int) -> List[QuizCandidateGroup]:
+        """Questions with pending candidates, most recently seen first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_candidates_for_key(self, conn, question_key: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_candidate(self, conn, candidate_id: int):
+        raise NotImplementedError
+
+
+class SQLiteStorage(StorageBackend):
+    """SQL backend over any sqlite3-style connection factory.
+
+    ``connect`` can hand out local SQLite connections, D1 replica connections
+    or anything else that speaks the same SQL dialect.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+
+    def connect(self):
+        return self._connect()
+
+    def migrate(self, label: str = ""):
+        apply_schema_migrations(self._connect, label)
+
+    def load_cooldowns(self, conn):
+        return [_cooldown_row(row) for row in conn.execute(f"SELECT {_COOLDOWN_COLUMNS} FROM cooldowns").fetchall()]
+
+    def user_cooldowns(self, conn, user_id):
+        rows = conn.execute(
+            f"SELECT {_COOLDOWN_COLUMNS} FROM cooldowns WHERE user_id = ? ORDER BY expires_at ASC",
+            (int(user_id),),
+        ).fetchall()
+        return [_cooldown_row(row) for row in rows]
+
+    def guild_cooldowns(self, conn, guild_id):
+        rows = conn.execute(
+            f"SELECT {_COOLDOWN_COLUMNS} FROM cooldowns WHERE guild_id = ? ORDER BY expires_at ASC",
+            (int(guild_id),),
+        ).fetchall()
+        return [_cooldown_row(row) for row in rows]
+
+    def expired_cooldowns(self, conn, now, limit=1000):
+        rows = conn.execute(
+            f"""
+            SELECT {_COOLDOWN_COLUMNS} FROM cooldowns
+            WHERE expires_at <= ? AND notified = 0
+            ORDER BY expires_at ASC
+            LIMIT ?
+            """,
+            (now, int(limit)),
+        ).fetchall()
+        return [_cooldown_row(row) for row in rows]
+
+    def upsert_cooldowns(self, conn, rows):
+        params = [_cooldown_params(row) for row in rows]
+        if params:
+            conn.executemany(
+                """
+                INSERT INTO cooldowns (user_id, command, expires_at, channel_id, guild_id, notified)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, command) DO UPDATE SET
+                    expires_at=excluded.expires_at,
+                    channel_id=excluded.channel_id,
+                    guild_id=excluded.guild_id,
+                    notified=excluded.notified
+                """,
+                params,
+            )
+
+    def delete_cooldowns(self, conn, keys):
+        params = [(int(user_id), command) for user_id, command in keys]
+        if params:
+            conn.executemany("DELETE FROM cooldowns WHERE user_id = ? AND command = ?", params)
+
+    def replace_cooldowns(self, conn, rows):
+        conn.execute("DELETE FROM cooldowns")
+        self.upsert_cooldowns(conn, rows)
+
+    def quiz_lookup(self, conn, question_key):
+        row = conn.execute(f"SELECT {_QUIZ_COLUMNS} FROM quiz_cache WHERE question_key = ?", (question_key,)).fetchone()
+        return dict(row) if row else None
+
+    def quiz_store(self, conn, question_key, question_text, options_text, answer_index, answer_text, provider, now):
+        conn.execute(
+            """
+            INSERT INTO quiz_cache (
+                question_key, question_text, options_text, answer_index, answer_text,
+                provider, created_at, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(question_key) DO UPDATE SET
+                question_text=excluded.question_text,
+                options_text=excluded.options_text,
+                answer_index=excluded.answer_index,
+                answer_text=excluded.answer_text,
+                provider=excluded.provider,
+                updated_at=excluded.updated_at
+            """,
+            (question_key, question_text, options_text, int(answer_index), answer_text, provider, now, now),
+        )
+        conn.execute("DELETE FROM quiz_review_candidates WHERE question_key = ?", (question_key,))
+
+    def quiz_update(self, conn, question_key, answer_index, answer_text, provider, now):
+        conn.execute(
+            """
+            UPDATE quiz_cache
+            SET answer_index = ?, answer_text = ?, provider = ?, updated_at = ?
+            WHERE question_key = ?
+            """,
+            (int(answer_index), answer_text, provider, now, question_key),
+        )
+
+    def quiz_list(self, conn, limit, offset=0):
+        rows = conn.execute(
+            f"SELECT {_QUIZ_COLUMNS} FROM quiz_cache ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+            (int(limit), int(offset)),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def quiz_count(self, conn):
+        row = conn.execute("SELECT COUNT(*) AS total FROM quiz_cache").fetchone()
+        return int(row["total"]) if row else 0
+
+    def quiz_search(self, conn, ref):
+        rows = []
+        if len(ref) >= 8:
+            rows = conn.execute(
+                f"SELECT {_QUIZ_COLUMNS} FROM quiz_cache WHERE question_key LIKE ? ORDER BY updated_at DESC",
+                (f"{ref}%",),
+            ).fetchall()
+        if not rows:
+            rows = conn.execute(
+                f"SELECT {_QUIZ_COLUMNS} FROM quiz_cache WHERE LOWER(question_text) LIKE ? ORDER BY updated_at DESC",
+                (f"%{normalize_quiz_text(ref)}%",),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def candidate_store(self, conn, question_key, question_text, options_text, answer_index, answer_text, provider, now):
+        conn.execute(
+            """
+            INSERT INTO quiz_review_candidates (
+                question_key, question_text, options_text, answer_index, answer_text,
+                provider, seen_count, first_seen_at, last_seen_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT(question_key, provider, answer_index) DO UPDATE SET
+                question_text=excluded.question_text,
+                options_text=excluded.options_text,
+                answer_text=excluded.answer_text,
+                seen_count=quiz_review_candidates.seen_count + 1,
+                last_seen_at=excluded.last_seen_at
+            """,
+            (question_key, question_text, options_text, int(answer_index), answer_text, provider or "", now, now),
+        )
+
+    def candidate_latest(self, conn, question_key):
+        row = conn.execute(
+            f"""
+            SELECT {_CANDIDATE_COLUMNS} FROM quiz_review_candidates
+            WHERE question_key = ?
+            ORDER BY last_seen_at DESC, id DESC
+            LIMIT 1
+            """,
+            (question_key,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def candidate_get(self, conn, candidate_id):
+        row = conn.execute(
+            f"SELECT {_CANDIDATE_COLUMNS} FROM quiz_review_candidates WHERE id = ?",
+            (int(candidate_id),),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def candidates_for_key(self, conn, question_key):
+        rows = conn.execute(
+            f"""
+            SELECT {_CANDIDATE_COLUMNS} FROM quiz_review_candidates
+            WHERE question_key = ?
+            ORDER BY last_seen_at DESC, id DESC
+            """,
+            (question_key,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def candidates_by_key_prefix(self, conn, prefix):
+        rows = conn.execute(
+            f"""
+            SELECT {_CANDIDATE_COLUMNS} FROM quiz_review_candidates
+            WHERE question_key LIKE ?
+            ORDER BY last_seen_at DESC, id DESC
+            """,
+            (f"{prefix}%",),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def candidate_groups(self, conn, limit):
+        rows = conn.execute(
+            """
+            SELECT question_key, question_text, options_text, COUNT(*) AS candidate_count, MAX(last_seen_at) AS last_seen_at
+            FROM quiz_review_candidates
+            GROUP BY question_key, question_text, options_text
+            ORDER BY last_seen_at DESC
+            LIMIT ?
+            """,
+            (int(limit),),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_candidates_for_key(self, conn, question_key):
+        conn.execute("DELETE FROM quiz_review_candidates WHERE question_key = ?", (question_key,))
+
+    def delete_candidate(self, conn, candidate_id):
+        # Delete by the natural key, not the id: replica writes are replayed on
+        # D1 verbatim, and D1's AUTOINCREMENT ids can drift from the replica's.
+        row = conn.execute(
+            "SELECT question_key, provider, answer_index FROM quiz_review_candidates WHERE id = ?",
+            (int(candidate_id),),
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute(
+            "DELETE FROM quiz_review_candidates WHERE question_key = ? AND provider = ? AND answer_index = ?",
+            (row["question_key"], row["provider"], int(row["answer_index"])),
+        )
+
+
+class D1Storage(SQLiteStorage):
+    """:class:`SQLiteStorage` talking to Cloudflare D1 through ``client``.
+
+    ``send_writes`` is passed to each :class:`D1Connection` and receives every
+    committed write transaction (see there).
+    """
+
+    def __init__(self, client: D1Client, send_writes=None):
+        super().__init__(lambda: D1Connection(client, send_writes))
+        self.client = client
+
+
+class _MemoryConnection:
+    """Stand-in connection for :class:`MemoryStorage`; transactions are no-ops."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryStorage(StorageBackend):
+    """Process-local backend; nothing survives a restart.
+
+    Every method holds one lock, so executor threads can share it. There is
+    no rollback: a write that raises halfway keeps what it already changed.
+
+    Cooldowns are indexed by user and by guild, and unnotified ones are also
+    queued on an expiry min-heap, so per-user, per-guild and expiry queries
+    never scan the whole table. Replaced, deleted or notified rows leave stale
+    heap entries behind; they are skipped when they surface.
+    """
+
+    def __init__(self):
+        self._cooldowns = {}
+        self._by_user = {}
+        self._by_guild = {}
+        self._expiry = []
+        self._quiz = {}
+        self._candidates = {}
+        self._candidates_by_key = {}
+        self._candidate_ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def connect(self):
+        return _MemoryConnection()
+
+    def load_cooldowns(self, conn):
+        with self._lock:
+            return [dict(row) for row in self._cooldowns.values()]
+
+    def _sorted_cooldowns(self, keys):
+        with self._lock:
+            rows = [dict(self._cooldowns[key]) for key in keys]
+        rows.sort(key=lambda row: row["expires_at"])
+        return rows
+
+    def user_cooldowns(self, conn, user_id):
+        with self._lock:
+            return self._sorted_cooldowns(self._by_user.get(int(user_id), ()))
+
+    def guild_cooldowns(self, conn, guild_id):
+        with self._lock:
+            return self._sorted_cooldowns(self._by_guild.get(int(guild_id), ()))
+
+    def _is_due_entry(self, entry):
+        expires_at, user_id, command = entry
+        row = self._cooldowns.get((user_id, command))
+        return row is not None and row["expires_at"] == expires_at and not row["notified"]
+
+    def expired_cooldowns(self, conn, now, limit=1000):
+        with self._lock:
+            heap = self._expiry
+            live = []
+            while heap and heap[0][0] <= now and len(live) < int(limit):
+                entry = heapq.heappop(heap)
+                # A row upserted twice unchanged can be queued twice; keep one entry.
+                if self._is_due_entry(entry) and (not live or live[-1] != entry):
+                    live.append(entry)
+            for entry in live:
+                heapq.heappush(heap, entry)
+            return [dict(self._cooldowns[(user_id, command)]) for _, user_id, command in live]
+
+    def _unlink_cooldown(self, key):
+        row = self._cooldowns.pop(key, None)
+        if row is None:
+            return
+        for index, index_key in ((self._by_user, row["user_id"]), (self._by_guild, row["guild_id"])):
+            keys = index.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[index_key]
+
+    def upsert_cooldowns(self, conn, rows):
+        with self._lock:
+            for row in rows:
+                row = _cooldown_row(row)
+                key = (row["user_id"], row["command"])
+                previous = self._cooldowns.get(key)
+                self._unlink_cooldown(key)
+                self._cooldowns[key] = row
+                self._by_user.setdefault(row["user_id"], set()).add(key)
+                if row["guild_id"] is not None:
+                    self._by_guild.setdefault(row["guild_id"], set()).add(key)
+                if not row["notified"] and (
+                    previous is None or previous["notified"] or previous["expires_at"] != row["expires_at"]
+                ):
+                    heapq.heappush(self._expiry, (row["expires_at"], row["user_id"], row["command"]))
+            if len(self._expiry) > 2 * len(self._cooldowns) + 1024:
+                self._expiry = [entry for entry in self._expiry if self._is_due_entry(entry)]
+                heapq.heapify(self._expiry)
+
+    def delete_cooldowns(self, conn, keys):
+        with self._lock:
+            for user_id, command in keys:
+                self._unlink_cooldown((int(user_id), command))
+
+    def replace_cooldowns(self, conn, rows):
+        with self._lock:
+            self._cooldowns.clear()
+            self._by_user.clear()
+            self._by_guild.clear()
+            self._expiry = []
+            self.upsert_cooldowns(conn, rows)
+
+    def quiz_lookup(self, conn, question_key):
+        with self._lock:
+            entry = self._quiz.get(question_key)
+            return dict(entry) if entry else None
+
+    def quiz_store(self, conn, question_key, question_text, options_text, answer_index, answer_text, provider, now):
+        with self._lock:
+            existing = self._quiz.get(question_key)
+            self._quiz[question_key] = {
+                "question_key": question_key,
+                "question_text": question_text,
+                "options_text": options_text,
+                "answer_index": int(answer_index),
+                "answer_text": answer_text,
+                "provider": provider,
+                "created_at": existing["created_at"] if existing else now,
+                "updated_at": now,
+            }
+            self.delete_candidates_for_key(conn, question_key)
+
+    def quiz_update(self, conn, question_key, answer_index, answer_text, provider, now):
+        with self._lock:
+            entry = self._quiz.get(question_key)
+            if entry is not None:
+                entry.update(answer_index=int(answer_index), answer_text=answer_text, provider=provider, updated_at=now)
+
+    def _quiz_sorted(self, entries):
+        return sorted((dict(entry) for entry in entries), key=lambda entry: entry["updated_at"], reverse=True)
+
+    def quiz_list(self, conn, limit, offset=0):
+        with self._lock:
+            entries = self._quiz_sorted(self._quiz.values())
+        return entries[int(offset): int(offset) + int(limit)]
+
+    def quiz_count(self, conn):
+        with self._lock:
+            return len(self._quiz)
+
+    def quiz_search(self, conn, ref):
+        with self._lock:
+            rows = []
+            if len(ref) >= 8:
+                prefix = ref.lower()
+                rows = [entry for key, entry in self._quiz.items() if key.startswith(prefix)]
+            if not rows:
+                needle = normalize_quiz_text(ref)
+                rows = [entry for entry in self._quiz.values() if needle in entry["question_text"].lower()]
+            return self._quiz_sorted(rows)
+
+    def candidate_store(self, conn, question_key, question_text, options_text, answer_index, answer_text, provider, now):
+        provider = provider or ""
+        with self._lock:
+            for candidate in self._candidates_by_key.get(question_key, {}).values():
+                if (
+                    candidate["question_key"] == question_key
+                    and candidate["provider"] == provider
+                    and candidate["answer_index"] == int(answer_index)
+                ):
+                    candidate.update(
+                        question_text=question_text,
+                        options_text=options_text,
+                        answer_text=answer_text,
+                        seen_count=candidate["seen_count"] + 1,
+                        last_seen_at=now,
+                    )
+                    return
+            candidate_id = next(self._candidate_ids)
+            self._candidates[candidate_id] = self._candidates_by_key.setdefault(question_key, {})[candidate_id] = {
+                "id": candidate_id,
+                "question_key": question_key,
+                "question_text": question_text,
+                "options_text": options_text,
+                "answer_index": int(answer_index),
+                "answer_text": answer_text,
+                "provider": provider,
+                "seen_count": 1,
+                "first_seen_at": now,
+                "last_seen_at": now,
+            }
+
+    def _candidates_where(self, predicate):
+        with self._lock:
+            rows = [dict(candidate) for candidate in self._candidates.values() if predicate(candidate)]
+        rows.sort(key=lambda row: (row["last_seen_at"], row["id"]), reverse=True)
+        return rows
+
+    def candidate_latest(self, conn, question_key):
+        rows = self.candidates_for_key(conn, question_key)
+        return rows[0] if rows else None
+
+    def candidate_get(self, conn, candidate_id):
+        with self._lock:
+            candidate = self._candidates.get(int(candidate_id))
+            return dict(candidate) if candidate else None
+
+    def candidates_for_key(self, conn, question_key):
+        with self._lock:
+            rows = [dict(candidate) for candidate in self._candidates_by_key.get(question_key, {}).values()]
+        rows.sort(key=lambda row: (row["last_seen_at"], row["id"]), reverse=True)
+        return rows
+
+    def candidates_by_key_prefix(self, conn, prefix):
+        prefix = prefix.lower()
+        return self._candidates_where(lambda candidate: candidate["question_key"].startswith(prefix))
+
+    def candidate_groups(self, conn, limit):
+        groups = {}
+        with self._lock:
+            for candidate in self._candidates.values():
+                key = (candidate["question_key"], candidate["question_text"], candidate["options_text"])
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = {
+                        "question_key": key[0],
+                        "question_text": key[1],
+                        "options_text": key[2],
+                        "candidate_count": 1,
+                        "last_seen_at": candidate["last_seen_at"],
+                    }
+                else:
+                    group["candidate_count"] += 1
+                    group["last_seen_at"] = max(group["last_seen_at"], candidate["last_seen_at"])
+        return sorted(groups.values(), key=lambda group: group["last_seen_at"], reverse=True)[: int(limit)]
+
+    def delete_candidates_for_key(self, conn, question_key):
+        with self._lock:
+            for candidate_id in self._candidates_by_key.pop(question_key, {}):
+                del self._candidates[candidate_id]
+
+    def delete_candidate(self, conn, candidate_id):
+        with self._lock:
+            candidate = self._candidates.pop(int(candidate_id), None)
+            if candidate is not None:
+                same_key = self._candidates_by_key[candidate["question_key"]]
+                del same_key[candidate["id"]]
+                if not same_key:
+                    del self._candidates_by_key[candidate["question_key"]]
@@ -0,0 +1,64 @@
+import asyncio
+import collections
+import time
+
+
+class UserNameCache:
+    """Bounded TTL cache of display names for users missing from the gateway cache.
+
+    ``fetch(user_id)`` is the fallback lookup (a REST call in the bot); its
+    result's ``display_name`` is kept for ``ttl`` seconds, and the least
+    recently used names are dropped beyond ``max_size``. Concurrent lookups of
+    the same user share one fetch, and a failed fetch returns None without
+    being cached.
+    """
+
+    def __init__(self, fetch, max_size: int = 1024, ttl: float = 3600.0, clock=time.monotonic):
+        self._fetch = fetch
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._clock = clock
+        self._names = collections.OrderedDict()
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def get(self, user_id: int):
+        """Cached name for ``user_id``, or None if absent or expired."""
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at <= self._clock():
+            del self._names[user_id]
+            return None
+        self._names.move_to_end(user_id)
+        return name
+
+    def put(self, user_id: int, name: str):
+        self._names[user_id] = (name, self._clock() + self.ttl)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+    async def resolve(self, user_id: int):
+        name = self.get(user_id)
+        if name is not None:
+            return name
+        pending = self._inflight.get(user_id)
+        if pending is None:
+            pending = self._inflight[user_id] = asyncio.ensure_future(self._load(user_id))
+        return await asyncio.shield(pending)
+
+    async def _load(self, user_id: int):
+        try:
+            user = await self._fetch(user_id)
+        except Exception:
+            return None
+        finally:
+            self._inflight.pop(user_id, None)
+        name = getattr(user, "display_name", None)
+        if name is not None:
+            self.put(user_id, name)
+        return name